@@ -1,15 +1,26 @@
 """
 @fileoverview This module initializes the Flask application and its extensions.
 @filepath app.py
+
+Importing this module only configures the app: it has no side effects on the
+database, threads or processes. The entry points (main.py, wsgi.py, asgi.py)
+call create_app() to register the routes and CLI commands, then start the
+per-process workers with start_background_services(). The schema is managed
+by the migrations in migrations/ and applied by init_database() (flask init-db),
+an explicit deployment step that runs before the servers start.
 """
 
 import os
 import logging
+import sqlite3
+import threading
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.orm import DeclarativeBase
 from dotenv import load_dotenv
+from utils.upload_stream import StreamingUploadRequest
 
 # Load environment variables from .env file
 load_dotenv()
@@ -25,6 +36,9 @@ class Base(DeclarativeBase):
 # Initialize Flask app
 app = Flask(__name__)
 
+# Stream uploads to disk (hashing and validating on the fly) instead of spooling
+app.request_class = StreamingUploadRequest
+
 app.config['JSON_AS_ASCII'] = False
 
 # CORS Configuration
@@ -35,26 +49,131 @@ app.config["CORS_RESOURCES"] = {r"/*": {"origins": "*"}}
 
 # Add these lines to configure allowed file extensions and uploads folder
 app.config["ALLOWED_EXTENSIONS"] = {"pdf", "docx"}
-app.config["UPLOAD_FOLDER"] = os.path.join(
+app.config["UPLOAD_FOLDER"] = os.getenv("UPLOAD_FOLDER") or os.path.join(
     os.path.dirname(os.path.abspath(__file__)), "uploads"
 )
 if not os.path.exists(app.config["UPLOAD_FOLDER"]):
     os.makedirs(app.config["UPLOAD_FOLDER"])
 
 # Add these lines to configure the debug directory
-app.config["DEBUG_DIR"] = os.path.join(app.root_path, "debug")
+app.config["DEBUG_DIR"] = os.getenv("DEBUG_DIR") or os.path.join(app.root_path, "debug")
 if not os.path.exists(app.config["DEBUG_DIR"]):
     os.makedirs(app.config["DEBUG_DIR"])
 
+# Configure metrics: /metrics (Prometheus format) and the Server-Timing header
+app.config["METRICS_ENABLED"] = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+app.config["METRICS_SERVER_TIMING"] = os.getenv("METRICS_SERVER_TIMING", "false").lower() == "true"
+
+# Configure the OpenAI request/response trace sink (utils/trace_sink.py).
+# Off by default; when on, ANALYSIS_TRACE_SAMPLE_RATE of the analyses are traced
+app.config["ANALYSIS_TRACE_ENABLED"] = os.getenv("ANALYSIS_TRACE_ENABLED", "false").lower() == "true"
+app.config["ANALYSIS_TRACE_SAMPLE_RATE"] = float(os.getenv("ANALYSIS_TRACE_SAMPLE_RATE", "1.0"))
+app.config["ANALYSIS_TRACE_DIR"] = os.path.join(app.config["DEBUG_DIR"], "traces")
+app.config["ANALYSIS_TRACE_QUEUE_SIZE"] = 1000  # Records buffered before new ones are dropped
+app.config["ANALYSIS_TRACE_MAX_FIELD_CHARS"] = 200000  # Longer prompts are truncated
+app.config["ANALYSIS_TRACE_MAX_FILES"] = 500
+app.config["ANALYSIS_TRACE_MAX_BYTES"] = 200 * 1024 * 1024
+
+# Configure the document extraction process pool (0 extracts in-process)
+app.config["EXTRACTION_POOL_SIZE"] = int(
+    os.getenv("EXTRACTION_POOL_SIZE", str(min(os.cpu_count() or 1, 4)))
+)
+app.config["EXTRACTION_TIMEOUT"] = 120  # Wall-clock seconds per document
+app.config["EXTRACTION_MEMORY_LIMIT_MB"] = int(os.getenv("EXTRACTION_MEMORY_LIMIT_MB", "2048"))
+app.config["EXTRACTION_MAX_TASKS_PER_WORKER"] = 100  # Recycle workers to bound leaks
+app.config["EXTRACTION_PDF_MIN_PAGES_PER_TASK"] = 8  # Smallest page range per worker (pypdf fallback)
+
+# Configure the in-memory extraction cache (content-addressed by file SHA-256)
+app.config["EXTRACTION_CACHE_MAX_BYTES"] = int(
+    os.getenv("EXTRACTION_CACHE_MAX_BYTES", str(64 * 1024 * 1024))
+)
+
+# Configure the compressed store of extracted text (utils/text_blobs.py)
+app.config["TEXT_BLOB_DIR"] = os.getenv("TEXT_BLOB_DIR") or os.path.join(
+    app.root_path, "instance", "text_blobs"
+)
+app.config["TEXT_BLOB_COMPRESSION_LEVEL"] = int(os.getenv("TEXT_BLOB_COMPRESSION_LEVEL", "3"))
+app.config["TEXT_BLOB_MMAP_THRESHOLD"] = 1024 * 1024  # Compressed bytes above which reads mmap
+
+# Configure where uploads and text blobs are stored (utils/storage.py): "local"
+# keeps them in UPLOAD_FOLDER and TEXT_BLOB_DIR, "s3" in an S3-compatible bucket
+# shared by every node, read through a local cache
+app.config["STORAGE_BACKEND"] = os.getenv("STORAGE_BACKEND", "local").lower()
+app.config["STORAGE_S3_BUCKET"] = os.getenv("STORAGE_S3_BUCKET")
+app.config["STORAGE_S3_PREFIX"] = os.getenv("STORAGE_S3_PREFIX", "")
+app.config["STORAGE_S3_ENDPOINT_URL"] = os.getenv("STORAGE_S3_ENDPOINT_URL") or None  # e.g. MinIO
+app.config["STORAGE_S3_REGION"] = os.getenv("STORAGE_S3_REGION", "us-east-1")
+app.config["STORAGE_S3_MAX_CONNECTIONS"] = int(os.getenv("STORAGE_S3_MAX_CONNECTIONS", "32"))
+app.config["STORAGE_CACHE_DIR"] = os.getenv("STORAGE_CACHE_DIR") or os.path.join(
+    app.root_path, "instance", "storage_cache"
+)
+app.config["STORAGE_CACHE_MAX_BYTES"] = int(
+    os.getenv("STORAGE_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024))
+)
+
+# Configure the storage garbage collector (utils/storage_gc.py): unreferenced
+# text blobs and abandoned uploads older than STORAGE_GC_GRACE are deleted
+app.config["STORAGE_GC_INTERVAL"] = int(
+    os.getenv("STORAGE_GC_INTERVAL", "3600")
+)  # Seconds between sweeps by the analysis workers (0 disables them)
+app.config["STORAGE_GC_GRACE"] = int(os.getenv("STORAGE_GC_GRACE", "3600"))
+app.config["STORAGE_GC_BATCH"] = 500  # Files or documents handled per query
+
 # Configure max upload size
 app.config["MAX_CONTENT_LENGTH"] = 20 * 1024 * 1024  # 20MB max file size
 
 
 # Add these lines to configure the OpenAI model parameters
 app.config["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
+app.config["OPENAI_BASE_URL"] = os.getenv("OPENAI_BASE_URL")  # None uses api.openai.com
 app.config["OPENAI_MODEL_NAME"] = "gpt-4o"
 app.config["OPENAI_TEMPERATURE"] = 0.7
 app.config["OPENAI_MAX_TOKENS"] = 4096
+# Deterministic mode forces temperature 0 so cached analyses are reproducible
+app.config["OPENAI_DETERMINISTIC"] = os.getenv("OPENAI_DETERMINISTIC", "false").lower() == "true"
+
+# Configure the resilient OpenAI client layer (utils/openai_client.py)
+app.config["OPENAI_TIMEOUT"] = float(os.getenv("OPENAI_TIMEOUT", "120"))  # Seconds per request
+app.config["OPENAI_MAX_RETRIES"] = int(os.getenv("OPENAI_MAX_RETRIES", "4"))
+app.config["OPENAI_BACKOFF_BASE"] = 1.0  # Seconds, doubled per attempt (full jitter)
+app.config["OPENAI_BACKOFF_MAX"] = 30.0  # Longest wait between attempts, Retry-After included
+app.config["OPENAI_RPM_LIMIT"] = int(os.getenv("OPENAI_RPM_LIMIT", "0"))  # 0 disables the limiter
+app.config["OPENAI_TPM_LIMIT"] = int(os.getenv("OPENAI_TPM_LIMIT", "0"))
+app.config["OPENAI_CIRCUIT_FAILURE_THRESHOLD"] = 5  # Consecutive failures that open the circuit
+app.config["OPENAI_CIRCUIT_RESET_TIMEOUT"] = 30  # Seconds before a probe request is let through
+# Hedging sends a duplicate of a non-streaming request that is still unanswered
+# after OPENAI_HEDGE_DELAY seconds and keeps whichever answer arrives first
+app.config["OPENAI_HEDGE_ENABLED"] = os.getenv("OPENAI_HEDGE_ENABLED", "false").lower() == "true"
+app.config["OPENAI_HEDGE_DELAY"] = float(os.getenv("OPENAI_HEDGE_DELAY", "20"))
+
+# Analysis execution mode: "single" asks one completion for every section,
+# "fanout" issues one concurrent request per section and assembles the results
+app.config["ANALYSIS_EXECUTION_MODE"] = os.getenv("ANALYSIS_EXECUTION_MODE", "single")
+app.config["FANOUT_SECTION_MAX_TOKENS"] = 1024
+
+# Configure the long-document (chunked map-reduce) analysis engine
+app.config["LONG_DOC_THRESHOLD_CHARS"] = 100000  # Matches the top pricing tier
+app.config["LONG_DOC_CHUNK_TOKENS"] = 24000  # Estimated input tokens per chunk
+app.config["LONG_DOC_MAP_MAX_TOKENS"] = 1500  # Completion tokens for each chunk's notes
+app.config["LONG_DOC_MAX_CONCURRENCY"] = int(os.getenv("LONG_DOC_MAX_CONCURRENCY", "4"))
+
+# Configure input compaction and the per-model input-token budget. Over-budget
+# documents are truncated ("truncate") or analyzed in chunks ("map_reduce")
+app.config["INPUT_COMPACTION_ENABLED"] = os.getenv("INPUT_COMPACTION_ENABLED", "true").lower() == "true"
+app.config["INPUT_BUDGET_POLICY"] = os.getenv("INPUT_BUDGET_POLICY", "map_reduce")
+app.config["OPENAI_INPUT_TOKEN_BUDGETS"] = {
+    "gpt-4o": 100000,
+    "gpt-4o-mini": 100000,
+    "default": 12000,
+}
+
+# Configure the analysis result cache
+app.config["ANALYSIS_CACHE_ENABLED"] = os.getenv("ANALYSIS_CACHE_ENABLED", "true").lower() == "true"
+app.config["ANALYSIS_CACHE_TTL"] = int(os.getenv("ANALYSIS_CACHE_TTL", str(7 * 24 * 3600)))
+app.config["ANALYSIS_CACHE_MAX_BYTES"] = int(
+    os.getenv("ANALYSIS_CACHE_MAX_BYTES", str(100 * 1024 * 1024))
+)
+app.config["ANALYSIS_CACHE_MEMORY_ENTRIES"] = 128
 
 # app.py
 
@@ -69,6 +188,32 @@ app.config["PRICING_TIERS"] = [
 ]
 app.config["MIN_CHARGE"] = 350  # ¥3.50 in cents
 
+# Price uploads from a fast character estimate and extract in the background;
+# exact extraction only runs when the estimate is near a pricing tier boundary
+app.config["CHAR_ESTIMATE_ENABLED"] = os.getenv("CHAR_ESTIMATE_ENABLED", "true").lower() == "true"
+app.config["CHAR_ESTIMATE_MARGIN"] = 0.15  # Relative error assumed for an estimate
+app.config["CHAR_ESTIMATE_PDF_SAMPLE_PAGES"] = 8
+
+# Configure the background analysis job queue
+app.config["ANALYSIS_WORKER_COUNT"] = int(os.getenv("ANALYSIS_WORKER_COUNT", "2"))
+app.config["ANALYSIS_JOB_POLL_INTERVAL"] = 2.0  # Seconds between queue polls
+app.config["ANALYSIS_JOB_MAX_ATTEMPTS"] = 3
+app.config["ANALYSIS_JOB_STALE_AFTER"] = 900  # Seconds before a running job is re-queued
+app.config["ANALYSIS_STREAM_CLAIM_GRACE"] = 15  # Seconds a streaming client has to claim its job
+# "threads" runs ANALYSIS_WORKER_COUNT worker threads; "async" (the default
+# under asgi.py) runs up to ANALYSIS_ASYNC_CONCURRENCY jobs on the event loop
+app.config["ANALYSIS_WORKER_MODE"] = os.getenv("ANALYSIS_WORKER_MODE", "threads")
+app.config["ANALYSIS_ASYNC_CONCURRENCY"] = int(os.getenv("ANALYSIS_ASYNC_CONCURRENCY", "200"))
+# Threads the ASGI server uses for blocking work (database, extraction, Flask routes)
+app.config["ASGI_THREAD_POOL_SIZE"] = int(os.getenv("ASGI_THREAD_POOL_SIZE", "24"))
+
+# Start the analysis worker threads and extraction pool when an entry point
+# loads the app; a preforking server (gunicorn.conf.py) sets this to false and
+# starts them in each worker after the fork instead
+app.config["START_BACKGROUND_SERVICES"] = (
+    os.getenv("START_BACKGROUND_SERVICES", "true").lower() == "true"
+)
+
 # Use a strong secret key
 app.secret_key = os.environ.get("FLASK_SECRET_KEY", os.urandom(24))
 
@@ -77,26 +222,236 @@ app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv(
     "DATABASE_URL", "sqlite:///dreamer_document_ai.db"
 )
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-    "pool_size": 10,
-    "max_overflow": 20,
-}
+# Connection pool of a server database (PostgreSQL); a SQLite file gets a
+# smaller pool, since its writers take turns on the file lock anyway
+app.config["DB_POOL_SIZE"] = int(os.getenv("DB_POOL_SIZE", "10"))
+app.config["DB_MAX_OVERFLOW"] = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+app.config["DB_POOL_TIMEOUT"] = int(os.getenv("DB_POOL_TIMEOUT", "30"))  # Seconds to wait for a connection
+app.config["DB_POOL_RECYCLE"] = 300  # Seconds before a server connection is replaced
+app.config["DB_CONNECT_TIMEOUT"] = 10  # Seconds (PostgreSQL)
+# Server-side limits of PostgreSQL sessions: a runaway query, or a transaction
+# left open across a Stripe or OpenAI call, is aborted instead of holding locks
+app.config["DB_STATEMENT_TIMEOUT_MS"] = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+app.config["DB_IDLE_IN_TRANSACTION_TIMEOUT_MS"] = int(
+    os.getenv("DB_IDLE_IN_TRANSACTION_TIMEOUT_MS", "60000")
+)
+# SQLite: WAL lets readers run alongside the single writer; a writer waits up
+# to SQLITE_BUSY_TIMEOUT seconds for the lock instead of failing at once
+app.config["SQLITE_JOURNAL_MODE"] = os.getenv("SQLITE_JOURNAL_MODE", "WAL").upper()
+app.config["SQLITE_BUSY_TIMEOUT"] = float(os.getenv("SQLITE_BUSY_TIMEOUT", "15"))
+app.config["SQLITE_POOL_SIZE"] = 5
+app.config["SQLITE_MAX_OVERFLOW"] = 15
+app.config["SQLITE_CACHE_SIZE_KB"] = 16 * 1024  # Page cache per connection
+
+
+def _database_engine_options(uri):
+    """
+    Build the SQLAlchemy engine options suited to the database backend.
+
+    Args:
+        uri (str): The SQLALCHEMY_DATABASE_URI.
+
+    Returns:
+        dict: Keyword arguments for create_engine.
+    """
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    if backend == "sqlite":
+        if url.database in (None, "", ":memory:"):
+            # Flask-SQLAlchemy shares a single connection (StaticPool)
+            return {}
+        return {
+            # No pre-ping or recycle: a local file connection does not go stale
+            "pool_size": app.config["SQLITE_POOL_SIZE"],
+            "max_overflow": app.config["SQLITE_MAX_OVERFLOW"],
+            "pool_timeout": app.config["DB_POOL_TIMEOUT"],
+            "connect_args": {"timeout": app.config["SQLITE_BUSY_TIMEOUT"]},
+        }
+
+    options = {
+        "pool_recycle": app.config["DB_POOL_RECYCLE"],
+        "pool_pre_ping": True,
+        "pool_size": app.config["DB_POOL_SIZE"],
+        "max_overflow": app.config["DB_MAX_OVERFLOW"],
+        "pool_timeout": app.config["DB_POOL_TIMEOUT"],
+        # Reuse the most recent connection so idle ones expire server-side
+        "pool_use_lifo": True,
+    }
+    if backend == "postgresql":
+        options["connect_args"] = {
+            "connect_timeout": app.config["DB_CONNECT_TIMEOUT"],
+            "application_name": "dreamer-document-ai",
+            "options": (
+                f"-c statement_timeout={app.config['DB_STATEMENT_TIMEOUT_MS']} "
+                f"-c idle_in_transaction_session_timeout="
+                f"{app.config['DB_IDLE_IN_TRANSACTION_TIMEOUT_MS']}"
+            ),
+        }
+    return options
+
+
+@event.listens_for(Engine, "connect")
+def _configure_sqlite_connection(dbapi_connection, connection_record):
+    """Apply the journal mode and pragmas to each new SQLite connection."""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA journal_mode={app.config['SQLITE_JOURNAL_MODE']}")
+        if app.config["SQLITE_JOURNAL_MODE"] == "WAL":
+            # Durable at each checkpoint rather than each commit, safe in WAL mode
+            cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA cache_size=-{app.config['SQLITE_CACHE_SIZE_KB']}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+
+
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = _database_engine_options(
+    app.config["SQLALCHEMY_DATABASE_URI"]
+)
 
 # Configure Stripe keys
 app.config["STRIPE_SECRET_KEY"] = os.getenv("STRIPE_SECRET_KEY")
 app.config["STRIPE_PUBLISHABLE_KEY"] = os.getenv("STRIPE_PUBLISHABLE_KEY")
 app.config["STRIPE_PAYMENT_METHOD_CONFIG"] = os.getenv("STRIPE_PAYMENT_METHOD_CONFIG")
+app.config["STRIPE_API_BASE"] = os.getenv("STRIPE_API_BASE")  # None uses api.stripe.com
+# Signing secret of the /stripe/webhook endpoint (whsec_...); None disables it
+app.config["STRIPE_WEBHOOK_SECRET"] = os.getenv("STRIPE_WEBHOOK_SECRET")
+app.config["STRIPE_WEBHOOK_TOLERANCE"] = int(os.getenv("STRIPE_WEBHOOK_TOLERANCE", "300"))
+# With webhooks enabled, seconds /payment/success waits for payment_intent.succeeded
+# before asking Stripe itself (covers delayed or missed webhooks)
+app.config["PAYMENT_WEBHOOK_WAIT"] = float(os.getenv("PAYMENT_WEBHOOK_WAIT", "5"))
+app.config["PAYMENT_WEBHOOK_POLL_INTERVAL"] = 0.2
+# Payment intent lifecycle: an unpaid intent is reused when the same browser
+# uploads the same file again, until it has been idle this many seconds; the
+# sweep then cancels it on Stripe
+app.config["PAYMENT_INTENT_ABANDON_AFTER"] = int(
+    os.getenv("PAYMENT_INTENT_ABANDON_AFTER", str(24 * 60 * 60))
+)
+app.config["PAYMENT_INTENT_SWEEP_INTERVAL"] = int(
+    os.getenv("PAYMENT_INTENT_SWEEP_INTERVAL", "600")
+)  # Seconds between sweeps by the analysis workers (0 disables them)
+app.config["PAYMENT_INTENT_SWEEP_BATCH"] = int(os.getenv("PAYMENT_INTENT_SWEEP_BATCH", "50"))
+# Seconds a succeeded or canceled intent state is cached in process memory
+app.config["PAYMENT_INTENT_STATE_TTL"] = int(os.getenv("PAYMENT_INTENT_STATE_TTL", "300"))
+
+# Configure multi-file uploads (POST /batches, utils/batches.py): the files are
+# processed BATCH_EXTRACTION_CONCURRENCY at a time and paid with one intent;
+# at most BATCH_ANALYSIS_CONCURRENCY analyses of a batch run at once, on the
+# shared analysis workers
+app.config["BATCH_MAX_FILES"] = int(os.getenv("BATCH_MAX_FILES", "50"))
+app.config["BATCH_MAX_CONTENT_LENGTH"] = int(
+    os.getenv("BATCH_MAX_CONTENT_LENGTH", str(500 * 1024 * 1024))
+)  # Whole request; each file is still limited to MAX_CONTENT_LENGTH
+app.config["BATCH_EXTRACTION_CONCURRENCY"] = int(os.getenv("BATCH_EXTRACTION_CONCURRENCY", "4"))
+app.config["BATCH_ANALYSIS_CONCURRENCY"] = int(os.getenv("BATCH_ANALYSIS_CONCURRENCY", "8"))
 
 # Initialize extensions
 db = SQLAlchemy(model_class=Base)
 db.init_app(app)
-migrate = Migrate(app, db)
 
-# Import routes after app initialization
-from routes import *  # noqa
+# Revision of the first migration, matching the schema db.create_all() built
+# before migrations existed
+INITIAL_REVISION = "9c1e5b7a2d40"
+
+_app_lock = threading.Lock()
+_app_created = False
+_services_pid = None
+
+
+def create_app():
+    """
+    Register the migrations, routes and CLI commands on the app (idempotent).
+
+    Has no side effects on the database, threads or processes, so it is safe
+    to call in a preforking master or a CLI command.
+
+    Returns:
+        Flask: The application.
+    """
+    global _app_created
+    with _app_lock:
+        if not _app_created:
+            from flask_migrate import Migrate
+
+            Migrate(app, db, directory=os.path.join(app.root_path, "migrations"))
+            # Import routes after app initialization
+            import routes  # noqa: F401
+
+            _app_created = True
+    return app
+
+
+def init_database():
+    """
+    Bring the database schema up to date by running the pending migrations.
+
+    A database created by db.create_all() before migrations existed has the
+    tables but no alembic_version; it is stamped at INITIAL_REVISION first.
+    """
+    from flask_migrate import stamp, upgrade
+    from sqlalchemy import inspect
+
+    create_app()
+    with app.app_context():
+        tables = set(inspect(db.engine).get_table_names())
+        if tables and "alembic_version" not in tables:
+            app.logger.info(f"🏷️ Stamping existing database at revision {INITIAL_REVISION}")
+            stamp(revision=INITIAL_REVISION)
+        upgrade()
+
+
+@app.cli.command("init-db")
+def init_database_command():
+    """Create or upgrade the database schema."""
+    init_database()
+
+
+def start_background_services():
+    """
+    Start the analysis worker threads and the extraction pool of this process,
+    and load the heavy SDKs in a background thread so the first requests don't
+    pay for them.
+
+    Runs once per process: a forked worker starts its own services even if
+    its parent already did.
+    """
+    global _services_pid
+    with _app_lock:
+        if _services_pid == os.getpid():
+            return
+        _services_pid = os.getpid()
+
+    create_app()
+    # Background analysis worker threads (asgi.py runs async workers instead)
+    from utils.job_queue import start_workers
+
+    if app.config["ANALYSIS_WORKER_MODE"] == "threads":
+        start_workers()
+
+    # Pre-warm the document extraction worker processes
+    from utils.extraction_pool import get_extraction_pool
+
+    get_extraction_pool()
+
+    threading.Thread(target=preload_modules, name="preload-modules", daemon=True).start()
+
+
+def preload_modules():
+    """
+    Import the heavy SDKs that request handlers otherwise load on first use.
+
+    Meant for a preforking master: the modules are imported once and their
+    memory is shared copy-on-write by every forked worker.
+    """
+    import openai  # noqa: F401
+    import stripe  # noqa: F401
+
+    if app.config["STORAGE_BACKEND"] == "s3":
+        import boto3  # noqa: F401
 
-# Create database tables
-with app.app_context():
-    db.create_all()
+    if app.config["EXTRACTION_POOL_SIZE"] <= 0:
+        # Extraction runs in the request process instead of the pool workers
+        import markitdown  # noqa: F401
+        import pypdf  # noqa: F401
@@ -0,0 +1,395 @@
+"""
+@fileoverview ASGI entry point: async upload and payment routes, async analysis workers.
+@filepath asgi.py
+
+Run with an ASGI server instead of wsgi.py, for example:
+    uvicorn asgi:application --host 0.0.0.0 --port 5001
+
+/upload and /payment/success are served by async handlers that await Stripe
+through a pooled HTTPX client; every other route is the unchanged Flask app,
+mounted through a2wsgi. Analysis jobs run on the event loop with AsyncOpenAI
+(utils/job_queue.run_async_workers), so one process can hold hundreds of
+in-flight LLM calls instead of one per worker thread. Database access and
+document extraction stay synchronous and run on a bounded thread pool.
+"""
+
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Set UTF-8 as default encoding
+os.environ['LANG'] = 'C.UTF-8'
+os.environ['LC_ALL'] = 'C.UTF-8'
+os.environ['PYTHONIOENCODING'] = 'utf-8'
+
+# Add the project directory to Python path
+project_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_dir)
+
+# Load environment variables
+from dotenv import load_dotenv
+env_path = os.path.join(project_dir, '.env')
+load_dotenv(env_path)
+
+# Analysis jobs run on the event loop rather than in worker threads
+os.environ.setdefault("ANALYSIS_WORKER_MODE", "async")
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+from app import app, create_app, start_background_services
+
+create_app()
+
+from routes import (
+    UploadError,
+    _allowed_file,
+    _confirmation_replay,
+    _generate_unique_filename,
+    _intent_metadata,
+    _log_webhook_timeout,
+    _parse_analysis_options,
+    _parse_client_token,
+    _payment_data,
+    _record_confirmed_payment,
+    _record_new_intent,
+    _record_repriced_intent,
+    _register_document,
+    _remove_upload,
+    _store_upload,
+    _replay_paid_analysis,
+    _webhooks_enabled,
+)
+from utils.async_runtime import run_sync
+from utils.job_queue import run_async_workers, stop_workers
+from utils.metrics import finish_request, stage, start_request_timer
+from utils.openai_client import close_async_client
+from utils.stripe_utils import (
+    confirm_payment_intent_async,
+    create_payment_intent_async,
+    update_payment_intent_amount_async,
+)
+from utils.upload_stream import UploadIngestStream
+
+# Payment confirmations in progress on the event loop, by payment intent id
+_payment_flights = {}
+
+# Form fields read from the upload besides the file
+_UPLOAD_FIELDS = {"analysis_options", "stream", "client_token"}
+
+# Buffer limit of the multipart decoder, and the slices request chunks are fed in
+_DECODER_MEMORY_SIZE = 64 * 1024
+_DECODER_CHUNK_SIZE = 16 * 1024
+
+
+async def _receive_upload(request: Request, boundary: bytes):
+    """
+    Stream the "file" part of a multipart body into an UploadIngestStream.
+
+    Args:
+        request: The incoming request.
+        boundary: The multipart boundary.
+
+    Returns:
+        Tuple[UploadIngestStream, str, str, dict]: The stream (None if the
+            part is missing or empty), the client filename, its content type
+            and the values of the _UPLOAD_FIELDS form fields that were sent.
+
+    Raises:
+        RequestEntityTooLarge: If the file exceeds MAX_CONTENT_LENGTH.
+        UnsupportedMediaType: If the file content does not match its type.
+    """
+    decoder = MultipartDecoder(boundary, max_form_memory_size=_DECODER_MEMORY_SIZE)
+    upload, filename, content_type = None, None, None
+    fields = {}
+    current = None
+    finished = False
+
+    async def chunks():
+        async for chunk in request.stream():
+            # The decoder rejects any receive that would grow its buffer past
+            # max_form_memory_size, and servers hand over larger chunks
+            for start in range(0, len(chunk), _DECODER_CHUNK_SIZE):
+                yield chunk[start:start + _DECODER_CHUNK_SIZE]
+        yield None  # End of body
+
+    try:
+        async for chunk in chunks():
+            decoder.receive_data(chunk)
+            event = decoder.next_event()
+            while not isinstance(event, NeedData) and not finished:
+                if isinstance(event, File):
+                    current = None
+                    if event.name == "file" and upload is None:
+                        filename = event.filename
+                        content_type = event.headers.get("Content-Type")
+                        if filename:
+                            upload = UploadIngestStream(
+                                app.config["UPLOAD_FOLDER"],
+                                filename,
+                                app.config["MAX_CONTENT_LENGTH"],
+                            )
+                            current = upload
+                elif isinstance(event, Field):
+                    current = None
+                    if event.name in _UPLOAD_FIELDS:
+                        current = fields[event.name] = io.BytesIO()
+                elif isinstance(event, Data):
+                    if current is not None:
+                        current.write(event.data)
+                elif isinstance(event, Epilogue):
+                    finished = True
+                    break
+                else:
+                    current = None
+                event = decoder.next_event()
+    except Exception:
+        if upload is not None:
+            upload.close()
+        raise
+    fields = {name: value.getvalue().decode("utf-8", "replace") for name, value in fields.items()}
+    return upload, filename, content_type, fields
+
+
+async def upload_file(request: Request) -> JSONResponse:
+    """Async counterpart of routes.upload_file."""
+    save_path = None
+    upload = None
+    try:
+        # 1. File validation (content type and size are checked while streaming)
+        mimetype, options = parse_options_header(request.headers.get("content-type", ""))
+        if mimetype != "multipart/form-data" or "boundary" not in options:
+            app.logger.error("🚫 No file part in the request")
+            return JSONResponse({"error": "No file provided"}, 400)
+        try:
+            with stage("receive"):
+                upload, filename, content_type, fields = await _receive_upload(
+                    request, options["boundary"].encode("latin-1")
+                )
+        except RequestEntityTooLarge:
+            max_size_mb = app.config["MAX_CONTENT_LENGTH"] // (1024 * 1024)
+            app.logger.error("🚫 Upload rejected: file too large")
+            return JSONResponse({"error": f"File size must be less than {max_size_mb}MB"}, 413)
+        except HTTPException as e:
+            app.logger.error(f"🚫 Upload rejected: {e.description}")
+            return JSONResponse({"error": e.description}, e.code)
+
+        if filename is None:
+            app.logger.error("🚫 No file part in the request")
+            return JSONResponse({"error": "No file provided"}, 400)
+        if filename == "":
+            app.logger.error("🚫 No file selected")
+            return JSONResponse({"error": "No file selected"}, 400)
+        if not _allowed_file(filename):
+            app.logger.error(f"🚫 Invalid file type: {filename}")
+            return JSONResponse({"error": "Invalid file type. Only PDF and DOCX files are allowed"}, 400)
+
+        # 2. Move the received file into place
+        unique_filename, _ = _generate_unique_filename(filename)
+        save_path = os.path.join(app.config["UPLOAD_FOLDER"], unique_filename)
+        try:
+            with stage("save"):
+                await asyncio.to_thread(upload.commit, save_path)
+        except HTTPException as e:
+            app.logger.error(f"🚫 Upload rejected: {e.description}")
+            return JSONResponse({"error": e.description}, e.code)
+        app.logger.info(f"✅ File saved successfully at {save_path}")
+        try:
+            with stage("store"):
+                save_path = await asyncio.to_thread(_store_upload, unique_filename, save_path)
+        except OSError:
+            _remove_upload(save_path)
+            return JSONResponse({"error": "Failed to save file"}, 500)
+
+        # 3. Process document (or estimate its size) and store it
+        client_token = _parse_client_token(fields.get("client_token"))
+        try:
+            upload_data, reused_intent = await run_sync(
+                _register_document,
+                save_path,
+                unique_filename,
+                filename,
+                content_type,
+                upload.content_hash,
+                upload.size,
+                client_token,
+            )
+        except UploadError as e:
+            return JSONResponse({"error": str(e)}, e.status_code)
+
+        # 4. Create (or reuse) the payment intent and return response
+        try:
+            metadata = _intent_metadata(
+                upload_data["document_id"],
+                _parse_analysis_options(fields.get("analysis_options")),
+                fields.get("stream") == "true",
+            )
+            with stage("payment_intent"):
+                payment_data = await _process_payment(
+                    upload_data, metadata, upload.content_hash, client_token, reused_intent
+                )
+            return JSONResponse({**upload_data, **payment_data}, 200)
+        except Exception as e:
+            _remove_upload(save_path)
+            app.logger.error(f"⚠️ Payment error: {str(e)}")
+            return JSONResponse({"error": "Payment setup failed"}, 500)
+
+    except Exception as e:
+        _remove_upload(save_path)
+        app.logger.error(f"❌ Unexpected error: {str(e)}")
+        return JSONResponse({"error": "An unexpected error occurred"}, 500)
+    finally:
+        if upload is not None:
+            upload.close()
+
+
+async def _process_payment(upload_data, metadata, content_hash, client_token, reused_intent):
+    """Async counterpart of routes._process_payment."""
+    amount = upload_data["analysis_cost"]
+    if reused_intent is not None and reused_intent["amount"] != amount:
+        import stripe
+
+        try:
+            await update_payment_intent_amount_async(reused_intent["id"], amount)
+            await run_sync(_record_repriced_intent, reused_intent["id"], amount)
+        except stripe.error.StripeError:
+            reused_intent = None
+    if reused_intent is not None:
+        return _payment_data(reused_intent["client_secret"], amount, reused_intent["currency"])
+
+    payment_intent = await create_payment_intent_async(amount, metadata=metadata)
+    return await run_sync(
+        _record_new_intent, payment_intent, upload_data, content_hash, client_token
+    )
+
+
+async def _wait_for_webhook(payment_intent_id, replay):
+    """Async counterpart of routes._wait_for_webhook; each poll runs in a fresh session."""
+    deadline = time.monotonic() + app.config["PAYMENT_WEBHOOK_WAIT"]
+    while time.monotonic() < deadline:
+        await asyncio.sleep(app.config["PAYMENT_WEBHOOK_POLL_INTERVAL"])
+        response = await run_sync(replay)
+        if response is not None:
+            return response
+    _log_webhook_timeout(payment_intent_id)
+    return None
+
+
+async def _confirm_paid_analysis(payment_intent_id, document_id, analysis_options, stream):
+    """Async counterpart of routes._confirm_paid_analysis."""
+    replay = _confirmation_replay(payment_intent_id, document_id, analysis_options)
+    result = await run_sync(replay)
+    if result is not None:
+        return result
+
+    flight = _payment_flights.get(payment_intent_id)
+    if flight is not None:
+        app.logger.info(f"⏳ Joining the in-flight confirmation of payment {payment_intent_id}")
+        result = await asyncio.shield(flight)
+        replay = await run_sync(
+            _replay_paid_analysis, payment_intent_id, document_id, analysis_options
+        )
+        return replay or result
+
+    flight = asyncio.get_running_loop().create_future()
+    _payment_flights[payment_intent_id] = flight
+    try:
+        result = None
+        if _webhooks_enabled():
+            with stage("webhook_wait"):
+                result = await _wait_for_webhook(payment_intent_id, replay)
+        if result is None:
+            with stage("stripe_retrieve"):
+                payment_intent = await confirm_payment_intent_async(payment_intent_id)
+            result = await run_sync(
+                _record_confirmed_payment, payment_intent, document_id, analysis_options, stream
+            )
+        flight.set_result(result)
+        return result
+    except asyncio.CancelledError:
+        flight.cancel()
+        raise
+    except Exception as e:
+        flight.set_exception(e)
+        flight.exception()  # Retrieved here, so an unawaited flight is not logged
+        raise
+    finally:
+        _payment_flights.pop(payment_intent_id, None)
+
+
+async def payment_success(request: Request) -> JSONResponse:
+    """Async counterpart of routes.payment_success."""
+    try:
+        data = await request.json()
+        payment_intent_id = data.get("payment_intent_id")
+        document_id = data.get("document_id")
+        analysis_options = data.get("analysis_options", {})
+        stream = bool(data.get("stream", False))
+
+        if not payment_intent_id or not document_id:
+            return JSONResponse({"error": "Missing required parameters"}, 400)
+
+        payload, status_code = await _confirm_paid_analysis(
+            payment_intent_id, document_id, analysis_options, stream
+        )
+        return JSONResponse(payload, status_code)
+
+    except Exception as e:
+        app.logger.error(f"❌ Payment processing error: {str(e)}")
+        return JSONResponse({"error": str(e)}, 500)
+
+
+def _timed(endpoint, handler):
+    """Wrap a handler with request metrics and the Server-Timing header."""
+
+    async def timed_handler(request: Request) -> JSONResponse:
+        timer = start_request_timer(endpoint)
+        response = await handler(request)
+        response.headers.update(
+            finish_request(timer, endpoint, request.method, response.status_code)
+        )
+        return response
+
+    return timed_handler
+
+
+@contextlib.asynccontextmanager
+async def lifespan(_):
+    """Size the blocking-work thread pool and run the async analysis workers."""
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(
+            max_workers=app.config["ASGI_THREAD_POOL_SIZE"], thread_name_prefix="asgi-sync"
+        )
+    )
+    if app.config["START_BACKGROUND_SERVICES"]:
+        start_background_services()
+    worker = None
+    if app.config["ANALYSIS_WORKER_MODE"] == "async":
+        worker = asyncio.create_task(run_async_workers())
+    try:
+        yield
+    finally:
+        stop_workers()
+        if worker is not None:
+            await worker
+        await close_async_client()
+
+
+application = Starlette(
+    routes=[
+        Route("/upload", _timed("upload_file", upload_file), methods=["POST"]),
+        Route("/payment/success", _timed("payment_success", payment_success), methods=["POST"]),
+        Mount("/", app=WSGIMiddleware(app, workers=app.config["ASGI_THREAD_POOL_SIZE"])),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,189 @@
+"""
+@file-overview Load test: analysis jobs in flight per process, threads vs async workers.
+@filepath benchmarks/analysis_concurrency.py
+
+Queues a batch of analysis jobs against the local fake OpenAI server (which
+answers after a fixed latency), then drains the queue once with the threaded
+workers (ANALYSIS_WORKER_COUNT threads, the wsgi.py mode) and once with the
+async workers used by asgi.py. Reports wall time, throughput, the peak number
+of concurrent OpenAI requests seen by the server and the peak thread count.
+
+Usage:
+    python benchmarks/analysis_concurrency.py --jobs 200 --latency 1.0 --threads 2 --concurrency 200
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_openai import FakeOpenAIHandler, make_server  # noqa: E402
+
+_TMP = tempfile.mkdtemp(prefix="analysis-concurrency-")
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_TMP, 'benchmark.db')}"
+os.environ["TEXT_BLOB_DIR"] = os.path.join(_TMP, "text_blobs")
+os.environ["ANALYSIS_WORKER_MODE"] = "none"  # Workers are started by the scenarios
+os.environ["EXTRACTION_POOL_SIZE"] = "0"
+os.environ["ANALYSIS_CACHE_ENABLED"] = "false"
+
+
+class _InFlight:
+    """Counts concurrent requests handled by the fake OpenAI server."""
+
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def wrap(self, handler):
+        def do_post(request_handler):
+            with self._lock:
+                self.current += 1
+                self.peak = max(self.peak, self.current)
+            try:
+                handler(request_handler)
+            finally:
+                with self._lock:
+                    self.current -= 1
+
+        return do_post
+
+    def reset(self):
+        with self._lock:
+            self.peak = self.current
+
+
+def _queue_jobs(count):
+    from app import app, db
+    from models import AnalysisJob, Document
+    from utils.job_queue import JOB_QUEUED
+    from utils.text_blobs import put_text
+
+    with app.app_context():
+        document = Document(
+            filename="benchmark.pdf",
+            original_filename="benchmark.pdf",
+            file_size=0,
+            mime_type="application/pdf",
+            char_count=3200,
+            text_blob_key=put_text("这是一段用于压力测试的文档内容。" * 200),
+        )
+        db.session.add(document)
+        db.session.flush()
+        db.session.add_all(
+            AnalysisJob(document_id=document.id, status=JOB_QUEUED) for _ in range(count)
+        )
+        db.session.commit()
+        return [job.id for job in AnalysisJob.query.filter_by(status=JOB_QUEUED)]
+
+
+def _remaining(job_ids):
+    from app import app
+    from models import AnalysisJob
+    from utils.job_queue import JOB_FAILED, JOB_SUCCEEDED
+
+    with app.app_context():
+        return AnalysisJob.query.filter(
+            AnalysisJob.id.in_(job_ids),
+            AnalysisJob.status.notin_([JOB_SUCCEEDED, JOB_FAILED]),
+        ).count()
+
+
+def _report(name, jobs, elapsed, in_flight, peak_threads):
+    print(
+        f"{name:<24} {elapsed:7.2f}s  {jobs / elapsed:7.1f} jobs/s  "
+        f"peak in-flight {in_flight.peak:4d}  peak threads {peak_threads:4d}"
+    )
+
+
+def _app_thread_count():
+    """Threads of the app itself (the fake server's request threads are excluded)."""
+    return sum(
+        1 for thread in threading.enumerate() if "process_request_thread" not in thread.name
+    )
+
+
+def _watch_threads(stop, peak):
+    while not stop.is_set():
+        peak[0] = max(peak[0], _app_thread_count())
+        time.sleep(0.05)
+
+
+def run_threads(job_ids, threads, in_flight):
+    from utils.job_queue import start_workers, stop_workers
+
+    in_flight.reset()
+    stop, peak = threading.Event(), [_app_thread_count()]
+    threading.Thread(target=_watch_threads, args=(stop, peak), daemon=True).start()
+    started = time.perf_counter()
+    start_workers(threads)
+    while _remaining(job_ids):
+        time.sleep(0.1)
+    elapsed = time.perf_counter() - started
+    stop_workers()
+    stop.set()
+    _report(f"threads x{threads}", len(job_ids), elapsed, in_flight, peak[0])
+
+
+def run_async(job_ids, concurrency, in_flight):
+    from app import app
+    from utils.job_queue import _wakeup, run_async_workers, stop_workers
+
+    async def scenario():
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=app.config["ASGI_THREAD_POOL_SIZE"])
+        )
+        worker = asyncio.create_task(run_async_workers(concurrency))
+        while await asyncio.to_thread(_remaining, job_ids):
+            await asyncio.sleep(0.1)
+        stop_workers()
+        _wakeup.set()
+        await worker
+
+    in_flight.reset()
+    stop, peak = threading.Event(), [_app_thread_count()]
+    threading.Thread(target=_watch_threads, args=(stop, peak), daemon=True).start()
+    started = time.perf_counter()
+    asyncio.run(scenario())
+    elapsed = time.perf_counter() - started
+    stop.set()
+    _report(f"async x{concurrency}", len(job_ids), elapsed, in_flight, peak[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare analysis concurrency per process")
+    parser.add_argument("--jobs", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=1.0, help="Fake OpenAI latency (s)")
+    parser.add_argument("--threads", type=int, default=2, help="Threaded workers (wsgi mode)")
+    parser.add_argument("--concurrency", type=int, default=200, help="Async jobs in flight")
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    in_flight = _InFlight()
+    FakeOpenAIHandler.do_POST = in_flight.wrap(FakeOpenAIHandler.do_POST)
+    server = make_server("127.0.0.1", args.port, args.latency, 0.0, 50, False)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.port}/v1"
+
+    from app import app, init_database
+
+    init_database()
+    app.logger.setLevel(logging.WARNING)
+    print(f"📊 {args.jobs} jobs, {args.latency}s simulated OpenAI latency")
+    run_threads(_queue_jobs(args.jobs), args.threads, in_flight)
+    run_async(_queue_jobs(args.jobs), args.concurrency, in_flight)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
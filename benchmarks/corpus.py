@@ -0,0 +1,160 @@
+"""
+@file-overview Synthetic PDF and DOCX documents for the benchmarks.
+@filepath benchmarks/corpus.py
+
+Both writers use only the standard library, so no PDF or Word writer has to be
+installed. Every generated document carries a nonce line, so repeated runs and
+concurrent uploads never hit the extraction or result caches.
+
+Usage:
+    python benchmarks/corpus.py --out /tmp/corpus --pdf-pages 5 50 300 --docx-paragraphs 200 2000
+"""
+
+import argparse
+import os
+import uuid
+import zipfile
+from xml.sax.saxutils import escape
+
+LINE = "The quick brown fox jumps over the lazy dog while the editor reads page {page}, line {line}."
+PARAGRAPH = "第{number}段：夜色渐深，编辑仍在灯下逐字阅读这份书稿，思考人物的动机与情节的走向。"
+
+
+def write_pdf(path, pages, lines_per_page=45, nonce=None):
+    """
+    Write a simple multi-page PDF with one Helvetica text block per page.
+
+    Args:
+        path (str): Output path.
+        pages (int): Number of pages.
+        lines_per_page (int): Text lines on each page.
+        nonce (str): Text written at the top of the first page to make the
+            file unique, or None.
+    """
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # Pages tree, filled in once the page objects are numbered
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+    for page in range(1, pages + 1):
+        text = ["BT /F1 10 Tf 12 TL 40 800 Td"]
+        if nonce and page == 1:
+            text.append(f"(Document {nonce}) Tj T*")
+        for line in range(1, lines_per_page + 1):
+            text.append(f"({LINE.format(page=page, line=line)}) Tj T*")
+        text.append("ET")
+        stream = "\n".join(text).encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids).encode()
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, pages)
+
+    with open(path, "wb") as pdf:
+        pdf.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(pdf.tell())
+            pdf.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        xref = pdf.tell()
+        pdf.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            pdf.write(b"%010d 00000 n \n" % offset)
+        pdf.write(
+            b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+            % (len(objects) + 1, xref)
+        )
+
+
+_DOCX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    "</Types>"
+)
+_DOCX_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/>'
+    "</Relationships>"
+)
+
+
+def write_docx(path, paragraphs, nonce=None):
+    """
+    Write a minimal DOCX of Chinese paragraphs.
+
+    Args:
+        path (str): Output path.
+        paragraphs (int): Number of paragraphs (about 40 characters each).
+        nonce (str): Text of a first paragraph that makes the file unique, or None.
+    """
+    texts = [f"文档 {nonce}"] if nonce else []
+    texts.extend(PARAGRAPH.format(number=number) for number in range(1, paragraphs + 1))
+    body = "".join(f"<w:p><w:r><w:t>{escape(text)}</w:t></w:r></w:p>" for text in texts)
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f"<w:body>{body}</w:body></w:document>"
+    )
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as docx:
+        docx.writestr("[Content_Types].xml", _DOCX_CONTENT_TYPES)
+        docx.writestr("_rels/.rels", _DOCX_RELS)
+        docx.writestr("word/document.xml", document)
+
+
+def write_document(directory, spec):
+    """
+    Write one unique document described by a corpus spec.
+
+    Args:
+        directory (str): Output directory.
+        spec (Tuple[str, int]): ("pdf", pages) or ("docx", paragraphs).
+
+    Returns:
+        str: Path of the written file.
+    """
+    file_type, size = spec
+    nonce = uuid.uuid4().hex
+    path = os.path.join(directory, f"{file_type}-{size}-{nonce[:12]}.{file_type}")
+    if file_type == "pdf":
+        write_pdf(path, size, nonce=nonce)
+    else:
+        write_docx(path, size, nonce=nonce)
+    return path
+
+
+def parse_specs(pdf_pages, docx_paragraphs):
+    """Build corpus specs from lists of PDF page and DOCX paragraph counts."""
+    return [("pdf", pages) for pages in pdf_pages] + [
+        ("docx", paragraphs) for paragraphs in docx_paragraphs
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic PDF/DOCX corpus")
+    parser.add_argument("--out", required=True, help="Output directory")
+    parser.add_argument("--pdf-pages", type=int, nargs="*", default=[5, 50, 300])
+    parser.add_argument("--docx-paragraphs", type=int, nargs="*", default=[200, 2000])
+    parser.add_argument("--copies", type=int, default=1, help="Unique files per size")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    for spec in parse_specs(args.pdf_pages, args.docx_paragraphs):
+        for _ in range(args.copies):
+            path = write_document(args.out, spec)
+            print(f"📄 {path}  {os.path.getsize(path) / 1024:.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+@file-overview Benchmark of concurrent upload and payment writes on the SQLite database.
+@filepath benchmarks/db_writes.py
+
+Each writer thread repeats the database work of one paid upload, committing
+after each step as the application does: register the document (upload),
+record its payment intent, record the payment and queue its job (payment),
+then claim the job and store its result (worker). Poller threads read job
+status meanwhile, like the SSE and status endpoints. Every configuration runs
+in its own process, on a fresh database built by the migrations:
+
+- "rollback-journal": the previous settings, journal_mode=DELETE and the
+  5 second default busy timeout of sqlite3;
+- "wal": the defaults of app.py (WAL, synchronous=NORMAL, SQLITE_BUSY_TIMEOUT).
+
+Reports throughput, median and p95 latency of each step, and the number of
+"database is locked" errors. Finally prints the query plans of the lookups
+the query indexes serve.
+
+Usage:
+    python benchmarks/db_writes.py --writers 16 --pollers 8 --flows 100
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+CONFIGURATIONS = {
+    "rollback-journal": {"SQLITE_JOURNAL_MODE": "DELETE", "SQLITE_BUSY_TIMEOUT": "5"},
+    "wal": {},
+}
+
+# Lookups served by the query indexes, with the index each one should use
+INDEXED_LOOKUPS = [
+    ("SELECT * FROM payment WHERE document_id = 1", "ix_payment_document_id"),
+    ("SELECT * FROM checkout_intent WHERE document_id = 1", "ix_checkout_intent_document_id"),
+    ("SELECT * FROM analysis_job WHERE payment_id = 1 ORDER BY created_at", "ix_analysis_job_payment_id"),
+    ("SELECT * FROM document ORDER BY created_at DESC LIMIT 20", "ix_document_created_at"),
+]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+def run_configuration(args):
+    """Run the workload in this process and print its statistics as JSON."""
+    from app import app, db, init_database
+    from models import AnalysisJob, CheckoutIntent, Document, Payment
+    from sqlalchemy import text
+    from sqlalchemy.exc import OperationalError
+
+    init_database()
+    result_payload = {"summary": "x" * args.result_bytes}
+    latencies = {"upload": [], "payment": [], "worker": [], "poll": []}
+    errors = {"locked": 0, "other": 0}
+    lock = threading.Lock()
+    job_ids = []
+    writers_done = threading.Event()
+
+    def timed(step, function):
+        started = time.perf_counter()
+        try:
+            value = function()
+        except OperationalError as e:
+            db.session.rollback()
+            with lock:
+                errors["locked" if "database is locked" in str(e) else "other"] += 1
+            return None
+        with lock:
+            latencies[step].append(time.perf_counter() - started)
+        return value
+
+    def upload(thread, flow):
+        document = Document(
+            filename=f"{thread}-{flow}.pdf",
+            original_filename="manuscript.pdf",
+            file_size=1024 * 1024,
+            mime_type="application/pdf",
+            char_count=50000,
+            analysis_cost=500,
+            title="Manuscript",
+            content_hash=f"{thread:032x}{flow:032x}",
+        )
+        db.session.add(document)
+        db.session.commit()
+        db.session.add(CheckoutIntent(
+            stripe_payment_id=f"pi_{thread}_{flow}",
+            client_secret=f"pi_{thread}_{flow}_secret",
+            amount=500,
+            status="requires_payment_method",
+            document_id=document.id,
+        ))
+        db.session.commit()
+        return document.id
+
+    def pay(thread, flow, document_id):
+        document = db.session.get(Document, document_id)
+        payment = Payment(
+            stripe_payment_id=f"pi_{thread}_{flow}",
+            amount=document.analysis_cost,
+            currency="cny",
+            status="succeeded",
+            document_id=document.id,
+        )
+        db.session.add(payment)
+        db.session.flush()
+        job = AnalysisJob(document_id=document.id, payment_id=payment.id, analysis_options={})
+        db.session.add(job)
+        CheckoutIntent.query.filter_by(stripe_payment_id=payment.stripe_payment_id).update(
+            {"status": "succeeded"}, synchronize_session=False
+        )
+        db.session.commit()
+        return job.id
+
+    def work(job_id):
+        AnalysisJob.query.filter_by(id=job_id, status="queued").update(
+            {"status": "running", "attempts": AnalysisJob.attempts + 1}, synchronize_session=False
+        )
+        db.session.commit()
+        AnalysisJob.query.filter_by(id=job_id).update(
+            {"status": "succeeded", "result": result_payload}, synchronize_session=False
+        )
+        db.session.commit()
+
+    def writer(thread):
+        with app.app_context():
+            for flow in range(args.flows):
+                document_id = timed("upload", lambda: upload(thread, flow))
+                if document_id is None:
+                    continue
+                job_id = timed("payment", lambda: pay(thread, flow, document_id))
+                if job_id is None:
+                    continue
+                with lock:
+                    job_ids.append(job_id)
+                timed("worker", lambda: work(job_id))
+
+    def poller():
+        with app.app_context():
+            while not writers_done.is_set():
+                with lock:
+                    job_id = job_ids[-1] if job_ids else None
+                if job_id is None:
+                    time.sleep(0.01)
+                    continue
+
+                def poll():
+                    db.session.expire_all()
+                    job = db.session.get(AnalysisJob, job_id)
+                    status = job.status
+                    db.session.commit()
+                    return status
+
+                timed("poll", poll)
+                time.sleep(args.poll_interval)
+
+    writers = [threading.Thread(target=writer, args=(thread,)) for thread in range(args.writers)]
+    pollers = [threading.Thread(target=poller) for _ in range(args.pollers)]
+    started = time.perf_counter()
+    for thread in pollers + writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    writers_done.set()
+    for thread in pollers:
+        thread.join()
+
+    with app.app_context():
+        journal_mode = db.session.execute(text("PRAGMA journal_mode")).scalar()
+        plans = {}
+        for query, index in INDEXED_LOOKUPS:
+            plan = " ".join(row[-1] for row in db.session.execute(text(f"EXPLAIN QUERY PLAN {query}")))
+            plans[index] = index in plan
+
+    print(json.dumps({
+        "journal_mode": journal_mode,
+        "elapsed": elapsed,
+        "flows": len(latencies["worker"]),
+        "latencies": latencies,
+        "errors": errors,
+        "plans": plans,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent database writes")
+    parser.add_argument("--writers", type=int, default=16)
+    parser.add_argument("--pollers", type=int, default=8)
+    parser.add_argument("--flows", type=int, default=100, help="Paid uploads per writer")
+    parser.add_argument("--poll-interval", type=float, default=0.005)
+    parser.add_argument("--result-bytes", type=int, default=8192, help="Size of each stored analysis")
+    parser.add_argument("--configuration", choices=sorted(CONFIGURATIONS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.configuration:
+        run_configuration(args)
+        return
+
+    plans = {}
+    print(f"{args.writers} writers x {args.flows} paid uploads, {args.pollers} status pollers")
+    print(
+        f"{'configuration':<17} {'journal':>7} {'flows/s':>8} {'step':<8} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'locked':>7}"
+    )
+    for name, overrides in CONFIGURATIONS.items():
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {
+                **os.environ,
+                "OPENAI_API_KEY": "benchmark",
+                "DATABASE_URL": f"sqlite:///{os.path.join(tmp, 'benchmark.db')}",
+                "TEXT_BLOB_DIR": os.path.join(tmp, "text_blobs"),
+                **overrides,
+            }
+            command = [sys.executable, os.path.abspath(__file__), "--configuration", name]
+            command += sys.argv[1:]
+            output = subprocess.run(command, env=env, capture_output=True, text=True, check=True)
+        stats = json.loads(output.stdout.strip().splitlines()[-1])
+        plans = stats["plans"]
+        for row, (step, values) in enumerate(stats["latencies"].items()):
+            prefix = (
+                f"{name:<17} {stats['journal_mode']:>7} {stats['flows'] / stats['elapsed']:>8.0f}"
+                if row == 0 else " " * 34
+            )
+            locked = f"{stats['errors']['locked']:>7}" if row == 0 else ""
+            print(
+                f"{prefix} {step:<8} {statistics.median(values or [0]) * 1000:>8.1f} "
+                f"{percentile(values, 0.95) * 1000:>8.1f} {locked}"
+            )
+        if stats["errors"]["other"]:
+            print(f"{'':<17} {stats['errors']['other']} other database error(s)")
+
+    print("query plans: " + ", ".join(
+        f"{index} {'used' if used else 'NOT used'}" for index, used in plans.items()
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""
+@file-overview A local stand-in for the OpenAI chat completions API.
+@filepath benchmarks/fake_openai.py
+
+Serves POST /v1/chat/completions (streaming and non-streaming) with a canned
+Chinese analysis that contains every section requested in the system prompt,
+so the analyzer can be exercised without network access or API spend.
+
+Faults can be injected to exercise the resilient client layer: a fraction of
+requests is answered with 429 (with a Retry-After header) or 500, and another
+fraction is answered only after a long delay.
+
+Usage:
+    python benchmarks/fake_openai.py --port 8765 --latency 0.5 --chunk-delay 0.01
+    python benchmarks/fake_openai.py --rate-limit-rate 0.2 --retry-after 1 --slow-rate 0.05 --slow-latency 30
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=test python main.py
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SECTIONS = ["摘要", "人物分析", "情节分析", "主题分析", "可读性评估", "情感分析", "风格和一致性"]
+
+
+def build_completion_text(system_prompt):
+    """
+    Build a canned analysis containing each section named in the system prompt.
+
+    Args:
+        system_prompt (str): The system prompt sent by the analyzer.
+
+    Returns:
+        str: The completion text.
+    """
+    requested = [section for section in SECTIONS if f"{section}：" in system_prompt]
+    parts = []
+    for section in requested or SECTIONS:
+        parts.append(
+            f"{section}：\n"
+            f"1. 这是关于{section}的第一段分析，内容具体且有见地。\n"
+            f"这是关于{section}的第二段分析，进一步展开论述。\n"
+        )
+    return "\n".join(parts)
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """Request handler implementing the chat completions endpoint."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+
+        fault = self.server.pick_fault()
+        if fault == "rate_limit":
+            self._send_json(
+                429,
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                {"Retry-After": f"{self.server.retry_after:g}"},
+            )
+            return
+        if fault == "error":
+            self._send_json(500, {"error": {"message": "The server had an error", "type": "server_error"}})
+            return
+        messages = request.get("messages", [])
+        system_prompt = next(
+            (m["content"] for m in messages if m.get("role") == "system"), ""
+        )
+        user_content = next(
+            (m["content"] for m in messages if m.get("role") == "user"), ""
+        )
+        text = build_completion_text(system_prompt)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        model = request.get("model", "gpt-4o")
+        usage = {
+            "prompt_tokens": len(system_prompt) + len(user_content),
+            "completion_tokens": len(text),
+            "total_tokens": len(system_prompt) + len(user_content) + len(text),
+        }
+
+        time.sleep(self.server.slow_latency if fault == "slow" else self.server.latency)
+
+        if not request.get("stream"):
+            self._send_json(
+                200,
+                {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": text},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": usage,
+                },
+            )
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        def send_chunk(delta, finish_reason=None):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [
+                    {"index": 0, "delta": delta, "finish_reason": finish_reason}
+                ],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        send_chunk({"role": "assistant", "content": ""})
+        step = self.server.chunk_size
+        for start in range(0, len(text), step):
+            send_chunk({"content": text[start:start + step]})
+            time.sleep(self.server.chunk_delay)
+        send_chunk({}, finish_reason="stop")
+        if (request.get("stream_options") or {}).get("include_usage"):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [],
+                "usage": usage,
+            }
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    """Threaded server holding the latency and fault-injection settings."""
+
+    daemon_threads = True
+
+    def __init__(self, address, latency, chunk_delay, chunk_size, verbose, faults, seed):
+        super().__init__(address, FakeOpenAIHandler)
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.chunk_size = chunk_size
+        self.verbose = verbose
+        self.rate_limit_rate = faults.get("rate_limit_rate", 0.0)
+        self.retry_after = faults.get("retry_after", 1.0)
+        self.error_rate = faults.get("error_rate", 0.0)
+        self.slow_rate = faults.get("slow_rate", 0.0)
+        self.slow_latency = faults.get("slow_latency", 30.0)
+        self.stats = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def pick_fault(self):
+        """Draw the fault of the next request: "rate_limit", "error", "slow" or None."""
+        with self._lock:
+            draw = self._random.random()
+            fault = None
+            for name, rate in (
+                ("rate_limit", self.rate_limit_rate),
+                ("error", self.error_rate),
+                ("slow", self.slow_rate),
+            ):
+                if draw < rate:
+                    fault = name
+                    break
+                draw -= rate
+            self.stats["requests"] += 1
+            self.stats[fault or "ok"] += 1
+            return fault
+
+
+def make_server(
+    host="127.0.0.1",
+    port=0,
+    latency=0.0,
+    chunk_delay=0.0,
+    chunk_size=8,
+    verbose=False,
+    rate_limit_rate=0.0,
+    retry_after=1.0,
+    error_rate=0.0,
+    slow_rate=0.0,
+    slow_latency=30.0,
+    seed=None,
+):
+    """
+    Create a fake OpenAI server (call serve_forever() to run it).
+
+    Args:
+        host (str): Interface to bind.
+        port (int): Port to bind, 0 picks a free port.
+        latency (float): Seconds to wait before responding.
+        chunk_delay (float): Seconds between streamed chunks.
+        chunk_size (int): Characters per streamed chunk.
+        verbose (bool): Log every request.
+        rate_limit_rate (float): Fraction of requests answered with 429.
+        retry_after (float): Retry-After seconds sent with each 429.
+        error_rate (float): Fraction of requests answered with 500.
+        slow_rate (float): Fraction of requests answered after slow_latency.
+        slow_latency (float): Seconds to wait before a slow response.
+        seed (int): Seed of the fault draws, for reproducible runs.
+
+    Returns:
+        FakeOpenAIServer: The configured server; server.stats counts the
+            requests and injected faults.
+    """
+    faults = {
+        "rate_limit_rate": rate_limit_rate,
+        "retry_after": retry_after,
+        "error_rate": error_rate,
+        "slow_rate": slow_rate,
+        "slow_latency": slow_latency,
+    }
+    return FakeOpenAIServer((host, port), latency, chunk_delay, chunk_size, verbose, faults, seed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before the first byte")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="Seconds between streamed chunks")
+    parser.add_argument("--chunk-size", type=int, default=8, help="Characters per streamed chunk")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of 429 responses")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After of 429 responses")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of 500 responses")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Fraction of slow responses")
+    parser.add_argument("--slow-latency", type=float, default=30.0, help="Seconds before a slow response")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    server = make_server(
+        args.host,
+        args.port,
+        args.latency,
+        args.chunk_delay,
+        args.chunk_size,
+        args.verbose,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        error_rate=args.error_rate,
+        slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency,
+        seed=args.seed,
+    )
+    print(f"Fake OpenAI listening on http://{args.host}:{server.server_port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,366 @@
+"""
+@file-overview A local, in-memory stand-in for an S3-compatible object store (MinIO-style).
+@filepath benchmarks/fake_s3.py
+
+Serves the path-style requests utils/storage.py sends through boto3: bucket
+creation, PutObject, CopyObject, GetObject, HeadObject, DeleteObject,
+ListObjectsV2 and multipart uploads, so STORAGE_BACKEND=s3 can be exercised,
+and several app nodes can share one store, without network access or a MinIO
+server. Request signatures are not checked. Bodies sent with the aws-chunked
+content encoding (boto3's default checksums) are decoded.
+
+Latency and a fraction of S3-style 500 responses can be injected.
+
+Usage:
+    python benchmarks/fake_s3.py --port 8767 --latency 0.01
+    STORAGE_BACKEND=s3 STORAGE_S3_ENDPOINT_URL=http://127.0.0.1:8767 STORAGE_S3_BUCKET=dreamer \\
+        AWS_ACCESS_KEY_ID=fake AWS_SECRET_ACCESS_KEY=fake python main.py
+"""
+
+import argparse
+import hashlib
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+LIST_PAGE_SIZE = 1000
+
+
+def decode_aws_chunked(body):
+    """
+    Decode an aws-chunked request body ("<hex size>[;ext]\\r\\n<data>\\r\\n"..., then trailers).
+
+    Args:
+        body (bytes): The encoded body.
+
+    Returns:
+        bytes: The payload.
+    """
+    payload = bytearray()
+    position = 0
+    while True:
+        line_end = body.index(b"\r\n", position)
+        size = int(body[position:line_end].split(b";", 1)[0], 16)
+        position = line_end + 2
+        if size == 0:
+            return bytes(payload)
+        payload += body[position:position + size]
+        position += size + 2
+
+
+class StoredObject:
+    """Content and metadata of one object."""
+
+    def __init__(self, data):
+        self.data = data
+        self.etag = f'"{hashlib.md5(data).hexdigest()}"'
+        self.modified = time.time()
+
+
+class FakeS3Handler(BaseHTTPRequestHandler):
+    """Request handler implementing the object endpoints."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _target(self):
+        """Split the request into (bucket, key, query); key is "" for bucket requests."""
+        url = urlsplit(self.path)
+        bucket, _, key = url.path.lstrip("/").partition("/")
+        return unquote(bucket), unquote(key), parse_qs(url.query, keep_blank_values=True)
+
+    def _read_body(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if "aws-chunked" in self.headers.get("Content-Encoding", ""):
+            body = decode_aws_chunked(body)
+        return body
+
+    def _send(self, status, body=b"", headers=None, content_type="application/xml"):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("x-amz-request-id", uuid.uuid4().hex[:16].upper())
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _send_xml(self, status, xml):
+        self._send(status, b'<?xml version="1.0" encoding="UTF-8"?>\n' + xml.encode("utf-8"))
+
+    def _send_error(self, status, code, message):
+        self._send_xml(status, f"<Error><Code>{code}</Code><Message>{escape(message)}</Message></Error>")
+
+    def _inject(self, operation):
+        """Sleep for the configured latency; return True if a 500 was sent instead."""
+        fault = self.server.pick_fault(operation)
+        time.sleep(self.server.latency)
+        if fault == "error":
+            self._send_error(500, "InternalError", "We encountered an internal error. Please try again.")
+            return True
+        return False
+
+    def _object(self, bucket, key):
+        """Return the stored object, or send NoSuchBucket/NoSuchKey and return None."""
+        with self.server.lock:
+            objects = self.server.buckets.get(bucket)
+            stored = objects.get(key) if objects is not None else None
+        if objects is None:
+            self._send_error(404, "NoSuchBucket", "The specified bucket does not exist")
+        elif stored is None:
+            self._send_error(404, "NoSuchKey", "The specified key does not exist.")
+        return stored
+
+    def _store(self, bucket, key, data):
+        with self.server.lock:
+            if bucket not in self.server.buckets:
+                return None
+            stored = self.server.buckets[bucket][key] = StoredObject(data)
+            return stored
+
+    def do_HEAD(self):
+        bucket, key, _ = self._target()
+        if self._inject("head_object"):
+            return
+        stored = self._object(bucket, key)
+        if stored is not None:
+            self._send_object(stored, body=False)
+
+    def do_GET(self):
+        bucket, key, query = self._target()
+        if not key:
+            if self._inject("list_objects"):
+                return
+            self._list(bucket, query)
+            return
+        if self._inject("get_object"):
+            return
+        stored = self._object(bucket, key)
+        if stored is not None:
+            self._send_object(stored, body=True)
+
+    def _send_object(self, stored, body):
+        headers = {
+            "ETag": stored.etag,
+            "Last-Modified": formatdate(stored.modified, usegmt=True),
+        }
+        if body:
+            self._send(200, stored.data, headers, "application/octet-stream")
+            return
+        self.send_response(200)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(stored.data)))
+        self.end_headers()
+
+    def _list(self, bucket, query):
+        prefix = query.get("prefix", [""])[0]
+        start_after = query.get("continuation-token", query.get("start-after", [""]))[0]
+        max_keys = min(int(query.get("max-keys", [LIST_PAGE_SIZE])[0]), LIST_PAGE_SIZE)
+        with self.server.lock:
+            objects = self.server.buckets.get(bucket)
+            if objects is None:
+                self._send_error(404, "NoSuchBucket", "The specified bucket does not exist")
+                return
+            keys = sorted(key for key in objects if key.startswith(prefix) and key > start_after)
+            page = [(key, objects[key]) for key in keys[:max_keys]]
+        truncated = len(keys) > max_keys
+        contents = "".join(
+            "<Contents>"
+            f"<Key>{escape(key)}</Key>"
+            f"<LastModified>{datetime.fromtimestamp(stored.modified, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]}Z</LastModified>"
+            f"<ETag>{escape(stored.etag)}</ETag><Size>{len(stored.data)}</Size>"
+            "<StorageClass>STANDARD</StorageClass></Contents>"
+            for key, stored in page
+        )
+        token = f"<NextContinuationToken>{escape(page[-1][0])}</NextContinuationToken>" if truncated else ""
+        self._send_xml(
+            200,
+            '<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+            f"<Name>{escape(bucket)}</Name><Prefix>{escape(prefix)}</Prefix>"
+            f"<KeyCount>{len(page)}</KeyCount><MaxKeys>{max_keys}</MaxKeys>"
+            f"<IsTruncated>{'true' if truncated else 'false'}</IsTruncated>{token}{contents}"
+            "</ListBucketResult>",
+        )
+
+    def do_PUT(self):
+        bucket, key, query = self._target()
+        body = self._read_body()
+        if not key:
+            with self.server.lock:
+                self.server.buckets.setdefault(bucket, {})
+            self._send(200, headers={"Location": f"/{bucket}"})
+            return
+
+        if "uploadId" in query:
+            if self._inject("upload_part"):
+                return
+            upload_id, number = query["uploadId"][0], int(query["partNumber"][0])
+            with self.server.lock:
+                parts = self.server.uploads.get(upload_id)
+                if parts is not None:
+                    parts[number] = body
+            if parts is None:
+                self._send_error(404, "NoSuchUpload", "The specified upload does not exist.")
+                return
+            self._send(200, headers={"ETag": f'"{hashlib.md5(body).hexdigest()}"'})
+            return
+
+        source = self.headers.get("x-amz-copy-source")
+        if source is not None:
+            if self._inject("copy_object"):
+                return
+            source_bucket, _, source_key = unquote(source.split("?", 1)[0]).lstrip("/").partition("/")
+            stored = self._object(source_bucket, source_key)
+            if stored is None:
+                return
+            copied = self._store(bucket, key, stored.data)
+            modified = datetime.fromtimestamp(copied.modified, timezone.utc).isoformat()
+            self._send_xml(
+                200,
+                f"<CopyObjectResult><LastModified>{modified}</LastModified>"
+                f"<ETag>{escape(copied.etag)}</ETag></CopyObjectResult>",
+            )
+            return
+
+        if self._inject("put_object"):
+            return
+        stored = self._store(bucket, key, body)
+        if stored is None:
+            self._send_error(404, "NoSuchBucket", "The specified bucket does not exist")
+            return
+        self._send(200, headers={"ETag": stored.etag})
+
+    def do_POST(self):
+        bucket, key, query = self._target()
+        body = self._read_body()
+        if "uploads" in query:
+            if self._inject("create_multipart_upload"):
+                return
+            upload_id = uuid.uuid4().hex
+            with self.server.lock:
+                self.server.uploads[upload_id] = {}
+            self._send_xml(
+                200,
+                f"<InitiateMultipartUploadResult><Bucket>{escape(bucket)}</Bucket>"
+                f"<Key>{escape(key)}</Key><UploadId>{upload_id}</UploadId>"
+                "</InitiateMultipartUploadResult>",
+            )
+            return
+        if "uploadId" in query:
+            if self._inject("complete_multipart_upload"):
+                return
+            numbers = [
+                int(element.text)
+                for element in ElementTree.fromstring(body).iter()
+                if element.tag.endswith("PartNumber")
+            ]
+            with self.server.lock:
+                parts = self.server.uploads.pop(query["uploadId"][0], None)
+            if parts is None:
+                self._send_error(404, "NoSuchUpload", "The specified upload does not exist.")
+                return
+            stored = self._store(bucket, key, b"".join(parts[number] for number in numbers))
+            self._send_xml(
+                200,
+                f"<CompleteMultipartUploadResult><Bucket>{escape(bucket)}</Bucket>"
+                f"<Key>{escape(key)}</Key><ETag>{escape(stored.etag)}</ETag>"
+                "</CompleteMultipartUploadResult>",
+            )
+            return
+        self._send_error(400, "InvalidRequest", f"Unsupported request (POST: {self.path})")
+
+    def do_DELETE(self):
+        bucket, key, query = self._target()
+        if "uploadId" in query:
+            with self.server.lock:
+                self.server.uploads.pop(query["uploadId"][0], None)
+            self._send(204)
+            return
+        if self._inject("delete_object"):
+            return
+        with self.server.lock:
+            self.server.buckets.get(bucket, {}).pop(key, None)
+        self._send(204)
+
+
+class FakeS3Server(ThreadingHTTPServer):
+    """Threaded server holding the buckets and the latency and fault settings."""
+
+    daemon_threads = True
+
+    def __init__(self, address, latency, error_rate, verbose, seed, buckets):
+        super().__init__(address, FakeS3Handler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.verbose = verbose
+        self.buckets = {bucket: {} for bucket in buckets}
+        self.uploads = {}  # Multipart upload id -> {part number: bytes}
+        self.stats = Counter()
+        self.lock = threading.Lock()
+        self._random = random.Random(seed)
+
+    @property
+    def endpoint_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def pick_fault(self, operation):
+        """Draw the fault of the next request: "error" or None."""
+        with self.lock:
+            fault = "error" if self._random.random() < self.error_rate else None
+            self.stats["requests"] += 1
+            self.stats[operation] += 1
+            self.stats[fault or "ok"] += 1
+            return fault
+
+
+def make_server(host="127.0.0.1", port=0, latency=0.0, error_rate=0.0, verbose=False, seed=None, buckets=()):
+    """
+    Create a fake S3 server (call serve_forever() to run it).
+
+    Args:
+        host (str): Interface to bind.
+        port (int): Port to bind, 0 picks a free port.
+        latency (float): Seconds to wait before responding.
+        error_rate (float): Fraction of requests answered with 500.
+        verbose (bool): Log every request.
+        seed (int): Seed of the fault draws, for reproducible runs.
+        buckets (Iterable[str]): Buckets created at startup.
+
+    Returns:
+        FakeS3Server: The configured server; server.stats counts the requests
+            by operation and the injected faults.
+    """
+    return FakeS3Server((host, port), latency, error_rate, verbose, seed, buckets)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before responding")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of 500 responses")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--bucket", action="append", default=["dreamer"], help="Bucket to create")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.latency, args.error_rate, args.verbose, args.seed, args.bucket)
+    print(f"Fake S3 listening on {server.endpoint_url} (buckets: {', '.join(args.bucket)})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,330 @@
+"""
+@file-overview A local stand-in for the Stripe payment intents API.
+@filepath benchmarks/fake_stripe.py
+
+Serves POST /v1/payment_intents and GET /v1/payment_intents/<id> with
+in-memory intents, so /upload and /payment/success can be load tested without
+network access or a Stripe account. Created intents are reported as
+"succeeded" when retrieved, as if the customer had paid through Stripe.js.
+POST /v1/payment_intents/<id> (amount update) and .../cancel are accepted
+while the intent is unpaid, like on Stripe.
+
+POST /v1/payment_intents/<id>/confirm stands in for the customer paying: the
+intent succeeds and, when a webhook URL is configured, a
+payment_intent.succeeded event signed with the webhook secret (the same
+scheme as Stripe's Stripe-Signature header) is delivered to it. sign_payload
+and deliver_webhook can also be used on their own to send locally signed
+events.
+
+Latency and a fraction of Stripe-style 500 responses can be injected.
+
+Usage:
+    python benchmarks/fake_stripe.py --port 8766 --latency 0.2 --error-rate 0.01
+    python benchmarks/fake_stripe.py --webhook-url http://127.0.0.1:5001/stripe/webhook \\
+        --webhook-secret whsec_test
+    STRIPE_API_BASE=http://127.0.0.1:8766 STRIPE_SECRET_KEY=sk_test_fake python main.py
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+
+def sign_payload(payload, secret, timestamp=None):
+    """
+    Build the Stripe-Signature header of a webhook payload.
+
+    Args:
+        payload (bytes): The request body.
+        secret (str): The webhook signing secret (whsec_...).
+        timestamp (int): Signature time, defaults to now.
+
+    Returns:
+        str: The header value, "t=<timestamp>,v1=<hex HMAC-SHA256>".
+    """
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    signed = f"{timestamp}.".encode("utf-8") + payload
+    signature = hmac.new(secret.encode("utf-8"), signed, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def build_event(event_type, obj):
+    """Wrap an API object in a Stripe event."""
+    return {
+        "id": f"evt_{uuid.uuid4().hex[:24]}",
+        "object": "event",
+        "type": event_type,
+        "created": int(time.time()),
+        "livemode": False,
+        "data": {"object": obj},
+    }
+
+
+def deliver_webhook(url, secret, event, timeout=10):
+    """
+    POST a signed event to a webhook endpoint.
+
+    Args:
+        url (str): The webhook endpoint.
+        secret (str): The webhook signing secret.
+        event (dict): The event, see build_event.
+        timeout (float): Request timeout in seconds.
+
+    Returns:
+        int: The HTTP status of the response (0 if the request failed).
+    """
+    payload = json.dumps(event).encode("utf-8")
+    request = urllib.request.Request(
+        url,
+        data=payload,
+        headers={"Content-Type": "application/json", "Stripe-Signature": sign_payload(payload, secret)},
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return 0
+
+
+class FakeStripeHandler(BaseHTTPRequestHandler):
+    """Request handler implementing the payment intents endpoints."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Request-Id", f"req_{uuid.uuid4().hex[:14]}")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, error_type, message):
+        self._send_json(status, {"error": {"type": error_type, "message": message}})
+
+    def _inject(self):
+        """Sleep for the configured latency; return True if a 500 was sent instead."""
+        fault = self.server.pick_fault()
+        time.sleep(self.server.latency)
+        if fault == "error":
+            self._send_error(500, "api_error", "An unknown error occurred")
+            return True
+        return False
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        params = dict(parse_qsl(self.rfile.read(length).decode("utf-8")))
+        path = self.path.rstrip("/")
+        if path.startswith("/v1/payment_intents/") and path.endswith("/confirm"):
+            self._confirm(path[len("/v1/payment_intents/"):-len("/confirm")])
+            return
+        if path.startswith("/v1/payment_intents/") and path.endswith("/cancel"):
+            self._change(path[len("/v1/payment_intents/"):-len("/cancel")], {"status": "canceled"})
+            return
+        if path.startswith("/v1/payment_intents/"):
+            changes = {"amount": int(params["amount"])} if "amount" in params else {}
+            self._change(path[len("/v1/payment_intents/"):], changes)
+            return
+        if path != "/v1/payment_intents":
+            self._send_error(404, "invalid_request_error", f"Unrecognized request URL (POST: {self.path})")
+            return
+        if self._inject():
+            return
+        if "amount" not in params or "currency" not in params:
+            self._send_error(400, "invalid_request_error", "Missing required param: amount or currency.")
+            return
+        intent_id = f"pi_{uuid.uuid4().hex[:24]}"
+        intent = {
+            "id": intent_id,
+            "object": "payment_intent",
+            "amount": int(params["amount"]),
+            "currency": params["currency"],
+            "client_secret": f"{intent_id}_secret_{uuid.uuid4().hex[:24]}",
+            "created": int(time.time()),
+            "livemode": False,
+            "metadata": {
+                key[len("metadata["):-1]: value
+                for key, value in params.items()
+                if key.startswith("metadata[")
+            },
+            "status": "requires_payment_method",
+        }
+        with self.server.lock:
+            self.server.intents[intent_id] = intent
+        self._send_json(200, intent)
+
+    def _change(self, intent_id, changes):
+        """Update or cancel an intent the customer has not paid yet."""
+        if self._inject():
+            return
+        with self.server.lock:
+            intent = self.server.intents.get(intent_id)
+            status = intent["status"] if intent is not None else None
+            if status == "requires_payment_method":
+                intent.update(changes)
+                intent = dict(intent)
+        if intent is None:
+            self._send_error(404, "invalid_request_error", f"No such payment_intent: '{intent_id}'")
+        elif status != "requires_payment_method":
+            self._send_error(
+                400,
+                "invalid_request_error",
+                f"This PaymentIntent's status is {status}, it can no longer be changed.",
+            )
+        else:
+            self._send_json(200, intent)
+
+    def _confirm(self, intent_id):
+        """Mark an intent succeeded and deliver payment_intent.succeeded."""
+        if self._inject():
+            return
+        with self.server.lock:
+            intent = self.server.intents.get(intent_id)
+            if intent is not None:
+                intent["status"] = "succeeded"
+                intent = dict(intent)
+        if intent is None:
+            self._send_error(404, "invalid_request_error", f"No such payment_intent: '{intent_id}'")
+            return
+        if self.server.webhook_url:
+            threading.Thread(
+                target=self.server.send_event,
+                args=("payment_intent.succeeded", intent),
+                daemon=True,
+            ).start()
+        self._send_json(200, intent)
+
+    def do_GET(self):
+        prefix = "/v1/payment_intents/"
+        path = self.path.split("?", 1)[0]
+        if not path.startswith(prefix):
+            self._send_error(404, "invalid_request_error", f"Unrecognized request URL (GET: {self.path})")
+            return
+        if self._inject():
+            return
+        intent_id = path[len(prefix):]
+        with self.server.lock:
+            intent = self.server.intents.get(intent_id)
+            if intent is not None:
+                if intent["status"] != "canceled":
+                    intent["status"] = "succeeded"
+                intent = dict(intent)
+        if intent is None:
+            self._send_error(404, "invalid_request_error", f"No such payment_intent: '{intent_id}'")
+            return
+        self._send_json(200, intent)
+
+
+class FakeStripeServer(ThreadingHTTPServer):
+    """Threaded server holding the intents and the latency and fault settings."""
+
+    daemon_threads = True
+
+    def __init__(self, address, latency, error_rate, verbose, seed, webhook):
+        super().__init__(address, FakeStripeHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.verbose = verbose
+        self.webhook_url = webhook.get("url")
+        self.webhook_secret = webhook.get("secret")
+        self.webhook_delay = webhook.get("delay", 0.0)
+        self.intents = {}
+        self.stats = Counter()
+        self.lock = threading.Lock()
+        self._random = random.Random(seed)
+
+    def pick_fault(self):
+        """Draw the fault of the next request: "error" or None."""
+        with self.lock:
+            fault = "error" if self._random.random() < self.error_rate else None
+            self.stats["requests"] += 1
+            self.stats[fault or "ok"] += 1
+            return fault
+
+    def send_event(self, event_type, obj):
+        """Deliver a signed event to the webhook URL after webhook_delay seconds."""
+        time.sleep(self.webhook_delay)
+        status = deliver_webhook(self.webhook_url, self.webhook_secret, build_event(event_type, obj))
+        with self.lock:
+            self.stats[f"webhook_{status}"] += 1
+
+
+def make_server(
+    host="127.0.0.1",
+    port=0,
+    latency=0.0,
+    error_rate=0.0,
+    verbose=False,
+    seed=None,
+    webhook_url=None,
+    webhook_secret=None,
+    webhook_delay=0.0,
+):
+    """
+    Create a fake Stripe server (call serve_forever() to run it).
+
+    Args:
+        host (str): Interface to bind.
+        port (int): Port to bind, 0 picks a free port.
+        latency (float): Seconds to wait before responding.
+        error_rate (float): Fraction of requests answered with 500.
+        verbose (bool): Log every request.
+        seed (int): Seed of the fault draws, for reproducible runs.
+        webhook_url (str): Endpoint receiving payment_intent.succeeded events.
+        webhook_secret (str): Secret the events are signed with.
+        webhook_delay (float): Seconds between a confirmation and its event.
+
+    Returns:
+        FakeStripeServer: The configured server; server.stats counts the
+            requests, injected faults and webhook deliveries by status.
+    """
+    webhook = {"url": webhook_url, "secret": webhook_secret, "delay": webhook_delay}
+    return FakeStripeServer((host, port), latency, error_rate, verbose, seed, webhook)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before responding")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of 500 responses")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--webhook-url", help="Endpoint receiving payment_intent.succeeded")
+    parser.add_argument("--webhook-secret", default="whsec_test", help="Webhook signing secret")
+    parser.add_argument("--webhook-delay", type=float, default=0.0, help="Seconds before each event")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    server = make_server(
+        args.host,
+        args.port,
+        args.latency,
+        args.error_rate,
+        args.verbose,
+        args.seed,
+        webhook_url=args.webhook_url,
+        webhook_secret=args.webhook_secret,
+        webhook_delay=args.webhook_delay,
+    )
+    print(f"Fake Stripe listening on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
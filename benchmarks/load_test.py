@@ -0,0 +1,586 @@
+"""
+@file-overview End-to-end load test of /upload and /payment/success against local fakes.
+@filepath benchmarks/load_test.py
+
+Starts the fake OpenAI and Stripe servers in-process, launches the app
+(Flask's threaded server, or uvicorn with asgi.py) as a subprocess on a
+temporary database, upload folder and debug directory, then runs the checkout
+flow at each requested concurrency level:
+
+1. POST /upload with a freshly generated PDF or DOCX (unique bytes, so the
+   extraction and result caches never hit),
+2. POST /payment/success with the intent created by the upload,
+3. with --wait-analysis, poll the job result until the analysis finishes.
+
+With --webhooks the app gets a webhook secret and the fake Stripe server
+delivers signed payment_intent.succeeded events to /stripe/webhook: each flow
+confirms its intent at the fake (as Stripe.js would) before step 2, so the
+analysis is queued by the webhook and /payment/success only replays it.
+
+With --batch-size N each flow is a batch instead: POST /batches with N
+documents, POST /batches/<id>/payment with the intent of the whole batch and,
+with --wait-analysis, poll the batch status until every document's analysis
+has finished. Batch analyses run at most BATCH_ANALYSIS_CONCURRENCY at a time
+(--batch-concurrency), so with the async workers a batch takes about
+N / BATCH_ANALYSIS_CONCURRENCY OpenAI round trips rather than N.
+
+With --nodes N, N app processes share the database but have their own upload,
+text and cache directories, like servers behind a load balancer without sticky
+sessions: each flow uploads to one node and pays and polls on the next.
+--storage s3 stores uploads and text in the in-process fake S3 server
+(benchmarks/fake_s3.py), shared by every node; with the default local storage
+the nodes cannot read each other's files.
+
+Each scenario reports p50/p95/p99 latency per step, flows and requests per
+second, errors and the peak RSS of the server process and its children (the
+extraction pool). --json saves the report; --baseline compares the p95 of each
+step with a saved report and exits non-zero on a regression beyond
+--tolerance, so process_document and analyze_document changes can be checked
+before they ship.
+
+Usage:
+    python benchmarks/load_test.py --concurrency 1 4 16 --flows 32 --json report.json
+    python benchmarks/load_test.py --server asgi --wait-analysis --baseline report.json --tolerance 0.2
+    python benchmarks/load_test.py --webhooks --wait-analysis
+    python benchmarks/load_test.py --nodes 2 --storage s3 --wait-analysis
+    python benchmarks/load_test.py --server asgi --batch-size 50 --concurrency 1 --flows 1 --wait-analysis
+"""
+
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_openai  # noqa: E402
+import fake_s3  # noqa: E402
+import fake_stripe  # noqa: E402
+from corpus import parse_specs, write_document  # noqa: E402
+
+MIME_TYPES = {
+    "pdf": "application/pdf",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+}
+STEPS = ["upload", "payment_success", "analysis"]
+WEBHOOK_SECRET = "whsec_load_test"
+S3_BUCKET = "load-test"
+
+
+def _percentile(values, percent):
+    if not values:
+        return None
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[percent - 1]
+
+
+def _read_rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _process_tree(root_pid):
+    """Return root_pid and the pids of all its descendants (Linux /proc)."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as stat:
+                # The command name may contain spaces; the ppid follows its closing parenthesis
+                ppid = int(stat.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    pids, pending = [], [root_pid]
+    while pending:
+        pid = pending.pop()
+        pids.append(pid)
+        pending.extend(children.get(pid, []))
+    return pids
+
+
+class RssSampler:
+    """Samples the summed RSS of process trees in a background thread."""
+
+    def __init__(self, pids, interval=0.1):
+        self.pids = pids
+        self.interval = interval
+        self.peak_kb = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss = sum(_read_rss_kb(pid) for root in self.pids for pid in _process_tree(root))
+            self.peak_kb = max(self.peak_kb, rss)
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread.start()
+
+    def reset(self):
+        self.peak_kb = 0
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def start_app(args, workdir, openai_url, stripe_url, node=0, s3_url=None):
+    """
+    Launch one app node as a subprocess and wait until it answers.
+
+    Args:
+        node (int): Index of the node; it listens on args.port + node and,
+            when several nodes run, keeps its files under workdir/node<index>.
+        s3_url (str): Endpoint of the fake S3 server (--storage s3), or None.
+    """
+    port = args.port + node
+    node_dir = os.path.join(workdir, f"node{node}") if args.nodes > 1 else workdir
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "benchmark",
+        "OPENAI_BASE_URL": openai_url,
+        "STRIPE_SECRET_KEY": "sk_test_benchmark",
+        "STRIPE_PUBLISHABLE_KEY": "pk_test_benchmark",
+        "STRIPE_API_BASE": stripe_url,
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'benchmark.db')}",
+        "UPLOAD_FOLDER": os.path.join(node_dir, "uploads"),
+        "DEBUG_DIR": os.path.join(node_dir, "debug"),
+        "TEXT_BLOB_DIR": os.path.join(node_dir, "text_blobs"),
+        "STORAGE_CACHE_DIR": os.path.join(node_dir, "storage_cache"),
+        "ANALYSIS_CACHE_ENABLED": "false",
+        "ANALYSIS_WORKER_MODE": "threads" if args.server == "wsgi" else "async",
+    }
+    if args.webhooks:
+        env["STRIPE_WEBHOOK_SECRET"] = WEBHOOK_SECRET
+    if args.batch_concurrency:
+        env["BATCH_ANALYSIS_CONCURRENCY"] = str(args.batch_concurrency)
+    if s3_url:
+        env.update(
+            STORAGE_BACKEND="s3",
+            STORAGE_S3_ENDPOINT_URL=s3_url,
+            STORAGE_S3_BUCKET=S3_BUCKET,
+            AWS_ACCESS_KEY_ID="load-test",
+            AWS_SECRET_ACCESS_KEY="load-test",
+        )
+    if node == 0:
+        subprocess.run(
+            [sys.executable, "-m", "flask", "--app", "app:create_app", "init-db"],
+            cwd=PROJECT_DIR,
+            env=env,
+            check=True,
+            capture_output=True,
+        )
+    if args.server == "wsgi":
+        command = [
+            sys.executable,
+            "-c",
+            "from wsgi import application; "
+            f"application.run(host='127.0.0.1', port={port}, threaded=True, use_reloader=False)",
+        ]
+    else:
+        command = [
+            sys.executable, "-m", "uvicorn", "asgi:application",
+            "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning",
+        ]
+    log = open(os.path.join(workdir, f"server{node if args.nodes > 1 else ''}.log"), "w")
+    process = subprocess.Popen(command, cwd=PROJECT_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + args.startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"App exited with status {process.returncode}, see {log.name}")
+        try:
+            if httpx.get(f"{base_url}/", timeout=1).status_code == 200:
+                return process, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"App did not start within {args.startup_timeout}s, see {log.name}")
+
+
+def run_flow(client, path, wait_analysis, poll_interval, timeout, stripe_url=None, payment_client=None):
+    """
+    Run one checkout flow.
+
+    Args:
+        stripe_url (str): Fake Stripe base URL to confirm the intent at before
+            /payment/success (--webhooks), or None.
+        payment_client (httpx.Client): Client of the node that confirms the
+            payment and serves the result, defaults to client.
+
+    Returns:
+        Tuple[dict, int, str]: Step latencies in seconds, HTTP requests sent,
+            and the step that failed (None on success).
+    """
+    latencies, requests = {}, 0
+    file_type = path.rsplit(".", 1)[1]
+
+    started = time.perf_counter()
+    with open(path, "rb") as document:
+        response = client.post(
+            "/upload",
+            files={"file": (os.path.basename(path), document, MIME_TYPES[file_type])},
+        )
+    requests += 1
+    if response.status_code != 200:
+        return latencies, requests, "upload"
+    latencies["upload"] = time.perf_counter() - started
+    upload = response.json()
+    payment_intent_id = upload["client_secret"].split("_secret_")[0]
+    if stripe_url:
+        httpx.post(f"{stripe_url}/v1/payment_intents/{payment_intent_id}/confirm").raise_for_status()
+
+    client = payment_client or client
+    started = time.perf_counter()
+    response = client.post(
+        "/payment/success",
+        json={
+            "payment_intent_id": payment_intent_id,
+            "document_id": upload["document_id"],
+            "analysis_options": {},
+        },
+    )
+    requests += 1
+    if response.status_code not in (200, 202):
+        return latencies, requests, "payment_success"
+    latencies["payment_success"] = time.perf_counter() - started
+    if not wait_analysis:
+        return latencies, requests, None
+
+    result_url = response.json()["result_url"]
+    deadline = started + timeout
+    while time.perf_counter() < deadline:
+        response = client.get(result_url)
+        requests += 1
+        if response.status_code == 200:
+            latencies["analysis"] = time.perf_counter() - started
+            return latencies, requests, None
+        if response.status_code != 202:
+            break
+        time.sleep(poll_interval)
+    return latencies, requests, "analysis"
+
+
+def run_batch_flow(client, paths, wait_analysis, poll_interval, timeout, stripe_url=None, payment_client=None):
+    """
+    Run one batch checkout flow: upload every path in one batch, pay, wait.
+
+    Args:
+        paths (List[str]): The documents of the batch.
+        Others: See run_flow.
+
+    Returns:
+        Tuple[dict, int, str]: Step latencies in seconds, HTTP requests sent,
+            and the step that failed (None on success).
+    """
+    latencies, requests = {}, 0
+
+    started = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        files = [
+            (
+                "files",
+                (
+                    os.path.basename(path),
+                    stack.enter_context(open(path, "rb")),
+                    MIME_TYPES[path.rsplit(".", 1)[1]],
+                ),
+            )
+            for path in paths
+        ]
+        response = client.post("/batches", files=files)
+    requests += 1
+    if response.status_code != 200 or response.json()["failed"]:
+        return latencies, requests, "upload"
+    latencies["upload"] = time.perf_counter() - started
+    upload = response.json()
+    payment_intent_id = upload["client_secret"].split("_secret_")[0]
+    if stripe_url:
+        httpx.post(f"{stripe_url}/v1/payment_intents/{payment_intent_id}/confirm").raise_for_status()
+
+    client = payment_client or client
+    started = time.perf_counter()
+    response = client.post(upload["payment_url"], json={"payment_intent_id": payment_intent_id})
+    requests += 1
+    if response.status_code not in (200, 202):
+        return latencies, requests, "payment_success"
+    latencies["payment_success"] = time.perf_counter() - started
+    if not wait_analysis:
+        return latencies, requests, None
+
+    deadline = started + timeout
+    while time.perf_counter() < deadline:
+        response = client.get(upload["status_url"])
+        requests += 1
+        if response.status_code != 200:
+            break
+        batch = response.json()
+        if batch["status"] == "completed":
+            if batch["counts"]["failed"]:
+                break
+            latencies["analysis"] = time.perf_counter() - started
+            return latencies, requests, None
+        time.sleep(poll_interval)
+    return latencies, requests, "analysis"
+
+
+def run_scenario(args, base_urls, specs, concurrency, sampler, corpus_dir, stripe_url):
+    """Run args.flows checkout flows with concurrency clients and summarize them."""
+    spec_cycle = itertools.cycle(specs)
+    paths = [
+        [write_document(corpus_dir, next(spec_cycle)) for _ in range(args.batch_size)]
+        if args.batch_size
+        else write_document(corpus_dir, next(spec_cycle))
+        for _ in range(args.flows)
+    ]
+    latencies = {step: [] for step in STEPS}
+    errors = {step: 0 for step in STEPS}
+    totals = {"requests": 0, "flows": 0}
+    lock = threading.Lock()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    with contextlib.ExitStack() as stack:
+        clients = [
+            stack.enter_context(httpx.Client(base_url=base_url, timeout=args.request_timeout, limits=limits))
+            for base_url in base_urls
+        ]
+
+        def one(indexed_path):
+            index, path = indexed_path
+            try:
+                flow, requests, failed = (run_batch_flow if args.batch_size else run_flow)(
+                    clients[index % len(clients)],
+                    path,
+                    args.wait_analysis,
+                    args.poll_interval,
+                    args.analysis_timeout,
+                    stripe_url if args.webhooks else None,
+                    payment_client=clients[(index + 1) % len(clients)],
+                )
+            except httpx.HTTPError:
+                flow, requests, failed = {}, 1, "upload"
+            with lock:
+                for step, seconds in flow.items():
+                    latencies[step].append(seconds)
+                totals["requests"] += requests
+                if failed:
+                    errors[failed] += 1
+                else:
+                    totals["flows"] += 1
+
+        sampler.reset()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(one, enumerate(paths)))
+        wall = time.perf_counter() - started
+
+    for path in itertools.chain.from_iterable(paths) if args.batch_size else paths:
+        os.remove(path)
+    steps = STEPS if args.wait_analysis else STEPS[:2]
+    return {
+        "concurrency": concurrency,
+        "flows": args.flows,
+        "completed": totals["flows"],
+        "wall_seconds": wall,
+        "flows_per_second": totals["flows"] / wall,
+        "requests_per_second": totals["requests"] / wall,
+        "peak_rss_mb": sampler.peak_kb / 1024,
+        "steps": {
+            step: {
+                "count": len(latencies[step]),
+                "errors": errors[step],
+                "p50": _percentile(latencies[step], 50),
+                "p95": _percentile(latencies[step], 95),
+                "p99": _percentile(latencies[step], 99),
+            }
+            for step in steps
+        },
+    }
+
+
+def print_scenario(scenario):
+    print(
+        f"\n👥 concurrency {scenario['concurrency']:<3} {scenario['completed']}/{scenario['flows']} flows  "
+        f"{scenario['flows_per_second']:6.2f} flows/s  {scenario['requests_per_second']:7.2f} req/s  "
+        f"peak RSS {scenario['peak_rss_mb']:7.1f} MB  wall {scenario['wall_seconds']:6.1f}s"
+    )
+    for step, summary in scenario["steps"].items():
+        if not summary["count"]:
+            print(f"   {step:<16} no successful requests  errors {summary['errors']}")
+            continue
+        print(
+            f"   {step:<16} p50 {summary['p50'] * 1000:8.1f}ms  p95 {summary['p95'] * 1000:8.1f}ms  "
+            f"p99 {summary['p99'] * 1000:8.1f}ms  errors {summary['errors']}"
+        )
+
+
+def compare_with_baseline(report, baseline, tolerance):
+    """
+    Compare the p95 of each scenario step with a baseline report.
+
+    Returns:
+        List[str]: Descriptions of the regressions found.
+    """
+    baseline_scenarios = {scenario["concurrency"]: scenario for scenario in baseline["scenarios"]}
+    regressions = []
+    for scenario in report["scenarios"]:
+        previous = baseline_scenarios.get(scenario["concurrency"])
+        if previous is None:
+            continue
+        for step, summary in scenario["steps"].items():
+            before = previous["steps"].get(step, {}).get("p95")
+            after = summary["p95"]
+            if before and after is not None and after > before * (1 + tolerance):
+                regressions.append(
+                    f"concurrency {scenario['concurrency']} {step}: p95 "
+                    f"{before * 1000:.1f}ms -> {after * 1000:.1f}ms (+{(after / before - 1):.0%})"
+                )
+            if summary["errors"] > previous["steps"].get(step, {}).get("errors", 0):
+                regressions.append(
+                    f"concurrency {scenario['concurrency']} {step}: errors "
+                    f"{previous['steps'][step]['errors']} -> {summary['errors']}"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the upload and payment flow against local fakes")
+    parser.add_argument("--server", choices=["wsgi", "asgi"], default="wsgi")
+    parser.add_argument("--port", type=int, default=5051)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--flows", type=int, default=32, help="Checkout flows per concurrency level")
+    parser.add_argument("--pdf-pages", type=int, nargs="*", default=[5, 50])
+    parser.add_argument("--docx-paragraphs", type=int, nargs="*", default=[200])
+    parser.add_argument("--wait-analysis", action="store_true", help="Also wait for each analysis result")
+    parser.add_argument("--openai-latency", type=float, default=0.5)
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    parser.add_argument("--stripe-latency", type=float, default=0.2)
+    parser.add_argument("--stripe-error-rate", type=float, default=0.0)
+    parser.add_argument("--webhooks", action="store_true", help="Confirm payments through signed webhooks")
+    parser.add_argument("--batch-size", type=int, default=0, help="Documents per flow, uploaded as one batch")
+    parser.add_argument("--batch-concurrency", type=int, help="BATCH_ANALYSIS_CONCURRENCY of the app")
+    parser.add_argument("--nodes", type=int, default=1, help="App processes, on consecutive ports")
+    parser.add_argument("--storage", choices=["local", "s3"], default="local")
+    parser.add_argument("--s3-latency", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--poll-interval", type=float, default=0.2)
+    parser.add_argument("--request-timeout", type=float, default=120.0)
+    parser.add_argument("--analysis-timeout", type=float, default=600.0)
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--json", help="Write the report to this file")
+    parser.add_argument("--baseline", help="Report to compare p95 latencies with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95 increase over the baseline")
+    parser.add_argument("--keep-workdir", action="store_true", help="Keep the database, uploads and server log")
+    args = parser.parse_args()
+
+    specs = parse_specs(args.pdf_pages, args.docx_paragraphs)
+    openai_server = fake_openai.make_server(
+        latency=args.openai_latency, error_rate=args.openai_error_rate, seed=args.seed
+    )
+    stripe_server = fake_stripe.make_server(
+        latency=args.stripe_latency,
+        error_rate=args.stripe_error_rate,
+        seed=args.seed,
+        webhook_url=f"http://127.0.0.1:{args.port}/stripe/webhook" if args.webhooks else None,
+        webhook_secret=WEBHOOK_SECRET,
+    )
+    fakes = [openai_server, stripe_server]
+    s3_server = None
+    if args.storage == "s3":
+        s3_server = fake_s3.make_server(latency=args.s3_latency, seed=args.seed, buckets=[S3_BUCKET])
+        fakes.append(s3_server)
+    for server in fakes:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    workdir = tempfile.mkdtemp(prefix="load-test-")
+    corpus_dir = os.path.join(workdir, "corpus")
+    os.makedirs(corpus_dir)
+    stripe_url = f"http://127.0.0.1:{stripe_server.server_port}"
+    processes, base_urls = [], []
+    for node in range(args.nodes):
+        process, base_url = start_app(
+            args,
+            workdir,
+            f"http://127.0.0.1:{openai_server.server_port}/v1",
+            stripe_url,
+            node,
+            s3_server.endpoint_url if s3_server else None,
+        )
+        processes.append(process)
+        base_urls.append(base_url)
+    sampler = RssSampler([process.pid for process in processes])
+    sampler.start()
+    print(
+        f"📊 {args.server} server x{args.nodes}, {args.storage} storage, {args.flows} flows per level"
+        f"{f' of {args.batch_size}-document batches' if args.batch_size else ''}, corpus {specs}, "
+        f"OpenAI {args.openai_latency}s / {args.openai_error_rate:.0%} errors, "
+        f"Stripe {args.stripe_latency}s / {args.stripe_error_rate:.0%} errors"
+    )
+
+    report = {"config": vars(args), "scenarios": []}
+    try:
+        for concurrency in args.concurrency:
+            scenario = run_scenario(args, base_urls, specs, concurrency, sampler, corpus_dir, stripe_url)
+            report["scenarios"].append(scenario)
+            print_scenario(scenario)
+    finally:
+        sampler.stop()
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        for server in fakes:
+            server.shutdown()
+        if args.keep_workdir:
+            print(f"\n📁 Work directory kept at {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"\nFake OpenAI {dict(openai_server.stats)}  fake Stripe {dict(stripe_server.stats)}")
+    if s3_server:
+        print(f"Fake S3 {dict(s3_server.stats)}")
+    if args.json:
+        with open(args.json, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+        print(f"💾 Report written to {args.json}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare_with_baseline(report, json.load(baseline_file), args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) against {args.baseline}:")
+            for regression in regressions:
+                print(f"   {regression}")
+            sys.exit(1)
+        print(f"\n✅ No p95 regression beyond {args.tolerance:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
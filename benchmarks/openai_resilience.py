@@ -0,0 +1,136 @@
+"""
+@file-overview Fault-injection test of the resilient OpenAI client layer.
+@filepath benchmarks/openai_resilience.py
+
+Sends a batch of concurrent chat completions to the local fake OpenAI server
+while it injects 429s (with Retry-After), 500s and slow responses, and compares:
+
+- the bare SDK client with its retries disabled (the failures users used to see),
+- utils/openai_client.py (timeout, jittered backoff, circuit breaker),
+- the same with hedged requests.
+
+Reports successes, failures, p50/p95/p99 latency and the server's fault counts.
+
+Usage:
+    python benchmarks/openai_resilience.py --requests 200 --concurrency 20 \\
+        --rate-limit-rate 0.1 --slow-rate 0.05 --slow-latency 5 --hedge-delay 1
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_openai import make_server  # noqa: E402
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ["ANALYSIS_WORKER_MODE"] = "none"
+os.environ["EXTRACTION_POOL_SIZE"] = "0"
+
+MESSAGES = [
+    {"role": "system", "content": "摘要：\n人物分析："},
+    {"role": "user", "content": "这是一段用于故障注入测试的文档内容。" * 50},
+]
+
+
+def _percentile(values, percent):
+    if not values:
+        return float("nan")
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[percent - 1]
+
+
+def run_scenario(name, create, requests, concurrency, server):
+    """Send requests through create() and print the outcome."""
+    latencies, failures = [], []
+    lock = threading.Lock()
+
+    def one(_):
+        started = time.perf_counter()
+        try:
+            create(model="gpt-4o", messages=MESSAGES, max_tokens=512)
+        except Exception as e:
+            with lock:
+                failures.append(type(e).__name__)
+            return
+        with lock:
+            latencies.append(time.perf_counter() - started)
+
+    server.stats.clear()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    print(
+        f"{name:<22} ok {len(latencies):4d}  failed {len(failures):4d}  "
+        f"p50 {_percentile(latencies, 50):6.2f}s  p95 {_percentile(latencies, 95):6.2f}s  "
+        f"p99 {_percentile(latencies, 99):6.2f}s  wall {elapsed:6.1f}s  "
+        f"server {dict(server.stats)}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exercise the OpenAI client layer under injected faults")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.2, help="Normal response latency (s)")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.1)
+    parser.add_argument("--retry-after", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-latency", type=float, default=5.0)
+    parser.add_argument("--hedge-delay", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--port", type=int, default=8767)
+    args = parser.parse_args()
+
+    server = make_server(
+        "127.0.0.1",
+        args.port,
+        args.latency,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        error_rate=args.error_rate,
+        slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency,
+        seed=args.seed,
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.port}/v1"
+
+    from openai import OpenAI
+
+    from app import app
+    from utils.openai_client import chat_completions
+
+    app.logger.setLevel(logging.ERROR)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    print(
+        f"📊 {args.requests} requests x{args.concurrency}: {args.rate_limit_rate:.0%} 429, "
+        f"{args.error_rate:.0%} 500, {args.slow_rate:.0%} slow ({args.slow_latency}s)"
+    )
+
+    bare = OpenAI(api_key="benchmark", base_url=os.environ["OPENAI_BASE_URL"], max_retries=0)
+    run_scenario("bare SDK", bare.chat.completions.create, args.requests, args.concurrency, server)
+
+    app.config["OPENAI_HEDGE_ENABLED"] = False
+    run_scenario("resilient", chat_completions.create, args.requests, args.concurrency, server)
+
+    app.config["OPENAI_HEDGE_ENABLED"] = True
+    app.config["OPENAI_HEDGE_DELAY"] = args.hedge_delay
+    run_scenario("resilient + hedging", chat_completions.create, args.requests, args.concurrency, server)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
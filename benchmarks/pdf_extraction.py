@@ -0,0 +1,82 @@
+"""
+@file-overview Benchmark of serial vs page-parallel pypdf extraction.
+@filepath benchmarks/pdf_extraction.py
+
+Generates a text-heavy PDF with benchmarks/corpus.py, then times the
+serial pypdf fallback against ExtractionPool.extract_pdf with a range of pool
+sizes, and reports when the first page arrives through iter_pdf_pages.
+
+Usage:
+    python benchmarks/pdf_extraction.py --pages 300 --workers 1 2 4
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from corpus import write_pdf  # noqa: E402
+
+# Importing the app must not start job workers or the default extraction pool
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ["ANALYSIS_WORKER_COUNT"] = "0"
+os.environ["EXTRACTION_POOL_SIZE"] = "0"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark page-parallel PDF extraction")
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    from app import app
+    from utils.extraction_pool import ExtractionPool
+    from utils.extraction_worker import extract_text_with_pypdf, join_pages
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "benchmark.pdf")
+        write_pdf(path, args.pages)
+        print(f"📄 {args.pages} pages, {os.path.getsize(path) / 1024:.0f} KB, {os.cpu_count()} CPU(s)")
+
+        started = time.perf_counter()
+        baseline = extract_text_with_pypdf(path)
+        serial = time.perf_counter() - started
+        print(f"serial pypdf            {serial:7.2f}s  {len(baseline)} chars")
+
+        for size in args.workers:
+            pool = ExtractionPool(
+                size=size,
+                timeout=app.config["EXTRACTION_TIMEOUT"],
+                memory_limit_mb=0,
+                max_tasks_per_worker=app.config["EXTRACTION_MAX_TASKS_PER_WORKER"],
+                min_pages_per_task=app.config["EXTRACTION_PDF_MIN_PAGES_PER_TASK"],
+            )
+            pool.start()
+            for _ in range(size):
+                pool.run("ping")  # Exclude worker startup from the timing
+            try:
+                started = time.perf_counter()
+                first_page = None
+                pages = []
+                for page in pool.iter_pdf_pages(path):
+                    if first_page is None:
+                        first_page = time.perf_counter() - started
+                    pages.append(page)
+                elapsed = time.perf_counter() - started
+                text = join_pages(pages)
+                assert text == baseline, "page-parallel output differs from serial output"
+                print(
+                    f"page-parallel x{size:<3}      {elapsed:7.2f}s  "
+                    f"speedup {serial / elapsed:4.2f}x  first page after {first_page:.2f}s"
+                )
+            finally:
+                pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+@file-overview Benchmark of application startup: import time, first request and per-worker memory.
+@filepath benchmarks/startup.py
+
+Every measurement runs in a fresh interpreter on a temporary database:
+
+1. cold start: time to import the entry point (wsgi or asgi, as a server worker
+   does at boot), to answer the first request, and to load the OpenAI and
+   Stripe SDKs on first use, with the RSS after each step (median of --runs);
+2. prefork: a master imports the entry point, optionally preloads the SDKs,
+   then forks --workers workers that each answer a request and load the SDKs,
+   the way a preforking server (gunicorn --preload) runs the app. Each worker
+   reports its PSS and USS (private memory) from /proc/self/smaps_rollup;
+3. with --importtime, the modules with the largest cumulative import time.
+
+Usage:
+    python benchmarks/startup.py --runs 5 --workers 4 --importtime
+    python benchmarks/startup.py --entry asgi --json startup.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SDK_MODULES = ["openai", "stripe"]
+
+# Runs in the child interpreter (argv: entry, workers, preload, SDK modules);
+# prints one JSON report
+_PROBE = """
+import json, os, sys, time
+
+entry, workers, preload = sys.argv[1], int(sys.argv[2]), sys.argv[3] == "1"
+sdk_modules = sys.argv[4].split(",")
+
+def rss_mb():
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+
+def memory_mb():
+    fields = {}
+    with open("/proc/self/smaps_rollup") as rollup:
+        for line in rollup:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss_mb": fields.get("Rss", 0.0),
+        "pss_mb": fields.get("Pss", 0.0),
+        "uss_mb": fields.get("Private_Clean", 0.0) + fields.get("Private_Dirty", 0.0),
+    }
+
+def first_use():
+    started = time.perf_counter()
+    from app import app
+    response = app.test_client().get("/")
+    assert response.status_code == 200, response.status_code
+    request_done = time.perf_counter()
+    for name in sdk_modules:
+        __import__(name)
+    return request_done - started, time.perf_counter() - request_done
+
+started = time.perf_counter()
+__import__(entry)
+report = {"import_seconds": time.perf_counter() - started, "import_rss_mb": rss_mb()}
+
+if workers == 0:
+    report["first_request_seconds"], report["sdk_load_seconds"] = first_use()
+    report["rss_mb"] = rss_mb()
+    print(json.dumps(report))
+    sys.exit(0)
+
+if preload:
+    for name in sdk_modules:
+        __import__(name)
+report["master"] = memory_mb()
+pipes = []
+for _ in range(workers):
+    read_end, write_end = os.pipe()
+    if os.fork() == 0:
+        os.close(read_end)
+        first_request, sdk_load = first_use()
+        worker = {"first_request_seconds": first_request, "sdk_load_seconds": sdk_load, **memory_mb()}
+        os.write(write_end, json.dumps(worker).encode())
+        os._exit(0)
+    os.close(write_end)
+    pipes.append(read_end)
+report["workers"] = []
+for read_end in pipes:
+    chunks = []
+    while True:
+        chunk = os.read(read_end, 65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    report["workers"].append(json.loads(b"".join(chunks)))
+    os.wait()
+print(json.dumps(report))
+"""
+
+
+def _environment(workdir):
+    """Environment of the probes: dummy keys, a temporary database, no background work."""
+    return {
+        **os.environ,
+        "OPENAI_API_KEY": "benchmark",
+        "STRIPE_SECRET_KEY": "sk_test_benchmark",
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'startup.db')}",
+        "UPLOAD_FOLDER": os.path.join(workdir, "uploads"),
+        "DEBUG_DIR": os.path.join(workdir, "debug"),
+        "TEXT_BLOB_DIR": os.path.join(workdir, "text_blobs"),
+        # Measure the web worker itself: no analysis threads, no extraction processes
+        "ANALYSIS_WORKER_COUNT": "0",
+        "EXTRACTION_POOL_SIZE": "0",
+        # A preforking master must not start per-worker services
+        "START_BACKGROUND_SERVICES": "false",
+    }
+
+
+def _run_probe(env, entry, workers=0, preload=False, extra_args=()):
+    """Run the probe in a fresh interpreter and return its report."""
+    result = subprocess.run(
+        [
+            sys.executable,
+            *extra_args,
+            "-c",
+            _PROBE,
+            entry,
+            str(workers),
+            "1" if preload else "0",
+            ",".join(SDK_MODULES),
+        ],
+        cwd=PROJECT_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Probe failed:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def _prepare_database(env):
+    """Create the schema the way a deployment does before starting workers."""
+    code = (
+        "import app\n"
+        "if hasattr(app, 'init_database'):\n"
+        "    app.create_app()\n"
+        "    app.init_database()\n"
+    )
+    subprocess.run([sys.executable, "-c", code], cwd=PROJECT_DIR, env=env, check=True, capture_output=True)
+
+
+def _top_imports(stderr, top):
+    """Parse -X importtime output into the modules with the largest cumulative time."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((int(cumulative_us), int(self_us), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark application startup")
+    parser.add_argument("--entry", choices=["wsgi", "asgi"], default="wsgi")
+    parser.add_argument("--runs", type=int, default=5, help="Cold starts to take the median of")
+    parser.add_argument("--workers", type=int, default=4, help="Forked workers (0 skips prefork)")
+    parser.add_argument("--importtime", action="store_true", help="Show the slowest imports")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--json", help="Write the report to this file")
+    args = parser.parse_args()
+
+    report = {"entry": args.entry, "runs": args.runs}
+    with tempfile.TemporaryDirectory(prefix="startup-") as workdir:
+        env = _environment(workdir)
+        _prepare_database(env)
+        _run_probe(env, args.entry)  # Warm the bytecode and page caches
+
+        samples = [_run_probe(env, args.entry)[0] for _ in range(args.runs)]
+        cold = {key: statistics.median(sample[key] for sample in samples) for key in samples[0]}
+        report["cold_start"] = cold
+        print(f"🚀 {args.entry}: median of {args.runs} cold starts")
+        print(f"   import          {cold['import_seconds'] * 1000:8.1f}ms  RSS {cold['import_rss_mb']:6.1f} MB")
+        print(f"   first request   {cold['first_request_seconds'] * 1000:8.1f}ms")
+        print(f"   SDK first use   {cold['sdk_load_seconds'] * 1000:8.1f}ms  RSS {cold['rss_mb']:6.1f} MB")
+
+        if args.workers:
+            report["prefork"] = {}
+            for preload in (False, True):
+                prefork = _run_probe(env, args.entry, args.workers, preload)[0]
+                workers = prefork["workers"]
+                summary = {
+                    "master_rss_mb": prefork["master"]["rss_mb"],
+                    "worker_pss_mb": statistics.mean(worker["pss_mb"] for worker in workers),
+                    "worker_uss_mb": statistics.mean(worker["uss_mb"] for worker in workers),
+                    "worker_first_use_seconds": statistics.mean(
+                        worker["first_request_seconds"] + worker["sdk_load_seconds"] for worker in workers
+                    ),
+                }
+                summary["total_mb"] = summary["master_rss_mb"] + sum(worker["uss_mb"] for worker in workers)
+                report["prefork"]["preload" if preload else "no_preload"] = summary
+                print(
+                    f"🍴 {args.workers} forked workers, SDKs {'preloaded' if preload else 'loaded per worker'}: "
+                    f"master {summary['master_rss_mb']:.1f} MB, per worker PSS {summary['worker_pss_mb']:.1f} MB "
+                    f"USS {summary['worker_uss_mb']:.1f} MB, first use "
+                    f"{summary['worker_first_use_seconds'] * 1000:.0f}ms, total {summary['total_mb']:.1f} MB"
+                )
+
+        if args.importtime:
+            _, stderr = _run_probe(env, args.entry, extra_args=("-X", "importtime"))
+            report["imports"] = [
+                {"module": name, "cumulative_ms": cumulative / 1000, "self_ms": self_time / 1000}
+                for cumulative, self_time, name in _top_imports(stderr, args.top)
+            ]
+            print(f"\n⏱️  Slowest imports of {args.entry} (cumulative, self)")
+            for row in report["imports"]:
+                print(f"   {row['cumulative_ms']:8.1f}ms {row['self_ms']:8.1f}ms  {row['module']}")
+
+    if args.json:
+        with open(args.json, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+        print(f"💾 Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+@file-overview Benchmark of the compressed text blob store against plain text files.
+@filepath benchmarks/text_blobs.py
+
+Generates Chinese manuscripts of the given sizes (Zipf-distributed words of a
+random vocabulary, which compresses about as well as real prose rather than
+as well as a repeated paragraph), then compares the legacy uncompressed debug/text_content_*.txt
+file with utils/text_blobs.py: bytes on disk, write time, and the median read
+time of a plain file read and of read_text with buffered and memory-mapped
+reads. Each read also reports its peak Python allocation (tracemalloc).
+
+Usage:
+    python benchmarks/text_blobs.py --chars 100000 1000000 5000000 --repeat 10
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+
+def manuscript(chars, seed=0):
+    """Return `chars` characters of random Chinese sentences."""
+    rng = random.Random(seed)
+    hanzi = [chr(code) for code in range(0x4E00, 0x4E00 + 3500)]
+    vocabulary = ["".join(rng.choices(hanzi, k=rng.choice((1, 2, 2, 2, 3, 4)))) for _ in range(8000)]
+    weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+    parts, total = [], 0
+    while total < chars:
+        sentence = "".join(rng.choices(vocabulary, weights, k=rng.randint(6, 20)))
+        sentence += rng.choice("，。。！？") + ("\n" if rng.random() < 0.1 else "")
+        parts.append(sentence)
+        total += len(sentence)
+    return "".join(parts)[:chars]
+
+
+def timed(function, repeat):
+    """Return the median seconds and peak allocated bytes of `function()`."""
+    durations, peak = [], 0
+    for _ in range(repeat):
+        tracemalloc.start()
+        started = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - started)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return statistics.median(durations), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the text blob store")
+    parser.add_argument("--chars", type=int, nargs="+", default=[100_000, 1_000_000, 5_000_000])
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["TEXT_BLOB_DIR"] = os.path.join(tmp, "blobs")
+        from app import app
+        from utils import text_blobs
+
+        print(f"codec: {text_blobs._WRITE_CODEC}, level {app.config['TEXT_BLOB_COMPRESSION_LEVEL']}")
+        print(f"{'chars':>9} {'variant':<16} {'disk KB':>9} {'write ms':>9} {'read ms':>9} {'peak MB':>8}")
+        for chars in args.chars:
+            text = manuscript(chars)
+
+            plain_path = os.path.join(tmp, f"text_content_{chars}.txt")
+            started = time.perf_counter()
+            with open(plain_path, "w", encoding="utf-8") as text_file:
+                text_file.write(text)
+            plain_write = time.perf_counter() - started
+
+            def read_plain():
+                with open(plain_path, "r", encoding="utf-8") as text_file:
+                    return text_file.read()
+
+            started = time.perf_counter()
+            key = text_blobs.put_text(text)
+            blob_write = time.perf_counter() - started
+            blob_size = text_blobs._storage().stat(text_blobs._blob_name(key, text_blobs._WRITE_CODEC))[0]
+            assert text_blobs.read_text(key) == text
+
+            rows = [("plain .txt", os.path.getsize(plain_path), plain_write, read_plain)]
+            for variant, threshold in (("blob buffered", float("inf")), ("blob mmap", 0)):
+                def read_blob(threshold=threshold):
+                    app.config["TEXT_BLOB_MMAP_THRESHOLD"] = threshold
+                    return text_blobs.read_text(key)
+                rows.append((variant, blob_size, blob_write, read_blob))
+
+            for variant, size, write, read in rows:
+                read_time, peak = timed(read, args.repeat)
+                print(
+                    f"{chars:>9} {variant:<16} {size / 1024:>9.0f} {write * 1000:>9.1f} "
+                    f"{read_time * 1000:>9.2f} {peak / 1024 / 1024:>8.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+@file-overview Gunicorn configuration: preload the app once, fork warm workers.
+@filepath gunicorn.conf.py
+
+Usage (after `flask init-db`):
+    gunicorn -c gunicorn.conf.py
+
+The master imports wsgi.py and the heavy SDKs (preload_modules) before
+forking, so every worker starts warm and shares that memory copy-on-write
+instead of importing it again. Threads, the extraction pool and database
+connections must not be inherited across fork, so the master skips
+start_background_services and each worker runs it in post_fork.
+"""
+
+import os
+
+# Read by app.py when the master imports wsgi.py
+os.environ.setdefault("START_BACKGROUND_SERVICES", "false")
+
+wsgi_app = "wsgi:application"
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5001")
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+timeout = 120
+preload_app = True
+
+
+def when_ready(server):
+    """Load the SDKs in the master, after the app and before the first fork."""
+    from app import preload_modules
+
+    preload_modules()
+    server.log.info("📦 Preloaded SDKs in the master process")
+
+
+def post_fork(server, worker):
+    """Start the analysis worker threads and extraction pool of each worker."""
+    from app import app, db, start_background_services
+
+    # Connections opened by the master belong to it; never share them
+    with app.app_context():
+        db.engine.dispose(close=False)
+    start_background_services()
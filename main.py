@@ -3,7 +3,11 @@
 @filepath main.py
 """
 
-from app import app
+from app import create_app, init_database, start_background_services
+
+app = create_app()
 
 if __name__ == "__main__":
+    init_database()
+    start_background_services()
     app.run(host="0.0.0.0", port=5001, debug=True)
@@ -3,6 +3,7 @@
 @filepath models.py
 """
 
+import uuid
 from datetime import datetime, timezone
 from app import db
 
@@ -11,7 +12,9 @@ class Document(db.Model):
     """Model representing a document uploaded by the user."""
 
     id = db.Column(db.Integer, primary_key=True)
-    filename = db.Column(db.String(255), nullable=False)
+    filename = db.Column(
+        db.String(255), nullable=False, index=True
+    )  # Storage key of the upload (utils/storage.py), looked up by the upload garbage collector
     original_filename = db.Column(db.String(255), nullable=False)
     file_size = db.Column(db.Integer, nullable=False)
     mime_type = db.Column(db.String(100), nullable=False)
@@ -19,9 +22,30 @@ class Document(db.Model):
         db.String(255), nullable=True
     )  # Document title extracted from metadata
     char_count = db.Column(db.Integer, nullable=True)  # Character count for pricing
+    char_count_estimated = db.Column(
+        db.Boolean, nullable=False, default=False
+    )  # True until background extraction replaces the pricing estimate
     analysis_cost = db.Column(db.Integer, nullable=True)  # Analysis cost in cents
-    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
-    text_content_file_path = db.Column(db.String(255), nullable=False)
+    input_tokens_raw = db.Column(
+        db.Integer, nullable=True
+    )  # Tokens of the extracted text, before compaction
+    input_tokens_compacted = db.Column(
+        db.Integer, nullable=True
+    )  # Tokens after compaction, as budgeted for the LLM call
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), index=True)
+    text_content_file_path = db.Column(
+        db.String(255), nullable=True
+    )  # Legacy uncompressed text file, moved to the blob store by the storage sweep
+    text_blob_key = db.Column(
+        db.String(64), nullable=True, index=True
+    )  # Compressed extracted text (utils/text_blobs.py); None while extraction is deferred
+    content_hash = db.Column(
+        db.String(64), nullable=True, index=True
+    )  # SHA-256 of the uploaded bytes, keys the extraction cache
+    batch_id = db.Column(
+        db.String(32), db.ForeignKey("upload_batch.id"), nullable=True, index=True
+    )  # Multi-file upload the document was part of, paid as a whole
+    batch = db.relationship("UploadBatch", backref=db.backref("documents", lazy=True))
 
 
 class Payment(db.Model):
@@ -33,5 +57,125 @@ class Payment(db.Model):
     currency = db.Column(db.String(3), nullable=False, default="usd")
     status = db.Column(db.String(20), nullable=False)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
-    document_id = db.Column(db.Integer, db.ForeignKey("document.id"), nullable=False)
+    document_id = db.Column(
+        db.Integer, db.ForeignKey("document.id"), nullable=True, index=True
+    )  # None for the payment of a batch
+    batch_id = db.Column(
+        db.String(32), db.ForeignKey("upload_batch.id"), nullable=True, index=True
+    )
     document = db.relationship("Document", backref=db.backref("payments", lazy=True))
+
+
+class CheckoutIntent(db.Model):
+    """Model tracking a Stripe payment intent created for an upload until it is paid or canceled."""
+
+    __table_args__ = (
+        # Open intent of the same file in the same browser
+        db.Index("ix_checkout_intent_reuse", "client_token", "content_hash", "status"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    stripe_payment_id = db.Column(db.String(255), unique=True, nullable=False)
+    client_secret = db.Column(db.String(255), nullable=False)
+    amount = db.Column(db.Integer, nullable=False)  # Amount in cents
+    currency = db.Column(db.String(3), nullable=False, default="cny")
+    status = db.Column(
+        db.String(40), nullable=False, index=True
+    )  # Last known Stripe status (requires_payment_method, succeeded, canceled, ...)
+    client_token = db.Column(
+        db.String(64), nullable=True
+    )  # Random id of the uploading browser; intents are only reused within it
+    content_hash = db.Column(db.String(64), nullable=True)  # SHA-256 of the uploaded bytes
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = db.Column(
+        db.DateTime,
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc),
+    )
+    document_id = db.Column(
+        db.Integer, db.ForeignKey("document.id"), nullable=True, index=True
+    )  # None for the intent of a batch
+    batch_id = db.Column(
+        db.String(32), db.ForeignKey("upload_batch.id"), nullable=True, index=True
+    )
+    document = db.relationship("Document", backref=db.backref("checkout_intents", lazy=True))
+
+
+class AnalysisJob(db.Model):
+    """Model representing a queued AI analysis job for a paid document."""
+
+    id = db.Column(db.String(32), primary_key=True, default=lambda: uuid.uuid4().hex)
+    status = db.Column(
+        db.String(20), nullable=False, default="queued", index=True
+    )  # queued, running, succeeded, failed
+    analysis_options = db.Column(db.JSON, nullable=True)
+    result = db.Column(db.JSON, nullable=True)  # Output of analyze_document
+    error = db.Column(db.Text, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    available_at = db.Column(
+        db.DateTime, nullable=True
+    )  # Workers skip the job until then (reserved for a streaming client)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    document_id = db.Column(db.Integer, db.ForeignKey("document.id"), nullable=False)
+    payment_id = db.Column(db.Integer, db.ForeignKey("payment.id"), nullable=True, index=True)
+    batch_id = db.Column(
+        db.String(32), db.ForeignKey("upload_batch.id"), nullable=True, index=True
+    )  # Jobs of one batch share BATCH_ANALYSIS_CONCURRENCY
+    document = db.relationship("Document", backref=db.backref("analysis_jobs", lazy=True))
+    payment = db.relationship("Payment", backref=db.backref("analysis_jobs", lazy=True))
+
+
+class UploadBatch(db.Model):
+    """Model representing a multi-file upload, priced and paid with one payment intent."""
+
+    id = db.Column(db.String(32), primary_key=True, default=lambda: uuid.uuid4().hex)
+    amount = db.Column(db.Integer, nullable=False)  # Sum of the document costs, in cents
+    currency = db.Column(db.String(3), nullable=False, default="cny")
+    analysis_options = db.Column(db.JSON, nullable=True)  # Options selected at upload
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+
+class AnalysisResult(db.Model):
+    """Model representing the stored output of a completed analysis."""
+
+    __table_args__ = (
+        # Latest result of a document in one index lookup
+        db.Index("ix_analysis_result_document_created", "document_id", "created_at"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(db.Integer, db.ForeignKey("document.id"), nullable=False)
+    payment_id = db.Column(
+        db.Integer, db.ForeignKey("payment.id"), nullable=True, index=True
+    )
+    job_id = db.Column(
+        db.String(32), db.ForeignKey("analysis_job.id"), nullable=True, unique=True
+    )
+    summary = db.Column(db.Text, nullable=False)  # Full analysis text
+    sections = db.Column(db.JSON, nullable=False)  # Section name -> text
+    analysis_options = db.Column(db.JSON, nullable=True)
+    model = db.Column(db.String(100), nullable=True)
+    prompt_tokens = db.Column(db.Integer, nullable=True)
+    completion_tokens = db.Column(db.Integer, nullable=True)
+    input_tokens = db.Column(db.JSON, nullable=True)  # Statistics from fit_to_budget
+    timings = db.Column(db.JSON, nullable=True)
+    etag = db.Column(db.String(64), nullable=False)  # Hash of the stored content
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    document = db.relationship("Document", backref=db.backref("analysis_results", lazy=True))
+    payment = db.relationship("Payment", backref=db.backref("analysis_results", lazy=True))
+
+
+class AnalysisCacheEntry(db.Model):
+    """Model representing a cached analysis result, keyed by a hash of its inputs."""
+
+    cache_key = db.Column(db.String(64), primary_key=True)
+    result = db.Column(db.JSON, nullable=False)
+    size_bytes = db.Column(db.Integer, nullable=False)
+    hit_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    last_accessed_at = db.Column(
+        db.DateTime, default=lambda: datetime.now(timezone.utc), index=True
+    )
@@ -5,8 +5,12 @@
 This module handles all the HTTP routes for the document analysis application.
 It provides endpoints for:
 - File upload and validation
+- Multi-file batch upload, payment and per-document analysis status
 - Document processing and analysis
-- Payment processing via Stripe
+- Payment processing via Stripe, including the payment_intent.succeeded webhook
+- Background analysis job status and results, including SSE streaming
+- Stored analysis results, with ETag conditional GETs
+- Cache statistics and Prometheus metrics
 - Serving the main application interface
 
 The module integrates with:
@@ -17,23 +21,82 @@ The module integrates with:
 """
 
 import os
+import json
+import time
 import uuid
-from typing import Tuple, Dict, Any
+import hashlib
+import functools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Tuple, Dict, Any, List, Optional
 from datetime import datetime
-from flask import render_template, request, jsonify, Response
+from flask import (
+    render_template,
+    request,
+    jsonify,
+    Response,
+    stream_with_context,
+)
+from sqlalchemy.exc import IntegrityError
 from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
 from app import app, db
-from models import Document, Payment
-from utils.document_processor import process_document
-from utils.ai_analyzer import analyze_document
+from models import Document, Payment, AnalysisJob
+from utils.document_processor import (
+    estimate_document,
+    extract_in_background,
+    process_document,
+)
+from utils.ai_analyzer import SECTION_OPTIONS
+from utils.analysis_store import get_job_analysis_result, serialize_analysis_result
+from utils.batches import (
+    BATCH_COMPLETED,
+    batch_intent_metadata,
+    create_batch,
+    record_paid_batch,
+    replay_paid_batch,
+    serialize_batch,
+    set_batch_amount,
+)
+from utils.char_estimator import price_for
+from utils.extraction_cache import extraction_cache
+from utils.metrics import render_metrics, stage
+from utils.result_cache import result_cache
+from utils.storage import get_storage
+from utils.upload_stream import UploadIngestStream
+from utils.job_queue import (
+    JOB_FAILED,
+    JOB_QUEUED,
+    JOB_SUCCEEDED,
+    claim_job,
+    enqueue_analysis_job,
+    serialize_job,
+    stream_job,
+)
+from utils.payment_intents import (
+    find_reusable_intent,
+    record_intent,
+    record_intent_amount,
+    record_intent_status,
+)
 from utils.stripe_utils import (
     create_payment_intent,
     confirm_payment_intent,
+    construct_webhook_event,
+    remember_payment_intent,
+    update_payment_intent_amount,
 )
 
 # define allowed file extensions
 ALLOWED_EXTENSIONS = {"pdf", "docx"}
 
+# Chunk size used when streaming uploads to disk
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Payment confirmations in progress, single-flighted by payment intent id
+_payment_flights = {}
+_payment_flights_lock = threading.Lock()
+
 # define upload folder
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads")
 if not os.path.exists(UPLOAD_FOLDER):
@@ -84,20 +147,42 @@ def _generate_unique_filename(original_filename: str) -> Tuple[str, str]:
     return unique_filename, file_extension
 
 
-def _save_uploaded_file(file: FileStorage, save_path: str) -> None:
+def _save_uploaded_file(file: FileStorage, save_path: str) -> Tuple[str, int]:
     """
     Save the uploaded file to the specified path.
 
+    Uploads received through StreamingUploadRequest are already on disk and
+    hashed, so they are only moved into place. Other file objects are copied
+    in chunks and hashed on the way to disk.
+
     Args:
         file: The uploaded file object
         save_path: Path where the file should be saved
 
+    Returns:
+        Tuple[str, int]: SHA-256 hex digest of the file and its size in bytes
+
     Raises:
         OSError: If file cannot be saved
+        UnsupportedMediaType: If the file content does not match its type
     """
     try:
-        file.save(save_path)
+        if isinstance(file.stream, UploadIngestStream):
+            file.stream.commit(save_path)
+            app.logger.info(f"✅ File saved successfully at {save_path}")
+            return file.stream.content_hash, file.stream.size
+
+        digest = hashlib.sha256()
+        file_size = 0
+        with open(save_path, "wb") as destination:
+            for chunk in iter(lambda: file.stream.read(UPLOAD_CHUNK_SIZE), b""):
+                digest.update(chunk)
+                destination.write(chunk)
+                file_size += len(chunk)
         app.logger.info(f"✅ File saved successfully at {save_path}")
+        return digest.hexdigest(), file_size
+    except HTTPException:
+        raise
     except Exception as e:
         app.logger.error(f"⚠️ Failed to save file: {str(e)}")
         raise OSError(f"Failed to save file: {str(e)}")
@@ -114,39 +199,848 @@ def _calculate_analysis_cost(char_count: int) -> int:
     Returns:
         int: Cost in cents (¥)
     """
-    pricing_tiers = app.config["PRICING_TIERS"]
-    min_charge = app.config["MIN_CHARGE"]
+    # Shared with the estimate's tier boundary check, so both agree on prices
+    return price_for(char_count, app.config["PRICING_TIERS"], app.config["MIN_CHARGE"])
 
-    # Base cost calculation
-    cost = next(
-        (tier["price"] for tier in pricing_tiers if char_count <= tier["max_chars"]),
-        min_charge,
-    )
 
-    # Ensure minimum charge meets Stripe's requirement
-    return max(cost, min_charge)
+def _process_payment(
+    upload_data: Dict[str, Any],
+    metadata: Dict[str, str],
+    content_hash: str,
+    client_token: Optional[str] = None,
+    reused_intent: Optional[Dict[str, Any]] = None,
+    currency: str = "cny",
+) -> Dict[str, Any]:
+    """
+    Create the payment intent of an upload, or reuse the open one of a re-upload.
+
+    A reused intent costs no Stripe call unless its price changed, in which
+    case the amount is updated in place. If Stripe refuses the update (the
+    intent was paid or canceled meanwhile) a new intent is created; the old
+    one is settled by the abandoned-intent sweep.
+
+    Args:
+        upload_data: Upload response fields from _register_document
+        metadata: Payment intent metadata (see _intent_metadata)
+        content_hash: SHA-256 hex digest of the file
+        client_token: Random id of the uploading browser, or None
+        reused_intent: Open intent returned by _register_document, or None
+        currency: Currency code (default: "cny")
+
+    Returns:
+        Dict containing payment intent details
+    """
+    amount = upload_data["analysis_cost"]
+    if reused_intent is not None and reused_intent["amount"] != amount:
+        import stripe
+
+        try:
+            update_payment_intent_amount(reused_intent["id"], amount)
+            _record_repriced_intent(reused_intent["id"], amount)
+        except stripe.error.StripeError:
+            reused_intent = None
+    if reused_intent is not None:
+        return _payment_data(reused_intent["client_secret"], amount, reused_intent["currency"])
+
+    payment_intent = create_payment_intent(amount, currency=currency, metadata=metadata)
+    return _record_new_intent(payment_intent, upload_data, content_hash, client_token, currency)
+
+
+def _record_repriced_intent(payment_intent_id: str, amount: int) -> None:
+    """
+    Track the new amount of a reused intent once Stripe has updated it.
+
+    Shared by the Flask route and the ASGI entry point.
+
+    Args:
+        payment_intent_id: ID of the Stripe payment intent
+        amount: New amount in cents
+    """
+    record_intent_amount(payment_intent_id, amount)
+    app.logger.info(f"💱 Payment {payment_intent_id} repriced to ¥{amount / 100:.2f}")
+
+
+def _record_new_intent(
+    payment_intent: Any,
+    upload_data: Dict[str, Any],
+    content_hash: str,
+    client_token: Optional[str] = None,
+    currency: str = "cny",
+) -> Dict[str, Any]:
+    """
+    Track a payment intent created for an upload and build its checkout fields.
+
+    Shared by the Flask route and the ASGI entry point.
+
+    Args:
+        payment_intent: The new Stripe payment intent
+        upload_data: Upload response fields from _register_document
+        content_hash: SHA-256 hex digest of the file
+        client_token: Random id of the uploading browser, or None
+        currency: Currency code (default: "cny")
+
+    Returns:
+        Dict containing payment intent details
+    """
+    record_intent(payment_intent, upload_data["document_id"], client_token, content_hash)
+    return _payment_data(payment_intent.client_secret, upload_data["analysis_cost"], currency)
+
+
+def _parse_analysis_options(raw: Optional[str]) -> Dict[str, bool]:
+    """
+    Parse analysis options sent as a JSON form field or metadata value.
+
+    Args:
+        raw: JSON object of option name -> enabled, or None
+
+    Returns:
+        Dict[str, bool]: The known options (empty selects every section)
+    """
+    try:
+        options = json.loads(raw) if raw else {}
+    except ValueError:
+        return {}
+    if not isinstance(options, dict):
+        return {}
+    return {option: bool(options[option]) for option, _ in SECTION_OPTIONS if option in options}
+
+
+def _parse_client_token(raw: Optional[str]) -> Optional[str]:
+    """
+    Validate the random browser id sent with an upload.
+
+    Args:
+        raw: The client_token form field, or None
+
+    Returns:
+        Optional[str]: The token, or None if it is missing or malformed
+    """
+    if raw and len(raw) <= 64 and all(char.isalnum() or char == "-" for char in raw):
+        return raw
+    return None
+
+
+def _intent_metadata(
+    document_id: int, analysis_options: Dict[str, bool], stream: bool
+) -> Dict[str, str]:
+    """
+    Build the payment intent metadata the payment_intent.succeeded webhook acts on.
+
+    Args:
+        document_id: ID of the document being paid for
+        analysis_options: Analysis options selected at upload time
+        stream: Whether the client will follow the job over SSE
+
+    Returns:
+        Dict[str, str]: Stripe metadata (string values only)
+    """
+    return {
+        "document_id": str(document_id),
+        "analysis_options": json.dumps(analysis_options, separators=(",", ":")),
+        "stream": "true" if stream else "false",
+    }
+
+
+class UploadError(Exception):
+    """An upload step failed; carries the client-facing message and HTTP status."""
+
+    def __init__(self, message: str, status_code: int = 500):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _store_upload(unique_filename: str, save_path: str) -> str:
+    """
+    Put a saved upload in the shared storage, so every node can extract it.
+
+    Args:
+        unique_filename: Stored filename of the upload, its storage key
+        save_path: Path of the received file; the storage takes ownership of it
+
+    Returns:
+        str: Local path of the stored upload (a cached copy with the S3 backend)
+
+    Raises:
+        OSError: If the upload cannot be stored
+    """
+    storage = get_storage("uploads")
+    try:
+        storage.put_file(unique_filename, save_path)
+        return storage.local_path(unique_filename)
+    except Exception as e:
+        app.logger.error(f"⚠️ Failed to store upload: {str(e)}")
+        raise OSError(f"Failed to store upload: {str(e)}")
+
+
+def _remove_upload(save_path: str) -> None:
+    """Delete a saved upload, and its stored copy, after a failed request."""
+    if not save_path:
+        return
+    try:
+        get_storage("uploads").delete(os.path.basename(save_path))
+    except Exception as e:
+        app.logger.error(f"⚠️ Failed to delete stored upload: {str(e)}")
+    if os.path.exists(save_path):
+        os.remove(save_path)
+
+
+def _register_document(
+    save_path: str,
+    unique_filename: str,
+    original_filename: str,
+    mime_type: str,
+    content_hash: str,
+    file_size: int,
+    client_token: Optional[str] = None,
+    batch_id: Optional[str] = None,
+) -> Tuple[Dict[str, Any], Any]:
+    """
+    Process (or estimate) a saved upload, price it and store its Document row.
+
+    Shared by the Flask route and the ASGI entry point; the upload is deleted
+    if a step fails. If the same browser uploaded the same file before and
+    has not paid for it yet, the earlier document is repriced and reused
+    together with its payment intent, and the new copy is deleted.
+
+    Args:
+        save_path: Path of the saved upload
+        unique_filename: Stored filename of the upload
+        original_filename: Filename supplied by the client
+        mime_type: Content type supplied by the client
+        content_hash: SHA-256 hex digest of the file
+        file_size: Size of the file in bytes
+        client_token: Random id of the uploading browser, or None
+        batch_id: ID of the upload batch the document is part of, or None
+
+    Returns:
+        Tuple[Dict[str, Any], Dict[str, Any] | None]: Upload response fields
+            (without the payment data) and the id, client secret, amount and
+            currency of the open payment intent to reuse
+
+    Raises:
+        UploadError: If processing or the database entry fails
+    """
+    # Process document (or estimate its size) and calculate cost
+    try:
+        if app.config["CHAR_ESTIMATE_ENABLED"]:
+            with stage("estimate_document"):
+                document_metadata = estimate_document(save_path, content_hash)
+        else:
+            with stage("process_document"):
+                document_metadata = process_document(save_path, content_hash)
+        char_count = document_metadata["char_count"]
+        char_count_estimated = document_metadata["char_count_estimated"]
+        analysis_cost = _calculate_analysis_cost(char_count)
+        app.logger.info(
+            f"💰 Analysis cost: ¥{analysis_cost / 100:.2f} for "
+            f"{'~' if char_count_estimated else ''}{char_count} characters"
+        )
+    except Exception as e:
+        _remove_upload(save_path)
+        app.logger.error(f"⚠️ Processing error: {str(e)}")
+        raise UploadError("Document processing failed")
+
+    # Database entry
+    try:
+        reused_intent = None
+        checkout_intent = find_reusable_intent(client_token, content_hash)
+        if checkout_intent is not None:
+            # Re-upload of an unpaid file: keep the earlier document and intent
+            _remove_upload(save_path)
+            reused_intent = {
+                "id": checkout_intent.stripe_payment_id,
+                "client_secret": checkout_intent.client_secret,
+                "amount": checkout_intent.amount,
+                "currency": checkout_intent.currency,
+            }
+            document = checkout_intent.document
+            if document.char_count_estimated or not char_count_estimated:
+                document.char_count = char_count
+                document.char_count_estimated = char_count_estimated
+                document.analysis_cost = analysis_cost
+            if document.text_blob_key is None and document.text_content_file_path is None:
+                document.text_blob_key = document_metadata["text_blob_key"]
+            app.logger.info(
+                f"♻️ Reusing document {document.id} and payment "
+                f"{checkout_intent.stripe_payment_id} for a re-upload"
+            )
+        else:
+            document = Document(
+                filename=unique_filename,
+                original_filename=original_filename,
+                file_size=file_size,
+                mime_type=mime_type,
+                char_count=char_count,
+                char_count_estimated=char_count_estimated,
+                analysis_cost=analysis_cost,
+                title=document_metadata["title"],
+                text_blob_key=document_metadata["text_blob_key"],
+                content_hash=content_hash,
+                batch_id=batch_id,
+            )
+            db.session.add(document)
+        with stage("db_commit"):
+            db.session.commit()
+    except Exception as e:
+        _remove_upload(save_path)
+        app.logger.error(f"⚠️ Database error: {str(e)}")
+        raise UploadError("Failed to save document info")
+
+    # Full extraction of an estimated document overlaps with checkout
+    if char_count_estimated and reused_intent is None:
+        extract_in_background(save_path, content_hash)
+
+    # Use current date if metadata date fails (fallback logic)
+    upload_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    upload_data = {
+        "document_id": document.id,
+        "title": document.title,
+        "original_filename": original_filename,
+        "char_count": document.char_count,
+        "char_count_estimated": document.char_count_estimated,
+        "file_size": file_size,
+        "mime_type": mime_type,
+        "upload_date": upload_date,
+        "analysis_cost": document.analysis_cost,
+    }
+    # Reading the expired document reopened a transaction: end it before the
+    # Stripe call of _process_payment
+    db.session.commit()
+    return upload_data, reused_intent
 
 
-def _process_payment(amount: int, currency: str = "cny") -> Dict[str, Any]:
+def _payment_data(client_secret: str, amount: int, currency: str = "cny") -> Dict[str, Any]:
     """
-    Create a payment intent for document analysis.
+    Build the checkout fields returned to the client for a payment intent.
 
     Args:
+        client_secret: Client secret of the payment intent
         amount: Amount to charge in cents
         currency: Currency code (default: "cny")
 
     Returns:
         Dict containing payment intent details
     """
-    payment_intent = create_payment_intent(amount, currency=currency)
     return {
-        "client_secret": payment_intent.client_secret,
+        "client_secret": client_secret,
         "publishable_key": app.config["STRIPE_PUBLISHABLE_KEY"],
         "amount": amount,
         "currency": currency,
     }
 
 
+def _job_urls(job_id: str) -> Dict[str, str]:
+    """Build the status, result, analysis and stream URLs of a job (no request context needed)."""
+    adapter = app.url_map.bind("localhost")
+    return {
+        "status_url": adapter.build("job_status", {"job_id": job_id}),
+        "result_url": adapter.build("job_result", {"job_id": job_id}),
+        "analysis_url": adapter.build("job_analysis", {"job_id": job_id}),
+        "stream_url": adapter.build("job_stream", {"job_id": job_id}),
+    }
+
+
+def _record_paid_analysis(
+    payment_intent: Any,
+    document_id: int,
+    analysis_options: Dict[str, Any],
+    stream: bool,
+) -> Tuple[Dict[str, Any], int]:
+    """
+    Record a succeeded payment and queue the analysis it paid for.
+
+    Shared by the webhook, the Flask route and the ASGI entry point, so every
+    path records the payment against the document of the intent metadata.
+
+    Args:
+        payment_intent: The verified Stripe payment intent
+        document_id: ID of the paid document
+        analysis_options: Analysis options selected by the user
+        stream: Whether the client will follow the job over SSE
+
+    Returns:
+        Tuple[Dict[str, Any], int]: Response payload and HTTP status code
+    """
+    rejected = _check_intent_document(payment_intent, document_id)
+    if rejected is not None:
+        return rejected
+
+    # Get document and create payment record
+    document = db.session.get(Document, document_id)
+    if not document:
+        return {"error": "Document not found"}, 404
+
+    payment = Payment(
+        stripe_payment_id=payment_intent.id,
+        amount=payment_intent.amount,
+        currency=payment_intent.currency,
+        status=payment_intent.status,
+        document_id=document_id,
+    )
+    db.session.add(payment)
+    try:
+        db.session.flush()
+    except IntegrityError:
+        # Another process recorded this payment first: answer with its job
+        db.session.rollback()
+        replay = _replay_paid_analysis(payment_intent.id, document_id, analysis_options)
+        if replay is None:
+            raise
+        return replay
+
+    # Queue the analysis for the background workers. A streaming client
+    # gets a short head start to claim the job through the SSE endpoint.
+    job = enqueue_analysis_job(
+        document.id,
+        analysis_options,
+        payment_id=payment.id,
+        reserve_for_stream=stream,
+    )
+    record_intent_status(payment_intent.id, payment_intent.status)
+
+    return {"success": True, **serialize_job(job), **_job_urls(job.id)}, 202
+
+
+def _intent_document_id(payment_intent: Any) -> Optional[str]:
+    """
+    Return the document a payment intent pays for, from the metadata written at upload.
+
+    Args:
+        payment_intent: The Stripe payment intent
+
+    Returns:
+        Optional[str]: The document id, or None for a batch intent or an
+            intent without a document
+    """
+    metadata = payment_intent.metadata or {}
+    if metadata.get("batch_id"):
+        return None
+    return metadata.get("document_id")
+
+
+def _check_intent_document(payment_intent: Any, document_id: Any) -> Any:
+    """
+    Reject a payment intent that does not pay for this single document.
+
+    The intent of a batch, or of another document (possibly a cheaper one),
+    cannot pay for it.
+
+    Args:
+        payment_intent: The verified Stripe payment intent
+        document_id: ID of the document the client is paying for
+
+    Returns:
+        Tuple[Dict[str, Any], int] | None: 409 response, or None if the
+            intent pays for the document
+    """
+    if _intent_document_id(payment_intent) != str(document_id):
+        app.logger.warning(
+            f"🚫 Payment {payment_intent.id} does not pay for document {document_id}"
+        )
+        return {"error": "Payment does not belong to this document"}, 409
+    return None
+
+
+def _replay_paid_analysis(
+    payment_intent_id: str,
+    document_id: Any,
+    analysis_options: Dict[str, Any],
+    update_options: bool = False,
+) -> Any:
+    """
+    Answer a repeated payment confirmation from the stored payment and job.
+
+    The payment intent id is the idempotency key of /payment/success: once a
+    payment is recorded, retries and double submissions get its job back
+    (with the analysis itself when it has finished) instead of a second
+    Stripe call and a second paid analysis.
+
+    Args:
+        payment_intent_id: ID of the Stripe payment intent
+        document_id: ID of the document the client is paying for
+        analysis_options: Analysis options selected by the user
+        update_options: Apply analysis_options to the job if it has not
+            started yet (the webhook queued it with the options chosen at
+            upload time, which the client may have changed since)
+
+    Returns:
+        Tuple[Dict[str, Any], int] | None: Response payload and HTTP status
+            code, or None if the payment has not been recorded yet
+    """
+    payment = Payment.query.filter_by(stripe_payment_id=payment_intent_id).first()
+    if payment is None:
+        return None
+    if str(payment.document_id) != str(document_id):
+        app.logger.warning(
+            f"🚫 Payment {payment_intent_id} already paid for document {payment.document_id}"
+        )
+        return {"error": "Payment already used for another document"}, 409
+
+    job = (
+        AnalysisJob.query.filter_by(payment_id=payment.id)
+        .order_by(AnalysisJob.created_at)
+        .first()
+    )
+    if job is None:
+        # Recorded before analyses were queued: the paid analysis is still owed
+        job = enqueue_analysis_job(payment.document_id, analysis_options, payment_id=payment.id)
+    elif update_options and analysis_options and job.analysis_options != analysis_options:
+        updated = AnalysisJob.query.filter_by(id=job.id, status=JOB_QUEUED).update(
+            {"analysis_options": analysis_options}, synchronize_session=False
+        )
+        db.session.commit()
+        if updated:
+            app.logger.info(f"📝 Analysis options of job {job.id} updated by the client")
+
+    app.logger.info(f"🔁 Replaying payment {payment_intent_id}: job {job.id} is {job.status}")
+    payload = {"success": True, "replayed": True, **serialize_job(job), **_job_urls(job.id)}
+    if job.status == JOB_SUCCEEDED:
+        payload["analysis"] = job.result
+        return payload, 200
+    return payload, 202
+
+
+def _webhooks_enabled() -> bool:
+    """Return True if /payment/success should wait for the payment webhook."""
+    return bool(app.config["STRIPE_WEBHOOK_SECRET"]) and app.config["PAYMENT_WEBHOOK_WAIT"] > 0
+
+
+def _wait_for_webhook(payment_intent_id: str, replay: Callable[[], Any]) -> Any:
+    """
+    Wait up to PAYMENT_WEBHOOK_WAIT seconds for the webhook to record a payment.
+
+    Args:
+        payment_intent_id: ID of the Stripe payment intent
+        replay: Returns the response of the recorded payment, or None while
+            it has not been recorded (_replay_paid_analysis or replay_paid_batch)
+
+    Returns:
+        Tuple[Dict[str, Any], int] | None: The replayed response, or None if
+            the webhook has not arrived in time
+    """
+    deadline = time.monotonic() + app.config["PAYMENT_WEBHOOK_WAIT"]
+    while time.monotonic() < deadline:
+        # End the read transaction before sleeping, so the webhook's commit
+        # is visible and no transaction stays open while waiting
+        db.session.commit()
+        time.sleep(app.config["PAYMENT_WEBHOOK_POLL_INTERVAL"])
+        response = replay()
+        if response is not None:
+            return response
+    _log_webhook_timeout(payment_intent_id)
+    return None
+
+
+def _log_webhook_timeout(payment_intent_id: str) -> None:
+    """Log that the webhook did not record a payment within PAYMENT_WEBHOOK_WAIT."""
+    app.logger.warning(
+        f"⏰ No webhook for payment {payment_intent_id} after "
+        f"{app.config['PAYMENT_WEBHOOK_WAIT']}s, asking Stripe"
+    )
+
+
+def _record_webhook_payment(payment_intent: Any) -> Tuple[Dict[str, Any], int]:
+    """
+    Queue the analysis paid for by a payment_intent.succeeded event.
+
+    The document and analysis options come from the intent metadata written
+    at upload time. Redelivered events replay the recorded payment.
+
+    Args:
+        payment_intent: The payment intent of the verified event
+
+    Returns:
+        Tuple[Dict[str, Any], int]: Result payload and HTTP status code
+    """
+    metadata = payment_intent.metadata or {}
+    batch_id = metadata.get("batch_id")
+    if batch_id:
+        replay = replay_paid_batch(payment_intent.id, batch_id)
+        if replay is not None:
+            return replay
+        app.logger.info(f"🔔 Webhook confirmed payment {payment_intent.id} of batch {batch_id}")
+        return record_paid_batch(payment_intent, batch_id)
+
+    document_id = _intent_document_id(payment_intent)
+    if not document_id:
+        app.logger.info(f"ℹ️ Ignoring payment {payment_intent.id} without a document id")
+        return {"ignored": True}, 200
+
+    analysis_options = _parse_analysis_options(metadata.get("analysis_options"))
+    replay = _replay_paid_analysis(payment_intent.id, document_id, analysis_options)
+    if replay is not None:
+        return replay
+
+    app.logger.info(f"🔔 Webhook confirmed payment {payment_intent.id}, queuing its analysis")
+    return _record_paid_analysis(
+        payment_intent, int(document_id), analysis_options, metadata.get("stream") == "true"
+    )
+
+
+def _confirmation_replay(
+    payment_intent_id: str, document_id: Any, analysis_options: Dict[str, Any]
+) -> Callable[[], Any]:
+    """
+    Build the replay a payment confirmation polls while the payment is unrecorded.
+
+    Shared by the Flask route and the ASGI entry point.
+
+    Args:
+        payment_intent_id: ID of the Stripe payment intent
+        document_id: ID of the document the client is paying for
+        analysis_options: Analysis options selected by the user
+
+    Returns:
+        Callable[[], Any]: _replay_paid_analysis bound to the confirmation,
+            applying the client's options to a job that has not started yet
+    """
+    return functools.partial(
+        _replay_paid_analysis,
+        payment_intent_id,
+        document_id,
+        analysis_options,
+        update_options=True,
+    )
+
+
+def _record_confirmed_payment(
+    payment_intent: Any,
+    document_id: Any,
+    analysis_options: Dict[str, Any],
+    stream: bool,
+) -> Tuple[Dict[str, Any], int]:
+    """
+    Record a payment intent retrieved from Stripe, if it has succeeded.
+
+    Shared by the Flask route and the ASGI entry point.
+
+    Args:
+        payment_intent: The payment intent retrieved from Stripe
+        document_id: ID of the document the client is paying for
+        analysis_options: Analysis options selected by the user
+        stream: Whether the client will follow the job over SSE
+
+    Returns:
+        Tuple[Dict[str, Any], int]: Response payload and HTTP status code
+    """
+    if payment_intent.status != "succeeded":
+        return {"error": "Payment not successful"}, 400
+    with stage("record_payment"):
+        return _record_paid_analysis(payment_intent, document_id, analysis_options, stream)
+
+
+def _confirm_paid_analysis(
+    payment_intent_id: str,
+    document_id: Any,
+    analysis_options: Dict[str, Any],
+    stream: bool,
+) -> Tuple[Dict[str, Any], int]:
+    """
+    Verify a payment with Stripe and queue its analysis, once per payment intent.
+
+    Concurrent confirmations of the same intent in this process share one
+    Stripe call and one job: the first request does the work and the others
+    wait for it, then answer from the recorded payment. With webhooks
+    enabled, the first request waits for payment_intent.succeeded to record
+    the payment and only asks Stripe if it does not arrive in time.
+
+    Args:
+        payment_intent_id: ID of the Stripe payment intent
+        document_id: ID of the paid document
+        analysis_options: Analysis options selected by the user
+        stream: Whether the client will follow the job over SSE
+
+    Returns:
+        Tuple[Dict[str, Any], int]: Response payload and HTTP status code
+    """
+    replay = _confirmation_replay(payment_intent_id, document_id, analysis_options)
+    result = replay()
+    if result is not None:
+        return result
+    # No transaction stays open while waiting for the webhook, Stripe or the leader
+    db.session.commit()
+
+    with _payment_flights_lock:
+        flight = _payment_flights.get(payment_intent_id)
+        leader = flight is None
+        if leader:
+            flight = Future()
+            _payment_flights[payment_intent_id] = flight
+
+    if not leader:
+        app.logger.info(f"⏳ Joining the in-flight confirmation of payment {payment_intent_id}")
+        result = flight.result()
+        return _replay_paid_analysis(payment_intent_id, document_id, analysis_options) or result
+
+    try:
+        result = None
+        if _webhooks_enabled():
+            with stage("webhook_wait"):
+                result = _wait_for_webhook(payment_intent_id, replay)
+        if result is None:
+            with stage("stripe_retrieve"):
+                payment_intent = confirm_payment_intent(payment_intent_id)
+            result = _record_confirmed_payment(
+                payment_intent, document_id, analysis_options, stream
+            )
+        flight.set_result(result)
+        return result
+    except BaseException as e:
+        flight.set_exception(e)
+        raise
+    finally:
+        with _payment_flights_lock:
+            _payment_flights.pop(payment_intent_id, None)
+
+
+def _batch_urls(batch_id: str) -> Dict[str, str]:
+    """Build the status, payment and stream URLs of a batch (no request context needed)."""
+    adapter = app.url_map.bind("localhost")
+    return {
+        "status_url": adapter.build("batch_status", {"batch_id": batch_id}),
+        "payment_url": adapter.build("batch_payment", {"batch_id": batch_id}),
+        "stream_url": adapter.build("batch_stream", {"batch_id": batch_id}),
+    }
+
+
+def _with_batch_urls(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Add the batch URLs, and the result URL of each queued analysis, to a batch payload.
+
+    Args:
+        payload: serialize_batch output, or an error payload (returned as is)
+
+    Returns:
+        Dict[str, Any]: The payload with its URLs
+    """
+    if "batch_id" not in payload:
+        return payload
+    for document in payload["documents"]:
+        if document["job_id"]:
+            document["result_url"] = _job_urls(document["job_id"])["result_url"]
+    return {**payload, **_batch_urls(payload["batch_id"])}
+
+
+def _register_batch_upload(batch_id: str, upload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Store and process one saved file of a batch (runs on a batch upload thread).
+
+    Args:
+        batch_id: ID of the batch
+        upload: save_path, unique_filename, original_filename, mime_type,
+            content_hash and file_size of the saved file
+
+    Returns:
+        Dict[str, Any]: Upload response fields from _register_document
+
+    Raises:
+        UploadError: If storing, processing or the database entry fails
+    """
+    with app.app_context():
+        try:
+            save_path = _store_upload(upload["unique_filename"], upload["save_path"])
+        except OSError:
+            _remove_upload(upload["save_path"])
+            raise UploadError("Failed to save file")
+        upload_data, _ = _register_document(
+            save_path,
+            upload["unique_filename"],
+            upload["original_filename"],
+            upload["mime_type"],
+            upload["content_hash"],
+            upload["file_size"],
+            batch_id=batch_id,
+        )
+        return upload_data
+
+
+def _register_batch_documents(
+    batch_id: str, uploads: List[Dict[str, Any]]
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, str]]]:
+    """
+    Store and process the files of a batch, BATCH_EXTRACTION_CONCURRENCY at a time.
+
+    Each file gets its own thread and database session; extraction itself
+    runs in the extraction pool, so the files of a batch are extracted in
+    parallel up to EXTRACTION_POOL_SIZE processes.
+
+    Args:
+        batch_id: ID of the batch
+        uploads: Saved files (see _register_batch_upload)
+
+    Returns:
+        Tuple[List[Dict[str, Any]], List[Dict[str, str]]]: Upload response
+            fields of the processed documents, and the filename and error of
+            the files that failed, both in upload order
+    """
+    workers = max(1, min(len(uploads), app.config["BATCH_EXTRACTION_CONCURRENCY"]))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-upload") as executor:
+        futures = [executor.submit(_register_batch_upload, batch_id, upload) for upload in uploads]
+
+    documents, failed = [], []
+    for upload, future in zip(uploads, futures):
+        try:
+            documents.append(future.result())
+        except UploadError as e:
+            failed.append({"original_filename": upload["original_filename"], "error": str(e)})
+        except Exception as e:
+            _remove_upload(upload["save_path"])
+            app.logger.error(f"❌ Batch document error: {str(e)}")
+            failed.append({
+                "original_filename": upload["original_filename"],
+                "error": "Document processing failed",
+            })
+    return documents, failed
+
+
+def _confirm_paid_batch(
+    payment_intent_id: str,
+    batch_id: str,
+    analysis_options: Dict[str, Any],
+) -> Tuple[Dict[str, Any], int]:
+    """
+    Verify the payment of a batch with Stripe and queue its analyses, once per payment intent.
+
+    With webhooks enabled, waits for payment_intent.succeeded to record the
+    payment and only asks Stripe if it does not arrive in time. Concurrent
+    confirmations may both ask Stripe, but only one records the payment; the
+    other answers from it.
+
+    Args:
+        payment_intent_id: ID of the Stripe payment intent
+        batch_id: ID of the paid batch
+        analysis_options: Analysis options selected by the user (empty keeps
+            those selected at upload)
+
+    Returns:
+        Tuple[Dict[str, Any], int]: Response payload and HTTP status code
+    """
+    replay = replay_paid_batch(payment_intent_id, batch_id, analysis_options)
+    if replay is not None:
+        return replay
+    # No transaction stays open while waiting for the webhook or Stripe
+    db.session.commit()
+
+    if _webhooks_enabled():
+        with stage("webhook_wait"):
+            replay = _wait_for_webhook(
+                payment_intent_id,
+                functools.partial(replay_paid_batch, payment_intent_id, batch_id, analysis_options),
+            )
+        if replay is not None:
+            return replay
+
+    with stage("stripe_retrieve"):
+        payment_intent = confirm_payment_intent(payment_intent_id)
+    if payment_intent.status != "succeeded":
+        return {"error": "Payment not successful"}, 400
+    if (payment_intent.metadata or {}).get("batch_id") != batch_id:
+        app.logger.warning(f"🚫 Payment {payment_intent_id} does not pay for batch {batch_id}")
+        return {"error": "Payment does not belong to this batch"}, 409
+    with stage("record_payment"):
+        return record_paid_batch(payment_intent, batch_id, analysis_options)
+
+
 @app.route("/")
 def index() -> str:
     """Render the main application page."""
@@ -163,12 +1057,22 @@ def upload_file() -> Tuple[Response, int]:
     """
     save_path = None
     try:
-        # 1. File validation
-        if "file" not in request.files:
+        # 1. File validation (content type and size are checked while streaming)
+        try:
+            files = request.files
+        except RequestEntityTooLarge:
+            max_size_mb = app.config["MAX_CONTENT_LENGTH"] // (1024 * 1024)
+            app.logger.error("🚫 Upload rejected: file too large")
+            return jsonify({"error": f"File size must be less than {max_size_mb}MB"}), 413
+        except HTTPException as e:
+            app.logger.error(f"🚫 Upload rejected: {e.description}")
+            return jsonify({"error": e.description}), e.code
+
+        if "file" not in files:
             app.logger.error("🚫 No file part in the request")
             return jsonify({"error": "No file provided"}), 400
 
-        file = request.files["file"]
+        file = files["file"]
         if file.filename == "":
             app.logger.error("🚫 No file selected")
             return jsonify({"error": "No file selected"}), 400
@@ -181,71 +1085,52 @@ def upload_file() -> Tuple[Response, int]:
         try:
             unique_filename, _ = _generate_unique_filename(file.filename)
             save_path = os.path.join(app.config["UPLOAD_FOLDER"], unique_filename)
-            _save_uploaded_file(file, save_path)
+            with stage("save"):
+                content_hash, file_size = _save_uploaded_file(file, save_path)
+            with stage("store"):
+                save_path = _store_upload(unique_filename, save_path)
+        except HTTPException as e:
+            app.logger.error(f"🚫 Upload rejected: {e.description}")
+            return jsonify({"error": e.description}), e.code
         except OSError as e:
+            _remove_upload(save_path)
             app.logger.error(f"⚠️ File save error: {str(e)}")
             return jsonify({"error": "Failed to save file"}), 500
 
-        # 3. Process document and calculate cost
+        # 3. Process document (or estimate its size) and store it
+        client_token = _parse_client_token(request.form.get("client_token"))
         try:
-            document_metadata = process_document(save_path)
-            char_count = document_metadata["char_count"]
-            analysis_cost = _calculate_analysis_cost(char_count)
-            app.logger.info(f"💰 Analysis cost: ¥{analysis_cost / 100:.2f} for {char_count} characters")
-        except Exception as e:
-            if save_path and os.path.exists(save_path):
-                os.remove(save_path)
-            app.logger.error(f"⚠️ Processing error: {str(e)}")
-            return jsonify({"error": "Document processing failed"}), 500
-
-        # 4. Database entry
-        try:
-            document = Document(
-                filename=unique_filename,
-                original_filename=file.filename,
-                file_size=os.path.getsize(save_path),
-                mime_type=file.content_type,
-                char_count=char_count,
-                analysis_cost=analysis_cost,
-                title=document_metadata["title"],
-                text_content_file_path=document_metadata["text_content_file_path"]
+            upload_data, reused_intent = _register_document(
+                save_path,
+                unique_filename,
+                file.filename,
+                file.content_type,
+                content_hash,
+                file_size,
+                client_token,
             )
-            db.session.add(document)
-            db.session.commit()
-        except Exception as e:
-            if save_path and os.path.exists(save_path):
-                os.remove(save_path)
-            app.logger.error(f"⚠️ Database error: {str(e)}")
-            return jsonify({"error": "Failed to save document info"}), 500
+        except UploadError as e:
+            return jsonify({"error": str(e)}), e.status_code
 
-        # 5. Create payment intent and return response
+        # 4. Create (or reuse) the payment intent and return response
         try:
-            payment_data = _process_payment(analysis_cost)
-            # Use current date if metadata date fails (fallback logic)
-            upload_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-            return jsonify({
-                "document_id": document.id,
-                "title": document_metadata["title"],
-                "original_filename": file.filename,
-                "char_count": char_count,
-                "file_size": os.path.getsize(save_path),
-                "mime_type": file.content_type,
-                "upload_date": upload_date,
-                "analysis_cost": analysis_cost,
-                "text_content_file_path": document_metadata["text_content_file_path"],
-                **payment_data
-            }), 200
-
+            metadata = _intent_metadata(
+                upload_data["document_id"],
+                _parse_analysis_options(request.form.get("analysis_options")),
+                request.form.get("stream") == "true",
+            )
+            with stage("payment_intent"):
+                payment_data = _process_payment(
+                    upload_data, metadata, content_hash, client_token, reused_intent
+                )
+            return jsonify({**upload_data, **payment_data}), 200
         except Exception as e:
-            if save_path and os.path.exists(save_path):
-                os.remove(save_path)
+            _remove_upload(save_path)
             app.logger.error(f"⚠️ Payment error: {str(e)}")
             return jsonify({"error": "Payment setup failed"}), 500
 
     except Exception as e:
-        if save_path and os.path.exists(save_path):
-            os.remove(save_path)
+        _remove_upload(save_path)
         app.logger.error(f"❌ Unexpected error: {str(e)}")
         return jsonify({"error": "An unexpected error occurred"}), 500
 
@@ -253,7 +1138,12 @@ def upload_file() -> Tuple[Response, int]:
 @app.route("/payment/success", methods=["POST"])
 def payment_success() -> Tuple[Response, int]:
     """
-    Handle successful payment and trigger document analysis.
+    Handle successful payment and queue the document analysis.
+
+    The analysis itself runs on a background worker; the client follows the
+    returned job via the status and result endpoints. Repeated calls for the
+    same payment intent return the same job, including the one queued by the
+    payment_intent.succeeded webhook.
 
     Returns:
         Tuple[Response, int]: JSON response and HTTP status code
@@ -263,42 +1153,439 @@ def payment_success() -> Tuple[Response, int]:
         payment_intent_id = data.get("payment_intent_id")
         document_id = data.get("document_id")
         analysis_options = data.get("analysis_options", {})
+        stream = bool(data.get("stream", False))
 
         if not payment_intent_id or not document_id:
             return jsonify({"error": "Missing required parameters"}), 400
 
-        # Verify payment intent
-        payment_intent = confirm_payment_intent(payment_intent_id)
-        if payment_intent.status != "succeeded":
-            return jsonify({"error": "Payment not successful"}), 400
-
-        # Get document and create payment record
-        document = Document.query.get(document_id)
-        if not document:
-            return jsonify({"error": "Document not found"}), 404
-
-        payment = Payment(
-            stripe_payment_id=payment_intent_id,
-            amount=payment_intent.amount,
-            currency=payment_intent.currency,
-            status=payment_intent.status,
-            document_id=document_id,
+        payload, status_code = _confirm_paid_analysis(
+            payment_intent_id, document_id, analysis_options, stream
         )
-        db.session.add(payment)
+        return jsonify(payload), status_code
+
+    except Exception as e:
+        app.logger.error(f"❌ Payment processing error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
-        # Read document content from the unique file
-        text_content_file_path = document.text_content_file_path
-        with open(text_content_file_path, "r", encoding="utf-8") as file:
-            text_content = file.read()
 
-        # Process document with AI by passing the document text content
-        analysis_result = analyze_document(text_content, analysis_options)
-        document.analysis_summary = analysis_result["summary"]
-        db.session.commit()
+@app.route("/stripe/webhook", methods=["POST"])
+def stripe_webhook() -> Tuple[Response, int]:
+    """
+    Receive Stripe events and queue the analysis as soon as a payment succeeds.
 
-        app.logger.info(f"✅ Document analysis completed for {document.id}")
-        return jsonify({"success": True, "analysis": analysis_result}), 200
+    The Stripe-Signature header is verified against STRIPE_WEBHOOK_SECRET.
+    Every payment_intent.* event updates the tracked intent status and the
+    local intent state cache; payment_intent.succeeded also queues the
+    analysis. Other events are acknowledged.
+    A 5xx response makes Stripe redeliver the event, which is safe because
+    recording the payment is idempotent.
 
+    Returns:
+        Tuple[Response, int]: JSON response and HTTP status code
+    """
+    if not app.config["STRIPE_WEBHOOK_SECRET"]:
+        return jsonify({"error": "Webhooks are disabled"}), 404
+
+    import stripe
+
+    try:
+        with stage("verify_signature"):
+            event = construct_webhook_event(
+                request.get_data(), request.headers.get("Stripe-Signature", "")
+            )
+    except ValueError:
+        app.logger.error("🚫 Webhook rejected: invalid payload")
+        return jsonify({"error": "Invalid payload"}), 400
+    except stripe.error.SignatureVerificationError:
+        app.logger.error("🚫 Webhook rejected: invalid signature")
+        return jsonify({"error": "Invalid signature"}), 400
+
+    if not event.type.startswith("payment_intent."):
+        return jsonify({"received": True}), 200
+
+    try:
+        payment_intent = event.data.object
+        remember_payment_intent(payment_intent)
+        if event.type != "payment_intent.succeeded":
+            record_intent_status(payment_intent.id, payment_intent.status)
+            return jsonify({"received": True}), 200
+        with stage("record_payment"):
+            payload, status_code = _record_webhook_payment(payment_intent)
     except Exception as e:
-        app.logger.error(f"❌ Payment processing error: {str(e)}")
+        db.session.rollback()
+        app.logger.error(f"❌ Webhook processing error: {str(e)}")
+        return jsonify({"error": "Webhook processing failed"}), 500
+    return jsonify({"received": True, "status": status_code, "job_id": payload.get("job_id")}), 200
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id: str) -> Tuple[Response, int]:
+    """
+    Report the state of an analysis job.
+
+    Args:
+        job_id: ID of the analysis job
+
+    Returns:
+        Tuple[Response, int]: JSON response and HTTP status code
+    """
+    job = db.session.get(AnalysisJob, job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(serialize_job(job)), 200
+
+
+@app.route("/jobs/<job_id>/result", methods=["GET"])
+def job_result(job_id: str) -> Tuple[Response, int]:
+    """
+    Serve the output of a finished analysis job.
+
+    Args:
+        job_id: ID of the analysis job
+
+    Returns:
+        Tuple[Response, int]: JSON response and HTTP status code
+            (202 while the job is still pending)
+    """
+    job = db.session.get(AnalysisJob, job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+
+    if job.status == JOB_SUCCEEDED:
+        return jsonify({"success": True, "analysis": job.result}), 200
+    if job.status == JOB_FAILED:
+        return jsonify({"error": job.error or "Analysis failed"}), 500
+    return jsonify(serialize_job(job)), 202
+
+
+@app.route("/jobs/<job_id>/analysis", methods=["GET"])
+def job_analysis(job_id: str) -> Response:
+    """
+    Serve the stored analysis of a job.
+
+    Keyed by the unguessable job id: sequential document ids would let anyone
+    enumerate every paid analysis. The response carries the result's ETag and
+    Last-Modified; a request with a matching If-None-Match gets 304 Not
+    Modified without a body.
+
+    Args:
+        job_id: ID of the analysis job
+
+    Returns:
+        Response: JSON response (404 if the job has no stored analysis)
+    """
+    analysis_result = get_job_analysis_result(job_id)
+    if analysis_result is None:
+        return jsonify({"error": "Analysis not found"}), 404
+
+    response = jsonify({"success": True, "analysis": serialize_analysis_result(analysis_result)})
+    response.set_etag(analysis_result.etag)
+    response.last_modified = analysis_result.created_at
+    # Clients may keep a copy but must revalidate it
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def _format_sse(event: str, data: Dict[str, Any]) -> str:
+    """
+    Format a Server-Sent Events message.
+
+    Args:
+        event: Event name
+        data: JSON-serializable event payload
+
+    Returns:
+        str: The encoded SSE message
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.route("/jobs/<job_id>/stream", methods=["GET"])
+def job_stream(job_id: str) -> Tuple[Response, int]:
+    """
+    Stream an analysis job to the browser over Server-Sent Events.
+
+    If the job is still queued, this request claims it and runs the streaming
+    analyzer inline, pushing "section" and "delta" events as lines arrive.
+    Otherwise it follows the worker that owns the job with "status" events.
+    Either way the stream ends with a "done" or "error" event.
+
+    Args:
+        job_id: ID of the analysis job
+
+    Returns:
+        Tuple[Response, int]: A text/event-stream response and HTTP status code
+    """
+    if not db.session.get(AnalysisJob, job_id):
+        return jsonify({"error": "Job not found"}), 404
+    db.session.commit()
+
+    def generate():
+        if claim_job(job_id):
+            try:
+                for event in stream_job(job_id):
+                    yield _format_sse(event["event"], event)
+                return
+            except Exception as e:
+                app.logger.error(f"❌ Streaming analysis error: {str(e)}")
+
+        # Another worker owns the job (or it was re-queued): report progress
+        while True:
+            db.session.expire_all()
+            job = db.session.get(AnalysisJob, job_id)
+            if job.status == JOB_SUCCEEDED:
+                message = _format_sse("done", {"event": "done", "analysis": job.result})
+            elif job.status == JOB_FAILED:
+                message = _format_sse("error", {"error": job.error or "Analysis failed"})
+            else:
+                message = _format_sse("status", serialize_job(job))
+            # A slow client must not hold the read transaction open
+            db.session.commit()
+            yield message
+            if job.status in (JOB_SUCCEEDED, JOB_FAILED):
+                return
+            time.sleep(app.config["ANALYSIS_JOB_POLL_INTERVAL"])
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    ), 200
+
+
+@app.route("/batches", methods=["POST"])
+def upload_batch() -> Tuple[Response, int]:
+    """
+    Handle a multi-file upload: process the files in parallel, price them
+    together and create one payment intent for the whole batch.
+
+    The request carries up to BATCH_MAX_FILES "files" parts (each limited to
+    MAX_CONTENT_LENGTH, the whole request to BATCH_MAX_CONTENT_LENGTH) and
+    the optional analysis_options form field. Files that cannot be processed
+    are reported under "failed" and left out of the price.
+
+    Returns:
+        Tuple[Response, int]: JSON response and HTTP status code
+    """
+    uploads = []
+    try:
+        request.max_content_length = app.config["BATCH_MAX_CONTENT_LENGTH"]
+        try:
+            files = [file for file in request.files.getlist("files") if file.filename]
+        except RequestEntityTooLarge:
+            max_size_mb = app.config["BATCH_MAX_CONTENT_LENGTH"] // (1024 * 1024)
+            app.logger.error("🚫 Batch rejected: upload too large")
+            return jsonify({"error": f"Batch size must be less than {max_size_mb}MB"}), 413
+        except HTTPException as e:
+            app.logger.error(f"🚫 Batch rejected: {e.description}")
+            return jsonify({"error": e.description}), e.code
+
+        if not files:
+            app.logger.error("🚫 No files in the batch")
+            return jsonify({"error": "No file provided"}), 400
+        if len(files) > app.config["BATCH_MAX_FILES"]:
+            app.logger.error(f"🚫 Batch rejected: {len(files)} files")
+            max_files = app.config["BATCH_MAX_FILES"]
+            return jsonify({"error": f"At most {max_files} files per batch"}), 400
+        invalid = [file.filename for file in files if not _allowed_file(file.filename)]
+        if invalid:
+            app.logger.error(f"🚫 Invalid file types in batch: {invalid}")
+            return jsonify({
+                "error": "Invalid file type. Only PDF and DOCX files are allowed",
+                "files": invalid,
+            }), 400
+
+        # 1. Save every file; a mismatched file rejects the whole batch, as
+        # it would have while the request was parsed
+        try:
+            with stage("save"):
+                for file in files:
+                    unique_filename, _ = _generate_unique_filename(file.filename)
+                    save_path = os.path.join(app.config["UPLOAD_FOLDER"], unique_filename)
+                    content_hash, file_size = _save_uploaded_file(file, save_path)
+                    uploads.append({
+                        "save_path": save_path,
+                        "unique_filename": unique_filename,
+                        "original_filename": file.filename,
+                        "mime_type": file.content_type,
+                        "content_hash": content_hash,
+                        "file_size": file_size,
+                    })
+        except HTTPException as e:
+            for upload in uploads:
+                _remove_upload(upload["save_path"])
+            app.logger.error(f"🚫 Batch rejected: {e.description}")
+            return jsonify({"error": e.description, "files": [file.filename]}), e.code
+        except OSError as e:
+            for upload in uploads:
+                _remove_upload(upload["save_path"])
+            app.logger.error(f"⚠️ File save error: {str(e)}")
+            return jsonify({"error": "Failed to save file"}), 500
+
+        # 2. Store and process the files in parallel, then price the batch
+        batch_id = create_batch(_parse_analysis_options(request.form.get("analysis_options")))
+        with stage("process_documents"):
+            documents, failed = _register_batch_documents(batch_id, uploads)
+        if not documents:
+            return jsonify({"error": "Document processing failed", "failed": failed}), 500
+        amount = sum(document["analysis_cost"] for document in documents)
+        set_batch_amount(batch_id, amount)
+        app.logger.info(
+            f"💰 Batch {batch_id}: {len(documents)} document(s) for ¥{amount / 100:.2f}"
+            + (f", {len(failed)} failed" if failed else "")
+        )
+
+        # 3. One payment intent for the whole batch
+        try:
+            with stage("payment_intent"):
+                payment_intent = create_payment_intent(
+                    amount, metadata=batch_intent_metadata(batch_id)
+                )
+                record_intent(payment_intent, None, batch_id=batch_id)
+        except Exception as e:
+            for upload in uploads:
+                _remove_upload(upload["save_path"])
+            app.logger.error(f"⚠️ Batch payment error: {str(e)}")
+            return jsonify({"error": "Payment setup failed"}), 500
+
+        return jsonify({
+            "batch_id": batch_id,
+            "documents": documents,
+            "failed": failed,
+            **_payment_data(payment_intent.client_secret, amount),
+            **_batch_urls(batch_id),
+        }), 200
+
+    except Exception as e:
+        for upload in uploads:
+            _remove_upload(upload["save_path"])
+        app.logger.error(f"❌ Unexpected batch error: {str(e)}")
+        return jsonify({"error": "An unexpected error occurred"}), 500
+
+
+@app.route("/batches/<batch_id>/payment", methods=["POST"])
+def batch_payment(batch_id: str) -> Tuple[Response, int]:
+    """
+    Handle the successful payment of a batch and queue one analysis per document.
+
+    Repeated calls for the same payment intent, and the webhook, answer
+    with the same jobs.
+
+    Args:
+        batch_id: ID of the paid batch
+
+    Returns:
+        Tuple[Response, int]: JSON response (the batch status) and HTTP status code
+    """
+    try:
+        data = request.get_json()
+        payment_intent_id = data.get("payment_intent_id")
+        if not payment_intent_id:
+            return jsonify({"error": "Missing required parameters"}), 400
+
+        payload, status_code = _confirm_paid_batch(
+            payment_intent_id, batch_id, data.get("analysis_options", {})
+        )
+        return jsonify(_with_batch_urls(payload)), status_code
+
+    except Exception as e:
+        app.logger.error(f"❌ Batch payment processing error: {str(e)}")
         return jsonify({"error": str(e)}), 500
+
+
+@app.route("/batches/<batch_id>", methods=["GET"])
+def batch_status(batch_id: str) -> Tuple[Response, int]:
+    """
+    Report the state of a batch and of the analysis of each of its documents.
+
+    Args:
+        batch_id: ID of the batch
+
+    Returns:
+        Tuple[Response, int]: JSON response and HTTP status code
+    """
+    payload = serialize_batch(batch_id)
+    if payload is None:
+        return jsonify({"error": "Batch not found"}), 404
+    return jsonify(_with_batch_urls(payload)), 200
+
+
+@app.route("/batches/<batch_id>/stream", methods=["GET"])
+def batch_stream(batch_id: str) -> Tuple[Response, int]:
+    """
+    Stream the analyses of a batch as Server-Sent Events, as each one completes.
+
+    A "document" event carries each finished document with its analysis
+    (or error) as soon as it is done, a "status" event the batch counts
+    whenever they change, and a final "done" event the batch status once
+    every analysis has finished.
+
+    Args:
+        batch_id: ID of the batch
+
+    Returns:
+        Tuple[Response, int]: A text/event-stream response and HTTP status code
+    """
+    if serialize_batch(batch_id) is None:
+        return jsonify({"error": "Batch not found"}), 404
+
+    def generate():
+        reported, last_counts = set(), None
+        while True:
+            payload = _with_batch_urls(serialize_batch(batch_id))
+            messages = []
+            for document in payload["documents"]:
+                finished = document["status"] in (JOB_SUCCEEDED, JOB_FAILED)
+                if not finished or document["job_id"] in reported:
+                    continue
+                reported.add(document["job_id"])
+                if document["status"] == JOB_SUCCEEDED:
+                    document["analysis"] = db.session.get(AnalysisJob, document["job_id"]).result
+                messages.append(_format_sse("document", {"event": "document", **document}))
+            summary = {key: value for key, value in payload.items() if key != "documents"}
+            if (payload["status"], payload["counts"]) != last_counts:
+                last_counts = (payload["status"], payload["counts"])
+                messages.append(_format_sse("status", {"event": "status", **summary}))
+            # A slow client must not hold the read transaction open
+            db.session.commit()
+            if messages:
+                yield "".join(messages)
+            if payload["status"] == BATCH_COMPLETED:
+                yield _format_sse("done", {"event": "done", **summary})
+                return
+            time.sleep(app.config["ANALYSIS_JOB_POLL_INTERVAL"])
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    ), 200
+
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats() -> Tuple[Response, int]:
+    """
+    Report hit/miss counters and sizes of the extraction and analysis caches.
+
+    Returns:
+        Tuple[Response, int]: JSON response and HTTP status code
+    """
+    return jsonify({
+        "extraction": extraction_cache.stats(),
+        "analysis": result_cache.stats(),
+    }), 200
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics() -> Tuple[Response, int]:
+    """
+    Expose latency histograms and counters in the Prometheus text format.
+
+    Returns:
+        Tuple[Response, int]: Metrics response and HTTP status code
+    """
+    if not app.config["METRICS_ENABLED"]:
+        return jsonify({"error": "Metrics are disabled"}), 404
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type), 200
@@ -74,6 +74,8 @@ document.addEventListener('DOMContentLoaded', function() {
     let currentDocumentId;
     let clientSecret;
     let currentAnalysis = null;
+    let pendingStreamContent = '';
+    let streamRenderFrame = null;
 
     // Theme handling
     function initTheme() {
@@ -147,6 +149,11 @@ document.addEventListener('DOMContentLoaded', function() {
     function uploadFile(file) {
         const formData = new FormData();
         formData.append('file', file);
+        // Recorded on the payment intent, so the payment webhook can queue the analysis
+        formData.append('analysis_options', JSON.stringify(getAnalysisOptions()));
+        formData.append('stream', typeof EventSource !== 'undefined');
+        // Lets a re-upload of the same file reuse its unpaid payment intent
+        formData.append('client_token', getClientToken());
 
         progressContainer.classList.remove('d-none');
         paymentContainer.classList.add('d-none');
@@ -234,7 +241,8 @@ document.addEventListener('DOMContentLoaded', function() {
 
         updateField('docTitle', data.title || 'Untitled');
         updateField('docFilename', data.original_filename || '');
-        updateField('docCharCount', (data.char_count || 0).toLocaleString());
+        // Estimated counts (priced before full extraction) are shown as approximate
+        updateField('docCharCount', `${data.char_count_estimated ? '≈ ' : ''}${(data.char_count || 0).toLocaleString()}`);
         updateField('docFileSize', formatFileSize(data.file_size || 0));
         updateField('docMimeType', data.mime_type || '');
         updateField('docUploadDate', data.upload_date || '');
@@ -315,20 +323,30 @@ document.addEventListener('DOMContentLoaded', function() {
                 body: JSON.stringify({
                     payment_intent_id: clientSecret.split('_secret_')[0],
                     document_id: currentDocumentId,
-                    analysis_options: getAnalysisOptions()
+                    analysis_options: getAnalysisOptions(),
+                    stream: typeof EventSource !== 'undefined'
                 })
             });
 
-            const result = await response.json();
+            const job = await response.json();
 
             if (!response.ok) {
-                throw new Error(result.error || 'Error processing payment');
+                throw new Error(job.error || 'Error processing payment');
             }
 
             paymentContainer.classList.add('d-none');
-            showResults(result);
             showToast('Payment successful', 'success');
 
+            // The analysis runs in the background; stream it when the browser
+            // supports Server-Sent Events, otherwise wait for the job to finish
+            progressContainer.classList.remove('d-none');
+            updateLoadingState('analyzeStep', 90);
+            const result = typeof EventSource !== 'undefined'
+                ? await streamJobResult(job)
+                : await waitForJobResult(job.result_url);
+            progressContainer.classList.add('d-none');
+            showResults(result);
+
         } catch (error) {
             showError(error.message || 'Payment failed');
             submitButton.disabled = false;
@@ -336,6 +354,67 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
+    function streamJobResult(job) {
+        // Render section deltas as they arrive and resolve with the final result
+        return new Promise((resolve, reject) => {
+            const source = new EventSource(job.stream_url);
+            let streamedContent = '';
+
+            source.addEventListener('delta', (event) => {
+                const data = JSON.parse(event.data);
+                streamedContent += data.text;
+                progressContainer.classList.add('d-none');
+                showStreamingResults(streamedContent);
+            });
+
+            source.addEventListener('done', (event) => {
+                source.close();
+                resolve(JSON.parse(event.data));
+            });
+
+            source.addEventListener('error', (event) => {
+                source.close();
+                if (event.data) {
+                    reject(new Error(JSON.parse(event.data).error || 'Error analyzing document'));
+                } else {
+                    // Connection dropped: fall back to polling the job
+                    waitForJobResult(job.result_url).then(resolve, reject);
+                }
+            });
+        });
+    }
+
+    async function waitForJobResult(resultUrl, interval = 2000) {
+        // Poll the job result endpoint until the analysis has finished
+        while (true) {
+            const response = await fetch(resultUrl);
+            const data = await response.json();
+
+            if (response.status === 200) {
+                return data;
+            }
+            if (response.status !== 202) {
+                progressContainer.classList.add('d-none');
+                throw new Error(data.error || 'Error analyzing document');
+            }
+
+            await new Promise(resolve => setTimeout(resolve, interval));
+        }
+    }
+
+    function getClientToken() {
+        try {
+            let token = localStorage.getItem('checkoutClientToken');
+            if (!token && window.crypto && crypto.randomUUID) {
+                token = crypto.randomUUID();
+                localStorage.setItem('checkoutClientToken', token);
+            }
+            return token || '';
+        } catch (error) {
+            return '';
+        }
+    }
+
     function getAnalysisOptions() {
         return {
             characterAnalysis: document.getElementById('characterAnalysis').checked,
@@ -348,8 +427,29 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     function showResults(data) {
+        // A frame still pending from the last deltas must not overwrite the final analysis
+        if (streamRenderFrame !== null) {
+            cancelAnimationFrame(streamRenderFrame);
+            streamRenderFrame = null;
+        }
         currentAnalysis = data;
-        const analysisContent = data.analysis.summary;
+        renderAnalysisSections(data.analysis.summary, false);
+
+        // Automatically expand the first section
+        setTimeout(() => toggleSection('summary'), 100);
+    }
+
+    function showStreamingResults(analysisContent) {
+        // Re-render at most once per animation frame while deltas arrive
+        pendingStreamContent = analysisContent;
+        if (streamRenderFrame !== null) return;
+        streamRenderFrame = requestAnimationFrame(() => {
+            streamRenderFrame = null;
+            renderAnalysisSections(pendingStreamContent, true);
+        });
+    }
+
+    function renderAnalysisSections(analysisContent, expanded) {
         const accordion = document.getElementById('analysisAccordion');
         accordion.innerHTML = ''; // Clear existing content
 
@@ -380,7 +480,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 <div class="analysis-section-wrapper">
                     <div class="analysis-section-header" 
                          role="button"
-                         aria-expanded="false"
+                         aria-expanded="${expanded}"
                          aria-controls="section-${section.id}"
                          tabindex="0"
                          onclick="toggleSection('${section.id}')">
@@ -391,7 +491,7 @@ document.addEventListener('DOMContentLoaded', function() {
                         <i data-feather="chevron-down" class="chevron-icon" aria-hidden="true"></i>
                     </div>
                     <div id="section-${section.id}" 
-                         class="analysis-section-content"
+                         class="analysis-section-content${expanded ? ' active' : ''}"
                          role="region"
                          aria-labelledby="header-${section.id}">
                         <div class="analysis-content">${formatContent(content)}</div>
@@ -404,9 +504,6 @@ document.addEventListener('DOMContentLoaded', function() {
         // Initialize Feather icons for the new content
         feather.replace();
         resultContainer.classList.remove('d-none');
-
-        // Automatically expand the first section
-        setTimeout(() => toggleSection('summary'), 100);
     }
 
     function formatContent(content) {
@@ -0,0 +1,125 @@
+"""
+@file-overview Idempotency of payment confirmation under concurrent duplicates.
+@filepath tests/test_payment_idempotency.py
+
+Runs the app (WSGI and ASGI entry points) as a subprocess against the fake
+Stripe and OpenAI servers of benchmarks/, uploads one document, then fires
+parallel /payment/success calls for its payment intent while the customer
+"pays" (the fake Stripe delivers payment_intent.succeeded) and the event is
+redelivered. Every confirmation must answer with the same job, and the
+database must hold exactly one Payment and one AnalysisJob for the intent.
+
+Usage:
+    python -m pytest tests
+"""
+
+import argparse
+import os
+import socket
+import sqlite3
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import pytest
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROJECT_DIR, "benchmarks"))
+
+import fake_openai  # noqa: E402
+import fake_stripe  # noqa: E402
+import load_test  # noqa: E402
+from corpus import write_document  # noqa: E402
+
+# Duplicate /payment/success calls sent at once
+CONFIRMATIONS = 8
+
+
+def _free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def _serve(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+@pytest.mark.parametrize("server", ["wsgi", "asgi"])
+def test_concurrent_confirmations_record_one_payment(server, tmp_path):
+    workdir = str(tmp_path)
+    port = _free_port()
+    webhook_url = f"http://127.0.0.1:{port}/stripe/webhook"
+    openai = fake_openai.make_server(latency=0.1)
+    stripe = fake_stripe.make_server(
+        latency=0.05, webhook_url=webhook_url, webhook_secret=load_test.WEBHOOK_SECRET
+    )
+    openai_url, stripe_url = _serve(openai), _serve(stripe)
+    args = argparse.Namespace(
+        port=port,
+        nodes=1,
+        server=server,
+        webhooks=True,
+        batch_concurrency=None,
+        startup_timeout=60,
+    )
+    process, base_url = load_test.start_app(args, workdir, f"{openai_url}/v1", stripe_url)
+    try:
+        with httpx.Client(base_url=base_url, timeout=60) as client:
+            path = write_document(workdir, ("docx", 20))
+            with open(path, "rb") as upload_file:
+                upload = client.post(
+                    "/upload", files={"file": (os.path.basename(path), upload_file)}
+                )
+            assert upload.status_code == 200, upload.text
+            document_id = upload.json()["document_id"]
+            intent_id = upload.json()["client_secret"].split("_secret_")[0]
+
+            def confirm():
+                return client.post(
+                    "/payment/success",
+                    json={"payment_intent_id": intent_id, "document_id": document_id},
+                )
+
+            def pay():
+                # The customer pays: the intent succeeds and the webhook is delivered
+                confirmation = httpx.post(f"{stripe_url}/v1/payment_intents/{intent_id}/confirm")
+                confirmation.raise_for_status()
+
+            def redeliver():
+                with stripe.lock:
+                    intent = dict(stripe.intents[intent_id], status="succeeded")
+                event = fake_stripe.build_event("payment_intent.succeeded", intent)
+                return fake_stripe.deliver_webhook(webhook_url, load_test.WEBHOOK_SECRET, event)
+
+            with ThreadPoolExecutor(max_workers=CONFIRMATIONS + 2) as executor:
+                confirmations = [executor.submit(confirm) for _ in range(CONFIRMATIONS)]
+                executor.submit(pay).result()
+                redelivery = executor.submit(redeliver)
+                responses = [future.result() for future in confirmations]
+                assert redelivery.result() == 200
+
+        assert all(response.status_code in (200, 202) for response in responses), [
+            response.text for response in responses
+        ]
+        job_ids = {response.json()["job_id"] for response in responses}
+        assert len(job_ids) == 1
+        assert stripe.stats["webhook_200"] >= 1
+
+        with sqlite3.connect(os.path.join(workdir, "benchmark.db")) as database:
+            payments = database.execute(
+                "SELECT id, document_id FROM payment WHERE stripe_payment_id = ?", (intent_id,)
+            ).fetchall()
+            assert len(payments) == 1
+            assert payments[0][1] == document_id
+            jobs = database.execute(
+                "SELECT id FROM analysis_job WHERE document_id = ?", (document_id,)
+            ).fetchall()
+            assert [job_id for (job_id,) in jobs] == list(job_ids)
+    finally:
+        process.terminate()
+        process.wait(10)
+        openai.shutdown()
+        stripe.shutdown()
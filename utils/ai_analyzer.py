@@ -1,58 +1,55 @@
-from openai import OpenAI
 from app import app
-import os
+import asyncio
+import contextvars
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from utils.async_runtime import run_sync
+from utils.metrics import record_openai_usage
+from utils.openai_client import OpenAIUnavailableError, chat_completions
+from utils.prompt_budget import estimate_tokens, fit_to_budget, get_input_token_budget
+from utils.result_cache import make_cache_key, result_cache
+from utils.trace_sink import NULL_TRACE, start_trace
 
 
-# the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
-# do not change this unless explicitly requested by the user
+# utils/ai_analyzer.py
 
-client = OpenAI(api_key=app.config["OPENAI_API_KEY"])
+# Analysis sections in canonical display order, keyed by the front-end option
+SECTION_OPTIONS = [
+    ("characterAnalysis", "人物分析"),
+    ("plotAnalysis", "情节分析"),
+    ("thematicAnalysis", "主题分析"),
+    ("readabilityAssessment", "可读性评估"),
+    ("sentimentAnalysis", "情感分析"),
+    ("styleConsistency", "风格和一致性"),
+]
+SUMMARY_SECTION = "摘要"
+ALL_SECTIONS = [SUMMARY_SECTION] + [section for _, section in SECTION_OPTIONS]
 
+# Matches a section heading line such as "人物分析：" or "**人物分析：**"
+_SECTION_HEADING_RE = re.compile(
+    r"^[#*\s]*(" + "|".join(ALL_SECTIONS) + r")\s*[*]*\s*[：:]"
+)
 
-# utils/ai_analyzer.py
+# Token usage of the analysis in progress, summed over all of its requests.
+# Executor threads run in a copy of the submitting context so they add to it.
+_usage = contextvars.ContextVar("analysis_usage", default=None)
+_usage_lock = threading.Lock()
 
 
-def analyze_document(text_content, analysis_options=None):
-    """Analyze document content using OpenAI GPT-4o."""
-    try:
-        # Filter enabled analysis options
-        if analysis_options:
-            sections = []
-            if analysis_options.get("characterAnalysis"):
-                sections.append("人物分析")
-            if analysis_options.get("plotAnalysis"):
-                sections.append("情节分析")
-            if analysis_options.get("thematicAnalysis"):
-                sections.append("主题分析")
-            if analysis_options.get("readabilityAssessment"):
-                sections.append("可读性评估")
-            if analysis_options.get("sentimentAnalysis"):
-                sections.append("情感分析")
-            if analysis_options.get("styleConsistency"):
-                sections.append("风格和一致性")
-        else:
-            sections = [
-                "人物分析",
-                "情节分析",
-                "主题分析",
-                "可读性评估",
-                "情感分析",
-                "风格和一致性",
-            ]
-
-        # Build dynamic system prompt based on selected sections
-        system_prompt = """
-                        你是一位专业的文档分析专家。请用中文分析这篇文档，确保每个部分都提供详细的分析（至少2-3段）：
-
-                            摘要：
-                            [请用3-5句话简明扼要地总结文档的关键点和主要信息]
+def _get_enabled_sections(analysis_options):
+    """Return the analysis sections enabled in analysis_options (all if empty)."""
+    if analysis_options:
+        return [
+            section
+            for option, section in SECTION_OPTIONS
+            if analysis_options.get(option)
+        ]
+    return [section for _, section in SECTION_OPTIONS]
 
-                        """
-        # Add selected sections to prompt
-        for section in sections:
-            system_prompt += f"\n{section}：\n[详细分析{section}的内容，至少2-3段]\n"
 
-        system_prompt += """
+_ANALYSIS_GUIDELINES = """
                         分析指南：
                         - 每个部分都必须提供详细、有实质内容的分析
                         - 保持格式统一，使用适当的中文标点
@@ -62,60 +59,829 @@ def analyze_document(text_content, analysis_options=None):
                         - 分析要具体且有见地，避免泛泛而谈
                         """
 
-        app.logger.info("📤 Sending request to OpenAI for document analysis")
-        response = client.chat.completions.create(
+_REDUCE_INSTRUCTIONS = """
+                        注意：输入内容是同一篇长文档各部分按顺序整理的分析笔记，而不是原文。
+                        请综合所有部分的笔记，按上述格式写出对整篇文档的完整分析。
+                        """
+
+
+def _build_system_prompt(sections, from_notes=False):
+    """Build the dynamic system prompt for the selected sections."""
+    system_prompt = """
+                        你是一位专业的文档分析专家。请用中文分析这篇文档，确保每个部分都提供详细的分析（至少2-3段）：
+
+                            摘要：
+                            [请用3-5句话简明扼要地总结文档的关键点和主要信息]
+
+                        """
+    # Add selected sections to prompt
+    for section in sections:
+        system_prompt += f"\n{section}：\n[详细分析{section}的内容，至少2-3段]\n"
+
+    system_prompt += _ANALYSIS_GUIDELINES
+    if from_notes:
+        system_prompt += _REDUCE_INSTRUCTIONS
+    return system_prompt
+
+
+def _build_section_prompt(section, from_notes=False):
+    """Build the system prompt for a single section (fan-out mode)."""
+    if section == SUMMARY_SECTION:
+        instruction = "请用3-5句话简明扼要地总结文档的关键点和主要信息"
+    else:
+        instruction = f"详细分析{section}的内容，至少2-3段"
+
+    system_prompt = f"""
+                        你是一位专业的文档分析专家。请用中文分析这篇文档，只撰写以下这一个部分，并以“{section}：”开头：
+
+                            {section}：
+                            [{instruction}]
+
+                        """
+    system_prompt += _ANALYSIS_GUIDELINES
+    if from_notes:
+        system_prompt += _REDUCE_INSTRUCTIONS
+    return system_prompt
+
+
+def _clean_line(line):
+    """Remove a numbered prefix such as "1." from a line of analysis output."""
+    if any(line.strip().startswith(str(i) + ".") for i in range(1, 10)):
+        return line.split(".", 1)[1].strip()
+    return line
+
+
+def _clean_analysis(analysis):
+    """Remove any numbered prefixes and clean up formatting."""
+    return "\n".join(_clean_line(line) for line in analysis.split("\n"))
+
+
+def _check_sections(cleaned_analysis):
+    """Ensure each section has content, logging the empty ones."""
+    for section in ALL_SECTIONS:
+        if f"{section}：\n暂无内容" in cleaned_analysis:
+            app.logger.warning(f"⚠️ Empty content detected in section: {section}")
+
+
+def split_sections(analysis):
+    """
+    Split an analysis into its sections.
+
+    Args:
+        analysis (str): The cleaned analysis text.
+
+    Returns:
+        dict: Section name -> section text (without the heading), in the
+            order the sections appear.
+    """
+    sections = {}
+    current_section = None
+    for line in analysis.split("\n"):
+        heading = _SECTION_HEADING_RE.match(line)
+        if heading:
+            current_section = heading.group(1)
+            sections.setdefault(current_section, [])
+            line = line[heading.end():]
+        if current_section is not None:
+            sections[current_section].append(line)
+    return {section: "\n".join(lines).strip() for section, lines in sections.items()}
+
+
+def _start_usage():
+    """Start summing the token usage of a new analysis in the current context."""
+    _usage.set({"requests": 0, "prompt_tokens": 0, "completion_tokens": 0})
+
+
+def _add_usage(response_usage):
+    """Add the usage of one OpenAI response to the analysis in progress."""
+    usage = _usage.get()
+    if usage is None:
+        return
+    with _usage_lock:
+        usage["requests"] += 1
+        if response_usage is not None:
+            usage["prompt_tokens"] += response_usage.prompt_tokens or 0
+            usage["completion_tokens"] += response_usage.completion_tokens or 0
+
+
+def _build_result(cleaned_analysis, timings, input_tokens):
+    """Build an analysis result, with the model and the token usage of its requests."""
+    usage = _usage.get()
+    return {
+        "summary": cleaned_analysis,
+        "timings": timings,
+        "input_tokens": input_tokens,
+        "model": app.config["OPENAI_MODEL_NAME"],
+        "usage": dict(usage) if usage is not None else None,
+    }
+
+
+def _trace_request(trace, system_prompt, user_content, input_tokens):
+    """Record the prompt sent to OpenAI on the analysis trace."""
+    trace.record(
+        "request",
+        model=app.config["OPENAI_MODEL_NAME"],
+        mode=app.config["ANALYSIS_EXECUTION_MODE"],
+        input_tokens=input_tokens,
+        system_prompt=system_prompt,
+        user_content=user_content,
+    )
+
+
+def _get_temperature():
+    """Return the sampling temperature, forced to 0 in deterministic mode."""
+    if app.config["OPENAI_DETERMINISTIC"]:
+        return 0.0
+    return app.config["OPENAI_TEMPERATURE"]
+
+
+def _get_pipeline_settings():
+    """Return the settings besides the model parameters that shape an analysis."""
+    return {
+        "input_compaction": app.config["INPUT_COMPACTION_ENABLED"],
+        "input_budget_policy": app.config["INPUT_BUDGET_POLICY"],
+        "input_token_budget": get_input_token_budget(),
+        "execution_mode": app.config["ANALYSIS_EXECUTION_MODE"],
+        "fanout_section_max_tokens": app.config["FANOUT_SECTION_MAX_TOKENS"],
+        "long_doc_threshold_chars": app.config["LONG_DOC_THRESHOLD_CHARS"],
+        "long_doc_chunk_tokens": app.config["LONG_DOC_CHUNK_TOKENS"],
+        "long_doc_map_max_tokens": app.config["LONG_DOC_MAP_MAX_TOKENS"],
+    }
+
+
+def _get_cache_key(text_content, sections):
+    """Return the result cache key for a request, or None if caching is off."""
+    if not app.config["ANALYSIS_CACHE_ENABLED"]:
+        return None
+    return make_cache_key(
+        text_content,
+        sections,
+        app.config["OPENAI_MODEL_NAME"],
+        _get_temperature(),
+        app.config["OPENAI_MAX_TOKENS"],
+        _get_pipeline_settings(),
+    )
+
+
+def _get_cached_result(cache_key):
+    """
+    Look up a cached analysis, treating cache failures as misses.
+
+    A hit spent no tokens and no model time, so it is returned as a copy
+    flagged "cached" (also in its timings, which AnalysisResult stores) with
+    zero usage: each job stores what it actually cost, not the cost of the
+    analysis that filled the cache.
+    """
+    if cache_key is None:
+        return None
+    try:
+        cached = result_cache.get(cache_key)
+    except Exception as e:
+        app.logger.warning(f"⚠️ Analysis cache lookup failed: {str(e)}")
+        return None
+    if cached is None:
+        return None
+    return {
+        **cached,
+        "usage": {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0},
+        "timings": {"cached": True},
+        "cached": True,
+    }
+
+
+def _complete(system_prompt, user_content, max_tokens=None):
+    """
+    Run a single (non-streaming) chat completion.
+
+    Args:
+        system_prompt (str): The system message.
+        user_content (str): The user message.
+        max_tokens (int): Completion token limit, defaults to OPENAI_MAX_TOKENS.
+
+    Returns:
+        str: The stripped completion text.
+    """
+    response = chat_completions.create(
+        model=app.config["OPENAI_MODEL_NAME"],
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_content},
+        ],
+        temperature=_get_temperature(),
+        max_tokens=max_tokens or app.config["OPENAI_MAX_TOKENS"],
+    )
+    _add_usage(response.usage)
+    return response.choices[0].message.content.strip()
+
+
+# Long-document (map-reduce) engine
+
+# Chunk boundaries from coarsest to finest: paragraphs, lines, sentences
+_BOUNDARY_PATTERNS = [
+    re.compile(r"(?<=\n\n)"),
+    re.compile(r"(?<=\n)"),
+    re.compile(r"(?<=[。！？；!?;.])"),
+]
+
+
+def _iter_pieces(text, max_tokens, level=0):
+    """
+    Yield pieces of text that fit max_tokens, cut at the coarsest boundary possible.
+
+    Args:
+        text (str): The text to split.
+        max_tokens (int): Token budget of a single piece.
+        level (int): Index into _BOUNDARY_PATTERNS to split on.
+
+    Yields:
+        str: Consecutive pieces whose concatenation equals text.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        yield text
+        return
+    if level < len(_BOUNDARY_PATTERNS):
+        parts = [part for part in _BOUNDARY_PATTERNS[level].split(text) if part]
+        for part in parts if len(parts) > 1 else [text]:
+            yield from _iter_pieces(part, max_tokens, level + 1)
+        return
+    # No boundary left: hard split, assuming the worst case of one token per char
+    for start in range(0, len(text), max_tokens):
+        yield text[start:start + max_tokens]
+
+
+def _split_into_chunks(text, max_tokens):
+    """
+    Split text into chunks of at most max_tokens (estimated) tokens.
+
+    Args:
+        text (str): The document text.
+        max_tokens (int): Token budget of a single chunk.
+
+    Returns:
+        list: The chunks, in document order.
+    """
+    chunks = []
+    current = []
+    current_tokens = 0
+    for piece in _iter_pieces(text, max_tokens):
+        tokens = estimate_tokens(piece)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append("".join(current))
+            current = []
+            current_tokens = 0
+        current.append(piece)
+        current_tokens += tokens
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+
+def _build_map_prompt(sections, index, total):
+    """Build the system prompt that turns one chunk into analysis notes."""
+    aspects = "、".join([SUMMARY_SECTION] + sections)
+    return f"""
+                        你是一位专业的文档分析专家。以下内容是一篇长文档的第{index}/{total}部分。
+                        请用中文为这一部分撰写分析笔记，之后会与其他部分的笔记汇总成完整分析。笔记需涵盖：{aspects}
+
+                        笔记要求：
+                        - 按上述方面分段记录要点、人物、事件、主题线索和风格特征
+                        - 只依据本部分内容，不要臆测其他部分
+                        - 避免使用数字编号或序号
+                        """
+
+
+def _analyze_chunk(chunk, sections, index, total):
+    """
+    Produce analysis notes for one chunk.
+
+    Failed requests are retried by the OpenAI client layer (utils/openai_client.py).
+
+    Args:
+        chunk (str): The chunk text.
+        sections (list): Enabled analysis sections.
+        index (int): 1-based position of the chunk.
+        total (int): Total number of chunks.
+
+    Returns:
+        str: The notes for the chunk.
+    """
+    return _complete(
+        _build_map_prompt(sections, index, total),
+        chunk,
+        max_tokens=app.config["LONG_DOC_MAP_MAX_TOKENS"],
+    )
+
+
+def _map_long_document(text_content, sections, chunk_tokens):
+    """
+    Condense a long document into per-chunk notes, analyzing chunks concurrently.
+
+    Args:
+        text_content (str): The document text.
+        sections (list): Enabled analysis sections.
+        chunk_tokens (int): Token budget of a single chunk.
+
+    Returns:
+        str: The ordered notes of all chunks, or None if the document fits in
+            a single chunk.
+    """
+    chunks = _split_into_chunks(text_content, chunk_tokens)
+    if len(chunks) == 1:
+        return None
+
+    total = len(chunks)
+    concurrency = min(app.config["LONG_DOC_MAX_CONCURRENCY"], total)
+    app.logger.info(f"🧩 Analyzing long document in {total} chunks ({concurrency} concurrent)")
+    started = time.monotonic()
+
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="analysis-chunk")
+    try:
+        futures = [
+            executor.submit(
+                contextvars.copy_context().run, _analyze_chunk, chunk, sections, index, total
+            )
+            for index, chunk in enumerate(chunks, 1)
+        ]
+        notes = [future.result() for future in futures]
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    app.logger.info(f"✅ Chunk analysis finished in {time.monotonic() - started:.1f}s")
+    return "\n\n".join(
+        f"第{index}部分笔记：\n{note}" for index, note in enumerate(notes, 1)
+    )
+
+
+def _prepare_user_content(text_content, sections):
+    """
+    Build the user content of the final analysis call(s).
+
+    The text is compacted and checked against the model's input-token budget
+    first. Documents still longer than LONG_DOC_THRESHOLD_CHARS, or over the
+    budget, are then condensed into chunk notes (map); the final call(s)
+    reduce them into the usual section format.
+
+    Args:
+        text_content (str): The document text.
+        sections (list): Enabled analysis sections.
+
+    Returns:
+        Tuple[str, bool, dict]: The user content, whether it consists of
+            chunk notes rather than the document itself, and the input token
+            statistics from fit_to_budget.
+    """
+    text_content, input_tokens, over_budget = fit_to_budget(text_content)
+    if not over_budget and len(text_content) <= app.config["LONG_DOC_THRESHOLD_CHARS"]:
+        return text_content, False, input_tokens
+
+    notes = _map_long_document(text_content, sections, _get_chunk_tokens(input_tokens))
+    if notes is None:
+        return text_content, False, input_tokens
+    return notes, True, input_tokens
+
+
+def _get_chunk_tokens(input_tokens):
+    """Return the map chunk size, never larger than the model's input budget."""
+    return min(app.config["LONG_DOC_CHUNK_TOKENS"], input_tokens["budget"])
+
+
+# Per-section fan-out mode
+
+def _ensure_heading(section, text):
+    """Make sure a single-section completion starts with its section heading."""
+    heading = _SECTION_HEADING_RE.match(text)
+    if heading and heading.group(1) == section:
+        return text
+    return f"{section}：\n{text}"
+
+
+def _start_fanout(executor, user_content, sections, from_notes, timings):
+    """
+    Submit one request per section (plus the summary) to executor.
+
+    Args:
+        executor (ThreadPoolExecutor): Executor running the requests.
+        user_content (str): The document text or chunk notes.
+        sections (list): Enabled analysis sections.
+        from_notes (bool): Whether user_content consists of chunk notes.
+        timings (dict): Receives the latency in seconds of each section.
+
+    Returns:
+        list: Futures resolving to each section's text, in canonical order.
+    """
+
+    def run(section):
+        started = time.monotonic()
+        text = _complete(
+            _build_section_prompt(section, from_notes),
+            user_content,
+            max_tokens=app.config["FANOUT_SECTION_MAX_TOKENS"],
+        )
+        timings[section] = round(time.monotonic() - started, 3)
+        return _ensure_heading(section, text)
+
+    return [
+        executor.submit(contextvars.copy_context().run, run, section)
+        for section in [SUMMARY_SECTION] + sections
+    ]
+
+
+def _analyze_fanout(user_content, sections, from_notes, timings):
+    """
+    Analyze each section with its own concurrent request and assemble the results.
+
+    Args:
+        user_content (str): The document text or chunk notes.
+        sections (list): Enabled analysis sections.
+        from_notes (bool): Whether user_content consists of chunk notes.
+        timings (dict): Receives the latency in seconds of each section.
+
+    Returns:
+        str: The sections joined in canonical order.
+    """
+    executor = ThreadPoolExecutor(
+        max_workers=len(sections) + 1, thread_name_prefix="analysis-section"
+    )
+    try:
+        futures = _start_fanout(executor, user_content, sections, from_notes, timings)
+        return "\n\n".join(future.result() for future in futures)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _is_fanout():
+    """Return True if analyses run in per-section fan-out mode."""
+    return app.config["ANALYSIS_EXECUTION_MODE"] == "fanout"
+
+
+def analyze_document(text_content, analysis_options=None):
+    """Analyze document content using OpenAI GPT-4o."""
+    trace = NULL_TRACE
+    try:
+        sections = _get_enabled_sections(analysis_options)
+        cache_key = _get_cache_key(text_content, sections)
+        cached = _get_cached_result(cache_key)
+        if cached is not None:
+            app.logger.info("⚡ Analysis cache hit, skipping OpenAI request")
+            return cached
+
+        _start_usage()
+        trace = start_trace("analyze_document")
+        started = time.monotonic()
+        user_content, from_notes, input_tokens = _prepare_user_content(text_content, sections)
+        timings = {"mode": app.config["ANALYSIS_EXECUTION_MODE"]}
+        if from_notes:
+            timings["map"] = round(time.monotonic() - started, 3)
+
+        if _is_fanout():
+            app.logger.info(
+                f"📤 Sending {len(sections) + 1} section requests to OpenAI for document analysis"
+            )
+            timings["sections"] = {}
+            system_prompt = "\n".join(
+                _build_section_prompt(section, from_notes)
+                for section in [SUMMARY_SECTION] + sections
+            )
+            analysis = _analyze_fanout(user_content, sections, from_notes, timings["sections"])
+        else:
+            app.logger.info("📤 Sending request to OpenAI for document analysis")
+            system_prompt = _build_system_prompt(sections, from_notes)
+            analysis = _complete(system_prompt, user_content)
+        timings["total"] = round(time.monotonic() - started, 3)
+        return _finish_analysis(
+            system_prompt, user_content, analysis, timings, input_tokens, cache_key, trace
+        )
+    except OpenAIUnavailableError as e:
+        app.logger.error(f"❌ OpenAI unavailable: {str(e)}")
+        trace.record("error", error=str(e))
+        raise
+    except Exception as e:
+        app.logger.error(f"❌ Error analyzing document: {str(e)}")
+        trace.record("error", error=str(e))
+        raise Exception(f"Error analyzing document: {str(e)}")
+
+
+def _finish_analysis(system_prompt, user_content, analysis, timings, input_tokens, cache_key, trace):
+    """
+    Clean up a raw completion, store it in the result cache and build the result.
+
+    Args:
+        system_prompt (str): The system prompt(s) sent to OpenAI.
+        user_content (str): The user content sent to OpenAI.
+        analysis (str): The raw completion text.
+        timings (dict): Latency breakdown of the analysis.
+        input_tokens (dict): Input token statistics from fit_to_budget.
+        cache_key (str): Result cache key, None if caching is off.
+        trace (Trace): Trace of the analysis (see utils/trace_sink.py).
+
+    Returns:
+        dict: {"summary": str, "timings": dict, "input_tokens": dict,
+            "model": str, "usage": dict}.
+    """
+    _trace_request(trace, system_prompt, user_content, input_tokens)
+
+    app.logger.info(f"📥 Received response from OpenAI ⏱️ {timings}")
+
+    trace.record("response", analysis=analysis, timings=timings)
+
+    cleaned_analysis = _clean_analysis(analysis)
+    _check_sections(cleaned_analysis)
+
+    result = _build_result(cleaned_analysis, timings, input_tokens)
+    if cache_key is not None:
+        result_cache.put(cache_key, result)
+    return result
+
+
+# Async engine (used by the ASGI entry point's analysis workers)
+
+async def _acomplete(system_prompt, user_content, max_tokens=None):
+    """Async counterpart of _complete."""
+    response = await chat_completions.acreate(
+        model=app.config["OPENAI_MODEL_NAME"],
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_content},
+        ],
+        temperature=_get_temperature(),
+        max_tokens=max_tokens or app.config["OPENAI_MAX_TOKENS"],
+    )
+    _add_usage(response.usage)
+    return response.choices[0].message.content.strip()
+
+
+async def _analyze_chunk_async(chunk, sections, index, total, semaphore):
+    """Async counterpart of _analyze_chunk, bounded by semaphore."""
+    async with semaphore:
+        return await _acomplete(
+            _build_map_prompt(sections, index, total),
+            chunk,
+            max_tokens=app.config["LONG_DOC_MAP_MAX_TOKENS"],
+        )
+
+
+async def _prepare_user_content_async(text_content, sections):
+    """Async counterpart of _prepare_user_content."""
+    text_content, input_tokens, over_budget = await asyncio.to_thread(fit_to_budget, text_content)
+    if not over_budget and len(text_content) <= app.config["LONG_DOC_THRESHOLD_CHARS"]:
+        return text_content, False, input_tokens
+
+    chunks = _split_into_chunks(text_content, _get_chunk_tokens(input_tokens))
+    if len(chunks) == 1:
+        return text_content, False, input_tokens
+
+    total = len(chunks)
+    semaphore = asyncio.Semaphore(app.config["LONG_DOC_MAX_CONCURRENCY"])
+    app.logger.info(f"🧩 Analyzing long document in {total} chunks (async)")
+    notes = await asyncio.gather(
+        *(
+            _analyze_chunk_async(chunk, sections, index, total, semaphore)
+            for index, chunk in enumerate(chunks, 1)
+        )
+    )
+    return "\n\n".join(
+        f"第{index}部分笔记：\n{note}" for index, note in enumerate(notes, 1)
+    ), True, input_tokens
+
+
+async def _analyze_fanout_async(user_content, sections, from_notes, timings):
+    """Async counterpart of _analyze_fanout."""
+
+    async def run(section):
+        started = time.monotonic()
+        text = await _acomplete(
+            _build_section_prompt(section, from_notes),
+            user_content,
+            max_tokens=app.config["FANOUT_SECTION_MAX_TOKENS"],
+        )
+        timings[section] = round(time.monotonic() - started, 3)
+        return _ensure_heading(section, text)
+
+    results = await asyncio.gather(*(run(section) for section in [SUMMARY_SECTION] + sections))
+    return "\n\n".join(results)
+
+
+async def analyze_document_async(text_content, analysis_options=None):
+    """
+    Analyze document content with AsyncOpenAI; same result as analyze_document.
+
+    Only the OpenAI calls are awaited. Cache access and post-processing touch
+    the database and disk, so they run in a worker thread.
+
+    Args:
+        text_content (str): The document text to analyze.
+        analysis_options (dict): Analysis options selected by the user.
+
+    Returns:
+        dict: {"summary": str, "timings": dict, "input_tokens": dict,
+            "model": str, "usage": dict}.
+    """
+    trace = NULL_TRACE
+    try:
+        sections = _get_enabled_sections(analysis_options)
+        cache_key = _get_cache_key(text_content, sections)
+        cached = await run_sync(_get_cached_result, cache_key)
+        if cached is not None:
+            app.logger.info("⚡ Analysis cache hit, skipping OpenAI request")
+            return cached
+
+        _start_usage()
+        trace = start_trace("analyze_document_async")
+        started = time.monotonic()
+        user_content, from_notes, input_tokens = await _prepare_user_content_async(
+            text_content, sections
+        )
+        timings = {"mode": app.config["ANALYSIS_EXECUTION_MODE"]}
+        if from_notes:
+            timings["map"] = round(time.monotonic() - started, 3)
+
+        if _is_fanout():
+            timings["sections"] = {}
+            system_prompt = "\n".join(
+                _build_section_prompt(section, from_notes)
+                for section in [SUMMARY_SECTION] + sections
+            )
+            analysis = await _analyze_fanout_async(
+                user_content, sections, from_notes, timings["sections"]
+            )
+        else:
+            system_prompt = _build_system_prompt(sections, from_notes)
+            analysis = await _acomplete(system_prompt, user_content)
+        timings["total"] = round(time.monotonic() - started, 3)
+        return await run_sync(
+            _finish_analysis,
+            system_prompt,
+            user_content,
+            analysis,
+            timings,
+            input_tokens,
+            cache_key,
+            trace,
+        )
+    except OpenAIUnavailableError as e:
+        app.logger.error(f"❌ OpenAI unavailable: {str(e)}")
+        trace.record("error", error=str(e))
+        raise
+    except Exception as e:
+        app.logger.error(f"❌ Error analyzing document: {str(e)}")
+        trace.record("error", error=str(e))
+        raise Exception(f"Error analyzing document: {str(e)}")
+
+
+def _replay_result(result):
+    """Yield the streaming events for an already complete analysis result."""
+    current_section = None
+    for line in result["summary"].split("\n"):
+        heading = _SECTION_HEADING_RE.match(line)
+        if heading and heading.group(1) != current_section:
+            current_section = heading.group(1)
+            yield {"event": "section", "section": current_section}
+        yield {"event": "delta", "section": current_section, "text": line + "\n"}
+    yield {"event": "done", "analysis": result}
+
+
+def _stream_fanout(
+    user_content, sections, from_notes, timings, input_tokens, started, cache_key, trace
+):
+    """
+    Stream a fan-out analysis, emitting each section as soon as it and all
+    sections before it (in canonical order) have completed.
+    """
+    app.logger.info(
+        f"📤 Sending {len(sections) + 1} section requests to OpenAI for document analysis"
+    )
+    system_prompt = "\n".join(
+        _build_section_prompt(section, from_notes) for section in [SUMMARY_SECTION] + sections
+    )
+    _trace_request(trace, system_prompt, user_content, input_tokens)
+    timings["sections"] = {}
+    executor = ThreadPoolExecutor(
+        max_workers=len(sections) + 1, thread_name_prefix="analysis-section"
+    )
+    try:
+        futures = _start_fanout(executor, user_content, sections, from_notes, timings["sections"])
+        parts = []
+        for future in futures:
+            part = _clean_analysis(future.result())
+            parts.append(part)
+            for event in _replay_result({"summary": part + "\n"}):
+                if event["event"] != "done":
+                    yield event
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    cleaned_analysis = "\n\n".join(parts).strip()
+    timings["total"] = round(time.monotonic() - started, 3)
+    app.logger.info(f"📥 Received response from OpenAI ⏱️ {timings}")
+    trace.record("response", analysis=cleaned_analysis, timings=timings)
+    _check_sections(cleaned_analysis)
+
+    result = _build_result(cleaned_analysis, timings, input_tokens)
+    if cache_key is not None:
+        result_cache.put(cache_key, result)
+    yield {"event": "done", "analysis": result}
+
+
+def stream_document_analysis(text_content, analysis_options=None):
+    """
+    Analyze document content using the OpenAI streaming API.
+
+    The completion is post-processed line by line with the same cleanup as
+    analyze_document, so every emitted line is final.
+
+    Args:
+        text_content (str): The document text to analyze.
+        analysis_options (dict): Analysis options selected by the user.
+
+    Yields:
+        dict: Events of the form {"event": "section", "section": ...} when a
+            new section heading is seen, {"event": "delta", "section": ...,
+            "text": ...} for each cleaned line, and finally {"event": "done",
+            "analysis": {"summary": ...}} with the same payload that
+            analyze_document returns.
+    """
+    trace = NULL_TRACE
+    try:
+        sections = _get_enabled_sections(analysis_options)
+        cache_key = _get_cache_key(text_content, sections)
+        cached = _get_cached_result(cache_key)
+        if cached is not None:
+            app.logger.info("⚡ Analysis cache hit, replaying cached result")
+            yield from _replay_result(cached)
+            return
+
+        _start_usage()
+        trace = start_trace("stream_document_analysis")
+        started = time.monotonic()
+        user_content, from_notes, input_tokens = _prepare_user_content(text_content, sections)
+        timings = {"mode": app.config["ANALYSIS_EXECUTION_MODE"]}
+        if from_notes:
+            timings["map"] = round(time.monotonic() - started, 3)
+
+        if _is_fanout():
+            yield from _stream_fanout(
+                user_content, sections, from_notes, timings, input_tokens, started, cache_key, trace
+            )
+            return
+
+        system_prompt = _build_system_prompt(sections, from_notes)
+
+        app.logger.info("📤 Sending streaming request to OpenAI for document analysis")
+        stream = chat_completions.create(
             model=app.config["OPENAI_MODEL_NAME"],
             messages=[
                 {"role": "system", "content": system_prompt},
-                {"role": "user", "content": text_content},
+                {"role": "user", "content": user_content},
             ],
-            temperature=app.config["OPENAI_TEMPERATURE"],
+            temperature=_get_temperature(),
             max_tokens=app.config["OPENAI_MAX_TOKENS"],
+            stream=True,
+            stream_options={"include_usage": True},
         )
+        _trace_request(trace, system_prompt, user_content, input_tokens)
 
-        # debug message content that was sent to OpenAI, by outputting the system prompt and user content
-        # to debug/ai_analyzer_request.txt
-        with open(
-            os.path.join(app.config["DEBUG_DIR"], "ai_analyzer_request.txt"), "w"
-        ) as f:
-            f.write(f"System Prompt:\n{system_prompt}\n\nUser Content:\n{text_content}")
-
-        analysis = response.choices[0].message.content.strip()
-        app.logger.info("📥 Received response from OpenAI")
-
-        # debug message content that was received from OpenAI, by outputting the analysis
-        # to debug/ai_analyzer_response.txt
-        with open(
-            os.path.join(app.config["DEBUG_DIR"], "ai_analyzer_response.txt"), "w"
-        ) as f:
-            f.write(analysis)
-
-        # Clean up the analysis text
-        # Remove any numbered prefixes and clean up formatting
-        cleaned_analysis = "\n".join(
-            (
-                line
-                if not any(line.strip().startswith(str(i) + ".") for i in range(1, 10))
-                else line.split(".", 1)[1].strip()
-            )
-            for line in analysis.split("\n")
-        )
+        current_section = None
+        cleaned_lines = []
+        buffer = ""
 
-        # Ensure each section has content
-        sections_to_check = [
-            "摘要",
-            "人物分析",
-            "情节分析",
-            "主题分析",
-            "可读性评估",
-            "情感分析",
-            "风格和一致性",
-        ]
-        for section in sections_to_check:
-            if f"{section}：\n暂无内容" in cleaned_analysis:
-                app.logger.warning(f"⚠️ Empty content detected in section: {section}")
+        def emit(line):
+            nonlocal current_section
+            cleaned = _clean_line(line)
+            cleaned_lines.append(cleaned)
+            heading = _SECTION_HEADING_RE.match(cleaned)
+            if heading and heading.group(1) != current_section:
+                current_section = heading.group(1)
+                yield {"event": "section", "section": current_section}
+            yield {"event": "delta", "section": current_section, "text": cleaned + "\n"}
+
+        for chunk in stream:
+            if chunk.usage is not None:
+                record_openai_usage(app.config["OPENAI_MODEL_NAME"], chunk.usage)
+                _add_usage(chunk.usage)
+            if not chunk.choices:
+                continue
+            buffer += chunk.choices[0].delta.content or ""
+            while "\n" in buffer:
+                line, buffer = buffer.split("\n", 1)
+                yield from emit(line)
+        if buffer:
+            yield from emit(buffer)
+
+        app.logger.info("📥 Received streamed response from OpenAI")
+        cleaned_analysis = "\n".join(cleaned_lines).strip()
+        _check_sections(cleaned_analysis)
 
-        return {"summary": cleaned_analysis}
+        timings["total"] = round(time.monotonic() - started, 3)
+        trace.record("response", analysis=cleaned_analysis, timings=timings)
+        result = _build_result(cleaned_analysis, timings, input_tokens)
+        if cache_key is not None:
+            result_cache.put(cache_key, result)
+        yield {"event": "done", "analysis": result}
+    except OpenAIUnavailableError as e:
+        app.logger.error(f"❌ OpenAI unavailable: {str(e)}")
+        trace.record("error", error=str(e))
+        raise
     except Exception as e:
         app.logger.error(f"❌ Error analyzing document: {str(e)}")
+        trace.record("error", error=str(e))
         raise Exception(f"Error analyzing document: {str(e)}")
@@ -0,0 +1,99 @@
+"""
+@file-overview Persistent store of completed analyses, served back without recomputing them.
+@filepath utils/analysis_store.py
+
+Every successful analysis job writes one AnalysisResult row in the same
+transaction that marks the job succeeded: the section-structured output, the
+options, model, token usage and timings. Rows are indexed by document (with
+creation time), by payment and by job. The read endpoint is keyed by the job
+id, a random uuid, rather than the sequential document id, so a result can
+only be fetched by whoever was given its job. Each row stores an ETag, a hash
+of its content, so the read endpoint can answer conditional GETs with 304 Not
+Modified.
+"""
+
+import hashlib
+import json
+
+from app import db
+from models import AnalysisResult
+from utils.ai_analyzer import split_sections
+
+
+def _compute_etag(fields):
+    """Hash the stored content of a result."""
+    payload = json.dumps(fields, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def store_analysis_result(job, result):
+    """
+    Add the result of a completed job to the session (committed by the caller).
+
+    Args:
+        job (AnalysisJob): The job the result belongs to.
+        result (dict): Output of analyze_document.
+
+    Returns:
+        AnalysisResult: The new row.
+    """
+    usage = result.get("usage") or {}
+    fields = {
+        "document_id": job.document_id,
+        "payment_id": job.payment_id,
+        "job_id": job.id,
+        "summary": result["summary"],
+        "sections": split_sections(result["summary"]),
+        "analysis_options": job.analysis_options,
+        "model": result.get("model"),
+        "prompt_tokens": usage.get("prompt_tokens"),
+        "completion_tokens": usage.get("completion_tokens"),
+        "input_tokens": result.get("input_tokens"),
+        "timings": result.get("timings"),
+    }
+    analysis_result = AnalysisResult(**fields, etag=_compute_etag(fields))
+    db.session.add(analysis_result)
+    return analysis_result
+
+
+def get_job_analysis_result(job_id):
+    """
+    Return the stored analysis of a job.
+
+    Args:
+        job_id (str): ID of the analysis job.
+
+    Returns:
+        AnalysisResult | None: The result, or None if the job has not stored one.
+    """
+    return AnalysisResult.query.filter_by(job_id=job_id).first()
+
+
+def serialize_analysis_result(analysis_result):
+    """
+    Build the public JSON representation of a stored analysis.
+
+    Args:
+        analysis_result (AnalysisResult): The stored result.
+
+    Returns:
+        dict: The analysis fields safe to return to the client.
+    """
+    return {
+        "id": analysis_result.id,
+        "document_id": analysis_result.document_id,
+        "job_id": analysis_result.job_id,
+        "summary": analysis_result.summary,
+        "sections": analysis_result.sections,
+        "analysis_options": analysis_result.analysis_options,
+        "model": analysis_result.model,
+        "usage": {
+            "prompt_tokens": analysis_result.prompt_tokens,
+            "completion_tokens": analysis_result.completion_tokens,
+        },
+        "input_tokens": analysis_result.input_tokens,
+        "timings": analysis_result.timings,
+        "created_at": (
+            analysis_result.created_at.isoformat() if analysis_result.created_at else None
+        ),
+    }
@@ -0,0 +1,37 @@
+"""
+@file-overview Helpers for running the synchronous app code from asyncio.
+@filepath utils/async_runtime.py
+
+The ASGI entry point (asgi.py) and the async analysis workers await the
+outbound OpenAI and Stripe calls, but database access and document extraction
+stay synchronous. run_sync moves such a call to a worker thread with its own
+application context, so Flask-SQLAlchemy gives it a private session instead of
+sharing the caller's.
+"""
+
+import asyncio
+import functools
+
+from app import app
+
+
+def _call_in_app_context(func, *args, **kwargs):
+    with app.app_context():
+        return func(*args, **kwargs)
+
+
+async def run_sync(func, *args, **kwargs):
+    """
+    Run a blocking function in a thread, inside a fresh application context.
+
+    Args:
+        func (callable): The function to run.
+        *args: Positional arguments for func.
+        **kwargs: Keyword arguments for func.
+
+    Returns:
+        Any: The return value of func.
+    """
+    return await asyncio.to_thread(
+        functools.partial(_call_in_app_context, func, *args, **kwargs)
+    )
@@ -0,0 +1,214 @@
+"""
+@file-overview Multi-file uploads priced, paid and analyzed as one batch.
+@filepath utils/batches.py
+
+POST /batches (routes.py) processes the files of a manuscript folder in
+parallel, stores each as a Document of an UploadBatch and creates a single
+payment intent for the sum of their prices. Once the intent succeeds (through
+the webhook or /batches/<id>/payment), record_paid_batch records one Payment
+for the batch and queues an analysis job per document. The jobs run on the
+shared analysis workers, at most BATCH_ANALYSIS_CONCURRENCY of a batch at once
+(utils/job_queue.py), and serialize_batch reports each document's status as
+its analysis completes.
+"""
+
+from sqlalchemy.exc import IntegrityError
+
+from app import app, db
+from models import AnalysisJob, Document, Payment, UploadBatch
+from utils.job_queue import JOB_FAILED, JOB_QUEUED, JOB_RUNNING, JOB_SUCCEEDED, enqueue_batch_jobs
+from utils.payment_intents import record_intent_status
+
+# Batch states reported by serialize_batch
+BATCH_AWAITING_PAYMENT = "awaiting_payment"
+BATCH_IN_PROGRESS = "in_progress"
+BATCH_COMPLETED = "completed"
+
+
+def create_batch(analysis_options):
+    """
+    Persist a new, not yet priced, upload batch.
+
+    Args:
+        analysis_options (dict): Analysis options selected at upload.
+
+    Returns:
+        str: ID of the batch.
+    """
+    batch = UploadBatch(amount=0, analysis_options=analysis_options or {})
+    db.session.add(batch)
+    db.session.commit()
+    return batch.id
+
+
+def set_batch_amount(batch_id, amount):
+    """
+    Store the price of a batch once its documents are processed.
+
+    Args:
+        batch_id (str): ID of the batch.
+        amount (int): Sum of the document costs, in cents.
+    """
+    UploadBatch.query.filter_by(id=batch_id).update({"amount": amount}, synchronize_session=False)
+    db.session.commit()
+
+
+def batch_intent_metadata(batch_id):
+    """
+    Build the payment intent metadata the payment_intent.succeeded webhook acts on.
+
+    Args:
+        batch_id (str): ID of the batch being paid for.
+
+    Returns:
+        Dict[str, str]: Stripe metadata.
+    """
+    return {"batch_id": batch_id}
+
+
+def record_paid_batch(payment_intent, batch_id, analysis_options=None):
+    """
+    Record the succeeded payment of a batch and queue the analysis of each document.
+
+    Args:
+        payment_intent: The verified Stripe payment intent.
+        batch_id (str): ID of the paid batch.
+        analysis_options (dict): Options overriding those selected at upload, or None.
+
+    Returns:
+        Tuple[dict, int]: serialize_batch payload and HTTP status code.
+    """
+    batch = db.session.get(UploadBatch, batch_id)
+    if batch is None:
+        return {"error": "Batch not found"}, 404
+    if analysis_options:
+        batch.analysis_options = analysis_options
+
+    payment = Payment(
+        stripe_payment_id=payment_intent.id,
+        amount=payment_intent.amount,
+        currency=payment_intent.currency,
+        status=payment_intent.status,
+        batch_id=batch_id,
+    )
+    db.session.add(payment)
+    try:
+        db.session.flush()
+    except IntegrityError:
+        # Another process recorded this payment first
+        db.session.rollback()
+        replay = replay_paid_batch(payment_intent.id, batch_id)
+        if replay is None:
+            raise
+        return replay
+
+    documents = Document.query.filter_by(batch_id=batch_id).order_by(Document.id).all()
+    enqueue_batch_jobs(documents, batch.analysis_options, payment.id, batch_id)
+    record_intent_status(payment_intent.id, payment_intent.status)
+    return serialize_batch(batch_id), 202
+
+
+def replay_paid_batch(payment_intent_id, batch_id, analysis_options=None):
+    """
+    Answer a repeated payment confirmation of a batch from the stored payment.
+
+    Args:
+        payment_intent_id (str): ID of the Stripe payment intent.
+        batch_id (str): ID of the batch the client is paying for.
+        analysis_options (dict): Options to apply to the jobs that have not
+            started yet, or None.
+
+    Returns:
+        Tuple[dict, int] | None: Response payload and HTTP status code, or
+            None if the payment has not been recorded yet.
+    """
+    payment = Payment.query.filter_by(stripe_payment_id=payment_intent_id).first()
+    if payment is None:
+        return None
+    if payment.batch_id != batch_id:
+        app.logger.warning(f"🚫 Payment {payment_intent_id} already used for another purchase")
+        return {"error": "Payment already used for another purchase"}, 409
+
+    if analysis_options:
+        updated = AnalysisJob.query.filter(
+            AnalysisJob.batch_id == batch_id,
+            AnalysisJob.status == JOB_QUEUED,
+        ).update({"analysis_options": analysis_options}, synchronize_session=False)
+        UploadBatch.query.filter_by(id=batch_id).update(
+            {"analysis_options": analysis_options}, synchronize_session=False
+        )
+        db.session.commit()
+        if updated:
+            app.logger.info(
+                f"📝 Analysis options of {updated} queued job(s) of batch {batch_id} updated"
+            )
+
+    payload = serialize_batch(batch_id)
+    return payload, 200 if payload["status"] == BATCH_COMPLETED else 202
+
+
+def serialize_batch(batch_id):
+    """
+    Build the public JSON representation of a batch and of each of its documents.
+
+    Args:
+        batch_id (str): ID of the batch.
+
+    Returns:
+        dict | None: Batch status, job counts and per-document status (with
+            the job_id of its analysis once paid), or None if there is no
+            such batch.
+    """
+    batch = db.session.get(UploadBatch, batch_id)
+    if batch is None:
+        return None
+    documents = Document.query.filter_by(batch_id=batch_id).order_by(Document.id).all()
+    jobs = {
+        job.document_id: job
+        for job in AnalysisJob.query.filter_by(batch_id=batch_id).order_by(AnalysisJob.created_at)
+    }
+
+    counts = {JOB_QUEUED: 0, JOB_RUNNING: 0, JOB_SUCCEEDED: 0, JOB_FAILED: 0}
+    entries = []
+    for document in documents:
+        job = jobs.get(document.id)
+        entry = {
+            "document_id": document.id,
+            "original_filename": document.original_filename,
+            "title": document.title,
+            "char_count": document.char_count,
+            "analysis_cost": document.analysis_cost,
+            "job_id": None,
+            "status": BATCH_AWAITING_PAYMENT,
+            "error": None,
+            "finished_at": None,
+        }
+        if job is not None:
+            counts[job.status] += 1
+            entry.update(
+                job_id=job.id,
+                status=job.status,
+                error=job.error if job.status == JOB_FAILED else None,
+                finished_at=job.finished_at.isoformat() if job.finished_at else None,
+            )
+        entries.append(entry)
+
+    if not jobs:
+        status = BATCH_AWAITING_PAYMENT
+    elif counts[JOB_QUEUED] or counts[JOB_RUNNING]:
+        status = BATCH_IN_PROGRESS
+    else:
+        status = BATCH_COMPLETED
+    payload = {
+        "batch_id": batch.id,
+        "status": status,
+        "analysis_cost": batch.amount,
+        "currency": batch.currency,
+        "total": len(entries),
+        "counts": counts,
+        "created_at": batch.created_at.isoformat() if batch.created_at else None,
+        "documents": entries,
+    }
+    # Release the read transaction: callers poll this
+    db.session.commit()
+    return payload
@@ -0,0 +1,150 @@
+"""
+@file-overview Fast character-count estimation for pricing, without full extraction.
+@filepath utils/char_estimator.py
+
+Pricing is tiered, so the upload only needs to know which tier a document
+falls in. DOCX text is counted by streaming the w:t text nodes of
+word/document.xml straight out of the zip; PDFs are estimated by extracting an
+evenly spread sample of pages and extrapolating. Both take milliseconds. An
+estimate carries a relative error margin, and callers fall back to exact
+extraction when the margin straddles a pricing tier boundary.
+
+Estimates run in the upload request itself (utils/document_processor.py), not
+in the extraction pool, so they never wait behind deferred full extractions.
+Like utils/extraction_worker.py this module does not import the Flask app.
+"""
+
+import math
+import os
+import zipfile
+import xml.etree.ElementTree as ElementTree
+
+WORD_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+def estimate_docx_chars(file_path):
+    """
+    Count the characters of a DOCX by streaming word/document.xml.
+
+    Text runs (w:t) are summed, and every paragraph adds one line break,
+    roughly matching the text MarkItDown produces.
+
+    Args:
+        file_path (str): Path to the DOCX file.
+
+    Returns:
+        int: Estimated character count.
+    """
+    char_count = 0
+    with zipfile.ZipFile(file_path) as package:
+        with package.open("word/document.xml") as document_xml:
+            for _, element in ElementTree.iterparse(document_xml, events=("end",)):
+                if element.tag == f"{WORD_NAMESPACE}t":
+                    char_count += len(element.text or "")
+                elif element.tag == f"{WORD_NAMESPACE}p":
+                    char_count += 1
+                    element.clear()  # Keep memory flat on large documents
+    return char_count
+
+
+def estimate_pdf_chars(file_path, sample_pages):
+    """
+    Estimate the characters of a PDF from an evenly spread sample of pages.
+
+    Args:
+        file_path (str): Path to the PDF file.
+        sample_pages (int): Number of pages to extract.
+
+    Returns:
+        Tuple[int, bool]: Estimated character count, and whether every page
+            was extracted (the count is then not extrapolated).
+    """
+    from pypdf import PdfReader
+
+    reader = PdfReader(file_path)
+    page_count = len(reader.pages)
+    if page_count == 0:
+        return 0, True
+
+    if page_count <= sample_pages:
+        indexes = range(page_count)
+    else:
+        step = page_count / sample_pages
+        indexes = sorted({int(step * i + step / 2) for i in range(sample_pages)})
+
+    sampled_chars = sum(len(reader.pages[index].extract_text()) + 1 for index in indexes)
+    complete = len(indexes) == page_count
+    return math.ceil(sampled_chars * page_count / len(indexes)), complete
+
+
+def estimate_char_count(file_path, sample_pages=8, margin=0.15):
+    """
+    Estimate the character count of a PDF or DOCX document.
+
+    Args:
+        file_path (str): Path to the document.
+        sample_pages (int): PDF pages to sample.
+        margin (float): Relative error assumed for the estimate.
+
+    Returns:
+        dict: {"char_count": int, "margin": float, "method": str}.
+
+    Raises:
+        ValueError: If the file type is not supported.
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == ".docx":
+        return {
+            "char_count": estimate_docx_chars(file_path),
+            "margin": margin,
+            "method": "docx-xml",
+        }
+    if extension == ".pdf":
+        char_count, complete = estimate_pdf_chars(file_path, sample_pages)
+        return {
+            "char_count": char_count,
+            # Even a full pypdf pass differs a little from MarkItDown's output
+            "margin": margin / 2 if complete else margin,
+            "method": "pdf-all-pages" if complete else "pdf-sample",
+        }
+    raise ValueError(f"Cannot estimate characters of {extension or 'unknown'} files")
+
+
+def price_for(char_count, pricing_tiers, min_charge):
+    """
+    Return the analysis price of a character count.
+
+    Args:
+        char_count (int): Number of characters.
+        pricing_tiers (list): Tiers as configured in PRICING_TIERS.
+        min_charge (int): MIN_CHARGE, applied to every tier.
+
+    Returns:
+        int: Price in cents.
+    """
+    price = next(
+        (tier["price"] for tier in pricing_tiers if char_count <= tier["max_chars"]),
+        min_charge,
+    )
+    return max(price, min_charge)
+
+
+def is_near_tier_boundary(char_count, margin, pricing_tiers, min_charge):
+    """
+    Check whether an estimate's error margin straddles a pricing tier boundary.
+
+    Tiers raised to the same price by the minimum charge count as one, so
+    only boundaries where the price actually changes force an extraction.
+
+    Args:
+        char_count (int): Estimated character count.
+        margin (float): Relative error of the estimate.
+        pricing_tiers (list): Tiers as configured in PRICING_TIERS.
+        min_charge (int): MIN_CHARGE, applied to every tier.
+
+    Returns:
+        bool: True if the low and high ends of the estimate price differently.
+    """
+    low = math.floor(char_count * (1 - margin))
+    high = math.ceil(char_count * (1 + margin))
+    return price_for(low, pricing_tiers, min_charge) != price_for(high, pricing_tiers, min_charge)
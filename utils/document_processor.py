@@ -1,23 +1,118 @@
 """
 @file-overview This module processes documents using the MarkItDown library.
 @filepath utils/document_processor.py
+
+Extraction itself runs in the worker processes of utils/extraction_pool.py
+(MarkItDown with a pypdf fallback, see utils/extraction_worker.py). The pypdf
+fallback splits PDFs into page ranges that are extracted concurrently.
+
+Uploads can be priced from a fast character estimate (utils/char_estimator.py)
+with the full extraction deferred to a background thread; analysis jobs call
+ensure_text_content to wait for or run it.
+
+Extracted text is kept in the compressed blob store (utils/text_blobs.py) and
+referenced by Document.text_blob_key. Documents extracted before the blob store
+existed still point at an uncompressed file (text_content_file_path) until the
+storage sweep moves it into the store.
 """
 
-# Import the MarkItDown library and the Flask app
-from markitdown import MarkItDown, FileConversionException
-from app import app
+# Import the Flask app and the extraction backends
+from app import app, db
 import os
-from pdfminer.psexceptions import PSSyntaxError
-from pypdf import PdfReader
-import uuid
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from models import Document
+from utils.char_estimator import estimate_char_count, is_near_tier_boundary
+from utils.extraction_cache import extraction_cache
+from utils.extraction_pool import ExtractionError, get_extraction_pool
+from utils.extraction_worker import extract_document, iter_pdf_pages as _iter_pdf_pages_serial
+from utils.metrics import observe_extraction
+from utils.storage import get_storage
+from utils.text_blobs import put_text, read_text, touch_blob
+
+
+def compute_file_hash(file_path, chunk_size=1024 * 1024):
+    """
+    Compute the SHA-256 of a file without loading it into memory.
 
+    Args:
+        file_path (str): Path to the file.
+        chunk_size (int): Bytes read per iteration.
 
-def process_document(file_path):
+    Returns:
+        str: The hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _load_persisted_extraction(content_hash):
+    """
+    Rebuild a cache entry from an earlier Document with the same content hash.
+
+    Args:
+        content_hash (str): SHA-256 hex digest of the file bytes.
+
+    Returns:
+        dict: The cache entry, or None if no usable text blob exists.
+    """
+    document = (
+        Document.query.filter_by(content_hash=content_hash)
+        .filter(Document.text_blob_key.isnot(None))
+        .order_by(Document.id.desc())
+        .first()
+    )
+    if document is None:
+        return None
+    try:
+        text_content = read_text(document.text_blob_key)
+    except Exception as e:
+        app.logger.warning(f"⚠️ Could not read text blob {document.text_blob_key[:12]}: {str(e)}")
+        return None
+    return {
+        "text_content": text_content,
+        "char_count": document.char_count,
+        "title": document.title,
+        "text_blob_key": document.text_blob_key,
+    }
+
+
+def read_text_content(document):
+    """
+    Read the extracted text of a document, preferring the in-memory cache.
+
+    Args:
+        document (Document): A document whose text has been extracted.
+
+    Returns:
+        str: The extracted text.
+    """
+    if document.content_hash:
+        entry = extraction_cache.get(document.content_hash)
+        if entry is not None:
+            return entry["text_content"]
+    if document.text_blob_key is not None:
+        return read_text(document.text_blob_key)
+    with open(document.text_content_file_path, "r", encoding="utf-8") as text_file:
+        return text_file.read()
+
+
+def process_document(file_path, content_hash=None):
     """
     Process a document using multiple PDF processing libraries with fallback options.
 
+    Extraction results are content-addressed: when a file with the same SHA-256
+    has been processed before, the cached text is reused and extraction is
+    skipped entirely.
+
     Args:
         file_path (str): The path to the document file to be processed.
+        content_hash (str): SHA-256 of the file bytes, if already computed
+            while saving the upload.
 
     Returns:
         dict: A dictionary containing the text content and metadata of the document.
@@ -25,88 +120,335 @@ def process_document(file_path):
     Raises:
         Exception: If all document processing methods fail.
     """
+    if content_hash is None:
+        content_hash = compute_file_hash(file_path)
 
-    # Create debug directory if it doesn't exist
-    debug_dir = app.config["DEBUG_DIR"]
-
-    text_content = None
-    error_messages = []
-
-    # Try MarkItDown first
-    try:
-        app.logger.info(
-            f"🚀 Attempting to process document with MarkItDown: {file_path}"
-        )
-        md = MarkItDown()
-        result = md.convert(file_path)
-        text_content = getattr(result, "text_content", "")
-        app.logger.info("✅ MarkItDown conversion successful")
+    meta_date = str(os.path.getmtime(file_path))
 
-    except (FileConversionException, PSSyntaxError) as e:
-        error_messages.append(f"MarkItDown failed: {str(e)}")
-        app.logger.warning(f"⚠️ MarkItDown failed, attempting pypdf fallback: {str(e)}")
+    cached = _get_cached_metadata(file_path, content_hash)
+    if cached is not None:
+        return cached
 
-        # Try pypdf as fallback
-        try:
-            text_content = _extract_text_with_pypdf(file_path)
-            app.logger.info("✅ pypdf fallback successful")
-        except Exception as e:
-            error_messages.append(f"pypdf fallback failed: {str(e)}")
-            app.logger.error(f"❌ pypdf fallback failed: {str(e)}")
+    text_content = _extract_text(file_path)
 
-    # If all methods failed
-    if text_content is None:
-        raise Exception(
-            f"All document processing methods failed:\n" + "\n".join(error_messages)
-        )
-
-    # Save debug output with a unique filename
-    unique_filename = f"text_content_{uuid.uuid4().hex}.txt"
-    text_content_file_path = os.path.join(debug_dir, unique_filename)
-    try:
-        with open(text_content_file_path, "w", encoding="utf-8") as text_file:
-            text_file.write(text_content)
-        app.logger.info(f"✅ Text content saved to {text_content_file_path}")
-    except Exception as e:
-        app.logger.error(f"❌ Failed to save debug output: {str(e)}")
+    # Save the text to a blob shared by every document with the same text
+    text_blob_key = put_text(text_content)
 
     # Process metadata
     char_count = len(text_content)
-    meta_title = os.path.splitext(os.path.basename(file_path))[0]
-    meta_title = meta_title.rsplit("_", 1)[0]  # Strip UUID
-
-    meta_date = str(os.path.getmtime(file_path))
+    meta_title = _title_from_path(file_path)
 
     # Log metadata
     app.logger.info(f"📝 Title: {meta_title}")
     app.logger.info(f"📝 Character count: {char_count}")
     app.logger.info(f"📝 Upload date: {meta_date}")
 
+    extraction_cache.put(
+        content_hash,
+        {
+            "text_content": text_content,
+            "char_count": char_count,
+            "title": meta_title,
+            "text_blob_key": text_blob_key,
+        },
+    )
+
     return {
         "text_content": text_content,
         "char_count": char_count,
         "title": meta_title,
         "date_of_upload": meta_date,
-        "text_content_file_path": text_content_file_path,  # Add this line to return the file path
+        "text_blob_key": text_blob_key,
+        "content_hash": content_hash,
+        "char_count_estimated": False,
+    }
+
+
+def _title_from_path(file_path):
+    """Derive the document title from an upload path (strips the UUID suffix)."""
+    meta_title = os.path.splitext(os.path.basename(file_path))[0]
+    return meta_title.rsplit("_", 1)[0]
+
+
+def _get_cached_metadata(file_path, content_hash):
+    """
+    Build process_document's result from the extraction cache.
+
+    Args:
+        file_path (str): Path to the uploaded file.
+        content_hash (str): SHA-256 hex digest of the file bytes.
+
+    Returns:
+        dict: The document metadata, or None on a cache miss.
+    """
+    cached = extraction_cache.get(content_hash, loader=_load_persisted_extraction)
+    if cached is None:
+        return None
+    app.logger.info(f"⚡ Extraction cache hit for {content_hash[:12]}")
+    if not touch_blob(cached["text_blob_key"]):
+        # The storage sweep deleted the blob while the text stayed cached
+        put_text(cached["text_content"])
+    return {
+        **cached,
+        "date_of_upload": str(os.path.getmtime(file_path)),
+        "content_hash": content_hash,
+        "char_count_estimated": False,
     }
 
 
-def _extract_text_with_pypdf(file_path):
+def _estimate_chars(file_path):
+    """
+    Estimate the character count in-process.
+
+    The estimate is a zip scan or a few pypdf pages, so it does not go through
+    the extraction pool, where it would queue behind the deferred full
+    extractions of earlier uploads.
+    """
+    with observe_extraction("estimate", file_path):
+        return estimate_char_count(
+            file_path,
+            sample_pages=app.config["CHAR_ESTIMATE_PDF_SAMPLE_PAGES"],
+            margin=app.config["CHAR_ESTIMATE_MARGIN"],
+        )
+
+
+def estimate_document(file_path, content_hash=None):
     """
-    Extract text from PDF using pypdf as a fallback method.
+    Get the metadata needed to price a document, extracting only when needed.
+
+    A previously extracted file is served from the extraction cache. Otherwise
+    the character count is estimated in milliseconds; exact extraction runs
+    only if the estimate's margin straddles a pricing tier boundary or
+    estimation fails. Estimated results have no text file yet: hand them to
+    extract_in_background once the Document row exists.
 
     Args:
-        file_path (str): Path to the PDF file
+        file_path (str): The path to the document file.
+        content_hash (str): SHA-256 of the file bytes, if already computed.
 
     Returns:
-        str: Extracted text content
+        dict: Metadata as returned by process_document, with
+            char_count_estimated set and text_blob_key None when the count
+            is an estimate.
+
+    Raises:
+        Exception: If exact extraction is needed and fails.
     """
+    if content_hash is None:
+        content_hash = compute_file_hash(file_path)
+
+    cached = _get_cached_metadata(file_path, content_hash)
+    if cached is not None:
+        return cached
+
     try:
-        reader = PdfReader(file_path)
-        text_content = ""
-        for page in reader.pages:
-            text_content += page.extract_text() + "\n"
-        return text_content
+        estimate = _estimate_chars(file_path)
     except Exception as e:
-        app.logger.error(f"❌ pypdf extraction failed: {str(e)}")
-        raise
+        app.logger.warning(f"⚠️ Character estimation failed, extracting instead: {str(e)}")
+        return process_document(file_path, content_hash)
+
+    char_count = estimate["char_count"]
+    near_boundary = is_near_tier_boundary(
+        char_count, estimate["margin"], app.config["PRICING_TIERS"], app.config["MIN_CHARGE"]
+    )
+    if near_boundary:
+        app.logger.info(
+            f"📏 Estimate of {char_count} characters is near a pricing tier boundary, extracting exactly"
+        )
+        return process_document(file_path, content_hash)
+
+    app.logger.info(f"📏 Estimated {char_count} characters ({estimate['method']})")
+    return {
+        "text_content": None,
+        "char_count": char_count,
+        "title": _title_from_path(file_path),
+        "date_of_upload": str(os.path.getmtime(file_path)),
+        "text_blob_key": None,
+        "content_hash": content_hash,
+        "char_count_estimated": True,
+    }
+
+
+# Deferred extractions, single-flighted by content hash
+_background_executor = ThreadPoolExecutor(
+    max_workers=max(app.config["EXTRACTION_POOL_SIZE"], 1),
+    thread_name_prefix="deferred-extraction",
+)
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+def _extract_and_record(file_path, content_hash):
+    """
+    Extract a document and fill in every Document row still waiting for it.
+
+    Args:
+        file_path (str): Path to the uploaded file.
+        content_hash (str): SHA-256 hex digest of the file bytes.
+
+    Returns:
+        dict: Metadata as returned by process_document.
+    """
+    metadata = process_document(file_path, content_hash)
+    Document.query.filter(
+        Document.content_hash == content_hash,
+        Document.char_count_estimated.is_(True),
+        Document.text_blob_key.is_(None),
+    ).update(
+        {
+            Document.text_blob_key: metadata["text_blob_key"],
+            Document.char_count: metadata["char_count"],
+            Document.char_count_estimated: False,
+        },
+        synchronize_session=False,
+    )
+    db.session.commit()
+    return metadata
+
+
+def _run_deferred_extraction(file_path, content_hash):
+    with app.app_context():
+        try:
+            metadata = _extract_and_record(file_path, content_hash)
+            app.logger.info(
+                f"✅ Deferred extraction done for {content_hash[:12]}: {metadata['char_count']} characters"
+            )
+            return metadata
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"❌ Deferred extraction failed for {content_hash[:12]}: {str(e)}")
+            raise
+        finally:
+            with _in_flight_lock:
+                _in_flight.pop(content_hash, None)
+
+
+def extract_in_background(file_path, content_hash):
+    """
+    Start (or join) the deferred extraction of an estimated upload.
+
+    Args:
+        file_path (str): Path to the uploaded file.
+        content_hash (str): SHA-256 hex digest of the file bytes.
+
+    Returns:
+        concurrent.futures.Future: Resolves to the process_document metadata.
+    """
+    with _in_flight_lock:
+        future = _in_flight.get(content_hash)
+        if future is None:
+            future = _background_executor.submit(_run_deferred_extraction, file_path, content_hash)
+            _in_flight[content_hash] = future
+    return future
+
+
+def ensure_text_content(document):
+    """
+    Return the extracted text of a document, finishing deferred extraction first.
+
+    Args:
+        document (Document): The document to analyze.
+
+    Returns:
+        str: The extracted text.
+
+    Raises:
+        Exception: If extraction fails.
+    """
+    if document.text_blob_key is not None or document.text_content_file_path is not None:
+        return read_text_content(document)
+
+    # The upload may have been received by another node
+    file_path = get_storage("uploads").local_path(document.filename)
+    content_hash = document.content_hash
+    # Release the read transaction before a potentially long extraction
+    db.session.commit()
+
+    with _in_flight_lock:
+        future = _in_flight.get(content_hash)
+    if future is not None:
+        metadata = future.result()
+    else:
+        metadata = _extract_and_record(file_path, content_hash)
+    entry = extraction_cache.get(content_hash)
+    if entry is not None:
+        return entry["text_content"]
+    return read_text(metadata["text_blob_key"])
+
+
+def _extract_text(file_path):
+    """
+    Extract the text of a document, in the extraction pool when it is enabled.
+
+    Args:
+        file_path (str): Path to the document.
+
+    Returns:
+        str: Extracted text content.
+
+    Raises:
+        Exception: If all document processing methods fail.
+    """
+    pool = get_extraction_pool()
+    with observe_extraction("extract", file_path):
+        if pool is None:
+            result = extract_document(file_path)
+        else:
+            try:
+                result = pool.run(
+                    "extract", path=os.path.abspath(file_path), pdf_fallback=False
+                )
+                if result["text_content"] is None and file_path.lower().endswith(".pdf"):
+                    result = _extract_pdf_fallback(pool, file_path, result["errors"])
+            except ExtractionError as e:
+                app.logger.error(f"❌ Extraction failed in worker pool: {str(e)}")
+                raise Exception(f"All document processing methods failed:\n{str(e)}")
+
+    if result["text_content"] is None:
+        raise Exception(
+            f"All document processing methods failed:\n" + "\n".join(result["errors"])
+        )
+    app.logger.info(f"✅ Document extracted with {result['method']}")
+    return result["text_content"]
+
+
+def _extract_pdf_fallback(pool, file_path, errors):
+    """
+    Run the pypdf fallback page-parallel across the extraction pool.
+
+    Args:
+        pool (ExtractionPool): The extraction pool.
+        file_path (str): Path to the PDF file.
+        errors (list): Errors of the methods that already failed.
+
+    Returns:
+        dict: An extract_document-style result.
+    """
+    try:
+        text_content = pool.extract_pdf(file_path)
+        app.logger.info("✅ pypdf fallback successful")
+        return {"text_content": text_content, "method": "pypdf"}
+    except ExtractionError as e:
+        app.logger.error(f"❌ pypdf fallback failed: {str(e)}")
+        return {"text_content": None, "errors": errors + [f"pypdf fallback failed: {str(e)}"]}
+
+
+def iter_pdf_pages(file_path):
+    """
+    Stream the pypdf text of a PDF page by page, in page order.
+
+    Page ranges are extracted concurrently in the extraction pool when it is
+    enabled, so consumers can count characters or start chunking before the
+    whole document is done.
+
+    Args:
+        file_path (str): Path to the PDF file.
+
+    Yields:
+        str: Extracted text of each page.
+    """
+    pool = get_extraction_pool()
+    if pool is None:
+        yield from _iter_pdf_pages_serial(file_path)
+    else:
+        yield from pool.iter_pdf_pages(file_path)
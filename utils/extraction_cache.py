@@ -0,0 +1,111 @@
+"""
+@file-overview This module provides a content-addressed cache for extracted document text.
+@filepath utils/extraction_cache.py
+
+Entries are keyed by the SHA-256 of the uploaded file bytes and hold the
+extracted text, character count, title and the key of the compressed text
+blob (utils/text_blobs.py). An in-memory LRU bounded by
+EXTRACTION_CACHE_MAX_BYTES sits in front of the blobs; Document rows carry the
+content hash, so the cache can be rebuilt from the database after a restart.
+"""
+
+import sys
+import threading
+from collections import OrderedDict
+
+from app import app
+
+
+class ExtractionCache:
+    """Thread-safe LRU cache of extraction results, bounded by memory size."""
+
+    def __init__(self, max_bytes):
+        """
+        Initialize the cache.
+
+        Args:
+            max_bytes (int): Maximum memory held by cached text, in bytes.
+        """
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _entry_size(entry):
+        return sys.getsizeof(entry["text_content"])
+
+    def get(self, content_hash, loader=None):
+        """
+        Look up an extraction result and mark it as recently used.
+
+        Args:
+            content_hash (str): SHA-256 hex digest of the file bytes.
+            loader (callable): Optional fallback called with content_hash on
+                an in-memory miss; a non-None result is cached and counted as
+                a hit.
+
+        Returns:
+            dict: The cached entry, or None on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(content_hash)
+            if entry is not None:
+                self._entries.move_to_end(content_hash)
+                self.hits += 1
+                return entry
+
+        entry = loader(content_hash) if loader else None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self.put(content_hash, entry)
+        return entry
+
+    def put(self, content_hash, entry):
+        """
+        Store an extraction result, evicting least recently used entries.
+
+        Args:
+            content_hash (str): SHA-256 hex digest of the file bytes.
+            entry (dict): Contains text_content, char_count, title and
+                text_blob_key.
+        """
+        size = self._entry_size(entry)
+        with self._lock:
+            previous = self._entries.pop(content_hash, None)
+            if previous is not None:
+                self._bytes -= self._entry_size(previous)
+            if size > self.max_bytes:
+                return
+            self._entries[content_hash] = entry
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= self._entry_size(evicted)
+                self.evictions += 1
+
+    def stats(self):
+        """
+        Return the cache counters.
+
+        Returns:
+            dict: hits, misses, evictions, entries, bytes and max_bytes.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+extraction_cache = ExtractionCache(app.config["EXTRACTION_CACHE_MAX_BYTES"])
@@ -0,0 +1,283 @@
+"""
+@file-overview This module runs document extraction in a pool of worker processes.
+@filepath utils/extraction_pool.py
+
+MarkItDown/pdfminer extraction is CPU-bound and holds the GIL, and a
+pathological PDF can spin forever. ExtractionPool keeps a bounded set of
+pre-warmed worker processes (utils/extraction_worker.py) and hands each job to
+an idle worker. Each job has a wall-clock timeout, and each worker has an
+address-space limit. A worker that times out, dies or exceeds its memory limit
+is killed and replaced, so one bad document never takes a web worker down.
+Concurrent uploads scale with cores instead of serializing on the GIL.
+
+The pypdf fallback is page-parallel: a PDF's pages are split into ranges that
+run on different workers, and iter_pdf_pages yields the pages in order as soon
+as each range is done.
+"""
+
+import itertools
+import json
+import math
+import os
+import queue
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app
+from utils.extraction_worker import join_pages
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ExtractionError(Exception):
+    """Raised when a worker fails a job or dies while running it."""
+
+
+class ExtractionTimeout(ExtractionError):
+    """Raised when a job exceeds its wall-clock limit."""
+
+
+class _Worker:
+    """Handle on one worker process and the thread reading its responses."""
+
+    def __init__(self, memory_limit_mb):
+        self.process = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "utils.extraction_worker",
+                "--memory-limit-mb",
+                str(memory_limit_mb),
+            ],
+            cwd=PROJECT_DIR,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            encoding="utf-8",
+        )
+        self.responses = queue.Queue()
+        self.tasks = 0
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._reader.start()
+
+    def _read(self):
+        for line in self.process.stdout:
+            self.responses.put(json.loads(line))
+        self.responses.put(None)  # EOF: the process exited
+
+    def send(self, request):
+        self.process.stdin.write(json.dumps(request, ensure_ascii=False) + "\n")
+        self.process.stdin.flush()
+
+    def kill(self):
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+
+
+class ExtractionPool:
+    """A bounded pool of extraction worker processes."""
+
+    def __init__(
+        self,
+        size,
+        timeout,
+        memory_limit_mb,
+        max_tasks_per_worker,
+        min_pages_per_task=8,
+        startup_timeout=60,
+    ):
+        """
+        Initialize the pool (call start() to launch the workers).
+
+        Args:
+            size (int): Number of worker processes.
+            timeout (float): Wall-clock limit of one job, in seconds.
+            memory_limit_mb (int): Address-space limit of each worker, 0 for none.
+            max_tasks_per_worker (int): Recycle a worker after this many jobs.
+            min_pages_per_task (int): Smallest page range handed to one worker
+                by the page-parallel PDF extractor.
+            startup_timeout (float): Seconds a new worker has to become ready.
+        """
+        self.size = size
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.min_pages_per_task = min_pages_per_task
+        self.startup_timeout = startup_timeout
+        self._idle = queue.Queue()
+        self._ids = itertools.count(1)
+        self._started = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Launch and pre-warm all workers (idempotent)."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for _ in range(self.size):
+            self._idle.put(self._spawn())
+        app.logger.info(f"🚀 Extraction pool started with {self.size} worker(s)")
+
+    def _spawn(self):
+        """Start a worker process; it becomes usable once it reports ready."""
+        return _Worker(self.memory_limit_mb)
+
+    def _wait_ready(self, worker):
+        """Consume the worker's ready message, raising if it failed to start."""
+        if getattr(worker, "ready", False):
+            return
+        try:
+            message = worker.responses.get(timeout=self.startup_timeout)
+        except queue.Empty:
+            message = None
+        if not message or not message.get("ready"):
+            raise ExtractionError("Extraction worker failed to start")
+        worker.ready = True
+
+    def _replace(self, worker):
+        """Kill a worker and put a fresh one in its place."""
+        worker.kill()
+        self._idle.put(self._spawn())
+
+    def run(self, op, timeout=None, **params):
+        """
+        Run one operation on an idle worker.
+
+        Args:
+            op (str): Operation name (see extraction_worker.OPERATIONS).
+            timeout (float): Wall-clock limit, defaults to the pool timeout.
+            **params: Operation parameters.
+
+        Returns:
+            dict: The worker's response.
+
+        Raises:
+            ExtractionTimeout: If the job exceeds its wall-clock limit.
+            ExtractionError: If the worker fails the job or dies.
+        """
+        self.start()
+        timeout = timeout or self.timeout
+        worker = self._idle.get()
+        try:
+            self._wait_ready(worker)
+            request_id = next(self._ids)
+            worker.send({"id": request_id, "op": op, **params})
+            response = worker.responses.get(timeout=timeout)
+        except queue.Empty:
+            app.logger.error(f"❌ Extraction worker {worker.process.pid} timed out after {timeout}s, replacing it")
+            self._replace(worker)
+            raise ExtractionTimeout(f"Extraction timed out after {timeout}s")
+        except Exception as e:
+            self._replace(worker)
+            raise ExtractionError(f"Extraction worker failed: {str(e)}")
+
+        if response is None:
+            app.logger.error(f"❌ Extraction worker {worker.process.pid} died, replacing it")
+            self._replace(worker)
+            raise ExtractionError("Extraction worker died (memory limit exceeded or crash)")
+
+        worker.tasks += 1
+        if worker.process.poll() is not None or worker.tasks >= self.max_tasks_per_worker:
+            self._replace(worker)
+        else:
+            self._idle.put(worker)
+
+        if not response.get("ok"):
+            raise ExtractionError(response.get("error", "Extraction failed"))
+        return response
+
+    def _page_ranges(self, page_count):
+        """Split pages into about two ranges per worker, for load balancing."""
+        pages_per_task = max(self.min_pages_per_task, math.ceil(page_count / (self.size * 2)))
+        return [
+            (start, min(start + pages_per_task, page_count))
+            for start in range(0, page_count, pages_per_task)
+        ]
+
+    def iter_pdf_pages(self, file_path):
+        """
+        Extract a PDF with pypdf, page ranges running concurrently on the workers.
+
+        Pages are yielded in document order as soon as the range holding them
+        is done, so callers can start counting or chunking before the whole
+        document has been extracted.
+
+        Args:
+            file_path (str): Path to the PDF file.
+
+        Yields:
+            str: Extracted text of each page.
+
+        Raises:
+            ExtractionTimeout: If a page range exceeds the job timeout.
+            ExtractionError: If a worker fails a page range or dies.
+        """
+        file_path = os.path.abspath(file_path)
+        page_count = self.run("pdf_page_count", path=file_path)["page_count"]
+        ranges = self._page_ranges(page_count)
+        app.logger.info(
+            f"📄 Extracting {page_count} PDF pages in {len(ranges)} range(s) on {self.size} worker(s)"
+        )
+        with ThreadPoolExecutor(max_workers=self.size) as executor:
+            futures = [
+                executor.submit(self.run, "pdf_pages", path=file_path, start=start, stop=stop)
+                for start, stop in ranges
+            ]
+            try:
+                for future in futures:
+                    yield from future.result()["pages"]
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    def extract_pdf(self, file_path):
+        """
+        Extract the full text of a PDF page-parallel (see iter_pdf_pages).
+
+        Args:
+            file_path (str): Path to the PDF file.
+
+        Returns:
+            str: Extracted text content, joined once.
+        """
+        return join_pages(self.iter_pdf_pages(file_path))
+
+    def shutdown(self):
+        """Kill every idle worker."""
+        while True:
+            try:
+                self._idle.get_nowait().kill()
+            except queue.Empty:
+                break
+        self._started = False
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_extraction_pool():
+    """
+    Return the process-wide extraction pool, creating and starting it on first use.
+
+    Returns:
+        ExtractionPool: The pool, or None if EXTRACTION_POOL_SIZE is 0
+            (extraction then runs in-process).
+    """
+    global _pool
+    if app.config["EXTRACTION_POOL_SIZE"] <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ExtractionPool(
+                size=app.config["EXTRACTION_POOL_SIZE"],
+                timeout=app.config["EXTRACTION_TIMEOUT"],
+                memory_limit_mb=app.config["EXTRACTION_MEMORY_LIMIT_MB"],
+                max_tasks_per_worker=app.config["EXTRACTION_MAX_TASKS_PER_WORKER"],
+                min_pages_per_task=app.config["EXTRACTION_PDF_MIN_PAGES_PER_TASK"],
+            )
+    _pool.start()
+    return _pool
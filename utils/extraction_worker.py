@@ -0,0 +1,197 @@
+"""
+@file-overview Standalone document extraction worker process.
+@filepath utils/extraction_worker.py
+
+Run by utils/extraction_pool.py as ``python -m utils.extraction_worker``. The
+worker imports MarkItDown once at startup, applies its memory limit, reports
+that it is ready and then serves extraction requests, one JSON object per line
+on stdin, answering one JSON object per line on stdout. It deliberately does
+not import the Flask app, so it starts fast and holds no web state.
+
+The extraction functions are also used in-process when the pool is disabled.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+
+logger = logging.getLogger("extraction_worker")
+
+
+def extract_text_with_markitdown(file_path):
+    """
+    Extract text from a document with MarkItDown.
+
+    Args:
+        file_path (str): Path to the document.
+
+    Returns:
+        str: Extracted text content.
+    """
+    from markitdown import MarkItDown
+
+    result = MarkItDown().convert(file_path)
+    return getattr(result, "text_content", "")
+
+
+def count_pdf_pages(file_path):
+    """
+    Count the pages of a PDF.
+
+    Args:
+        file_path (str): Path to the PDF file.
+
+    Returns:
+        int: Number of pages.
+    """
+    from pypdf import PdfReader
+
+    return len(PdfReader(file_path).pages)
+
+
+def iter_pdf_pages(file_path, start=0, stop=None):
+    """
+    Yield the text of each PDF page in a range, one page at a time.
+
+    Args:
+        file_path (str): Path to the PDF file.
+        start (int): Index of the first page.
+        stop (int): Index after the last page, None for the end of the document.
+
+    Yields:
+        str: Extracted text of each page, in page order.
+    """
+    from pypdf import PdfReader
+
+    reader = PdfReader(file_path)
+    stop = len(reader.pages) if stop is None else min(stop, len(reader.pages))
+    for index in range(start, stop):
+        yield reader.pages[index].extract_text()
+
+
+def join_pages(pages):
+    """Join page texts the way the pypdf fallback always has (newline-terminated)."""
+    return "".join(f"{page}\n" for page in pages)
+
+
+def extract_text_with_pypdf(file_path):
+    """
+    Extract text from PDF using pypdf as a fallback method.
+
+    Args:
+        file_path (str): Path to the PDF file
+
+    Returns:
+        str: Extracted text content
+    """
+    return join_pages(iter_pdf_pages(file_path))
+
+
+def extract_document(file_path, pdf_fallback=True):
+    """
+    Extract text with MarkItDown, falling back to pypdf if conversion fails.
+
+    Args:
+        file_path (str): Path to the document.
+        pdf_fallback (bool): Run the pypdf fallback here. The extraction pool
+            disables it to run the fallback page-parallel across its workers.
+
+    Returns:
+        dict: {"text_content": str, "method": str} on success, or
+            {"text_content": None, "errors": [str, ...]} if every method failed.
+    """
+    from markitdown import FileConversionException
+    from pdfminer.psexceptions import PSSyntaxError
+
+    errors = []
+    try:
+        logger.info(f"🚀 Attempting to process document with MarkItDown: {file_path}")
+        text_content = extract_text_with_markitdown(file_path)
+        logger.info("✅ MarkItDown conversion successful")
+        return {"text_content": text_content, "method": "markitdown"}
+    except (FileConversionException, PSSyntaxError) as e:
+        errors.append(f"MarkItDown failed: {str(e)}")
+        logger.warning(f"⚠️ MarkItDown failed, attempting pypdf fallback: {str(e)}")
+
+    if not pdf_fallback:
+        return {"text_content": None, "errors": errors}
+
+    try:
+        text_content = extract_text_with_pypdf(file_path)
+        logger.info("✅ pypdf fallback successful")
+        return {"text_content": text_content, "method": "pypdf"}
+    except Exception as e:
+        errors.append(f"pypdf fallback failed: {str(e)}")
+        logger.error(f"❌ pypdf fallback failed: {str(e)}")
+
+    return {"text_content": None, "errors": errors}
+
+
+# Operations a worker can run, by request "op"
+OPERATIONS = {
+    "extract": lambda request: extract_document(
+        request["path"], pdf_fallback=request.get("pdf_fallback", True)
+    ),
+    "pdf_page_count": lambda request: {"page_count": count_pdf_pages(request["path"])},
+    "pdf_pages": lambda request: {
+        "pages": list(iter_pdf_pages(request["path"], request["start"], request["stop"]))
+    },
+    "ping": lambda request: {},
+}
+
+
+def _apply_memory_limit(memory_limit_mb):
+    """Cap the address space of this process (POSIX only)."""
+    if not memory_limit_mb:
+        return
+    try:
+        import resource
+    except ImportError:
+        logger.warning("⚠️ Memory limits are not supported on this platform")
+        return
+    limit = memory_limit_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Document extraction worker")
+    parser.add_argument("--memory-limit-mb", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format=f"%(levelname)s:extraction_worker[{os.getpid()}]:%(message)s")
+
+    # Keep stdout for the protocol; anything libraries print goes to stderr
+    protocol = os.fdopen(os.dup(sys.stdout.fileno()), "w", encoding="utf-8")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    sys.stdout = sys.stderr
+
+    # Pre-warm: pay the heavy imports once, before accepting work
+    import markitdown  # noqa: F401
+    import pypdf  # noqa: F401
+
+    _apply_memory_limit(args.memory_limit_mb)
+
+    def respond(payload):
+        protocol.write(json.dumps(payload, ensure_ascii=False) + "\n")
+        protocol.flush()
+
+    respond({"ready": True, "pid": os.getpid()})
+
+    for line in sys.stdin:
+        request = json.loads(line)
+        try:
+            result = OPERATIONS[request["op"]](request)
+            respond({"id": request.get("id"), "ok": True, **result})
+        except MemoryError:
+            respond({"id": request.get("id"), "ok": False, "error": "Memory limit exceeded"})
+            # The heap may be fragmented or poisoned; let the pool replace us
+            sys.exit(1)
+        except Exception as e:
+            respond({"id": request.get("id"), "ok": False, "error": str(e)})
+    protocol.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,530 @@
+"""
+@file-overview This module provides a database-backed job queue for document analysis.
+@filepath utils/job_queue.py
+
+Paid analyses are persisted as AnalysisJob rows and executed by a small pool of
+in-process worker threads, so HTTP workers never wait on the OpenAI round trip.
+Because the queue lives in the application database, jobs survive restarts and
+can be shared by several processes: a job is claimed with a conditional UPDATE
+(queued -> running), so only one worker ever runs it.
+
+Under the ASGI entry point the thread pool is replaced by run_async_workers,
+which runs up to ANALYSIS_ASYNC_CONCURRENCY jobs on the event loop with the
+AsyncOpenAI client.
+
+The workers also run the periodic housekeeping: re-queuing stale jobs and
+canceling abandoned payment intents (every PAYMENT_INTENT_SWEEP_INTERVAL
+seconds) and deleting unreferenced text blobs and abandoned uploads (every
+STORAGE_GC_INTERVAL seconds).
+
+The jobs of a multi-file upload (utils/batches.py) share the same workers, but
+at most BATCH_ANALYSIS_CONCURRENCY of them run at once, so a large batch
+cannot hold every worker while single uploads wait.
+"""
+
+import asyncio
+import threading
+from datetime import datetime, timedelta, timezone
+
+import click
+from app import app, db
+from models import AnalysisJob
+from utils.ai_analyzer import (
+    analyze_document,
+    analyze_document_async,
+    stream_document_analysis,
+)
+from utils.analysis_store import store_analysis_result
+from utils.async_runtime import run_sync
+from utils.document_processor import ensure_text_content
+from utils.metrics import stage, start_request_timer
+from utils.openai_client import OpenAIUnavailableError
+from utils.payment_intents import cancel_abandoned_intents
+from utils.storage_gc import collect_storage_garbage
+
+# Job states
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+_workers = []
+_workers_lock = threading.Lock()
+_wakeup = threading.Event()
+_stop = threading.Event()
+
+
+def enqueue_analysis_job(
+    document_id, analysis_options=None, payment_id=None, reserve_for_stream=False
+):
+    """
+    Persist a new analysis job and wake up the local workers.
+
+    Args:
+        document_id (int): ID of the document to analyze.
+        analysis_options (dict): Analysis options selected by the user.
+        payment_id (int): ID of the payment that paid for the analysis.
+        reserve_for_stream (bool): Hold the job back from the workers for
+            ANALYSIS_STREAM_CLAIM_GRACE seconds so a streaming client can run it.
+
+    Returns:
+        AnalysisJob: The queued job.
+    """
+    job = AnalysisJob(
+        document_id=document_id,
+        payment_id=payment_id,
+        analysis_options=analysis_options or {},
+        status=JOB_QUEUED,
+    )
+    if reserve_for_stream:
+        job.available_at = datetime.now(timezone.utc) + timedelta(
+            seconds=app.config["ANALYSIS_STREAM_CLAIM_GRACE"]
+        )
+    db.session.add(job)
+    db.session.commit()
+    app.logger.info(f"📥 Analysis job {job.id} queued for document {document_id}")
+    if not reserve_for_stream:
+        _wakeup.set()
+    return job
+
+
+def enqueue_batch_jobs(documents, analysis_options, payment_id, batch_id):
+    """
+    Persist one analysis job per document of a paid batch, in one transaction.
+
+    At most BATCH_ANALYSIS_CONCURRENCY of them run at once (see _claim_next_job).
+
+    Args:
+        documents (List[Document]): The documents of the batch.
+        analysis_options (dict): Analysis options selected by the user.
+        payment_id (int): ID of the payment of the batch.
+        batch_id (str): ID of the batch.
+
+    Returns:
+        List[AnalysisJob]: The queued jobs, in the order of documents.
+    """
+    jobs = [
+        AnalysisJob(
+            document_id=document.id,
+            payment_id=payment_id,
+            batch_id=batch_id,
+            analysis_options=analysis_options or {},
+            status=JOB_QUEUED,
+        )
+        for document in documents
+    ]
+    db.session.add_all(jobs)
+    db.session.commit()
+    app.logger.info(f"📥 {len(jobs)} analysis job(s) queued for batch {batch_id}")
+    _wakeup.set()
+    return jobs
+
+
+def serialize_job(job):
+    """
+    Build the public JSON representation of a job.
+
+    Args:
+        job (AnalysisJob): The job to serialize.
+
+    Returns:
+        dict: Job status fields safe to return to the client.
+    """
+    return {
+        "job_id": job.id,
+        "document_id": job.document_id,
+        "status": job.status,
+        "attempts": job.attempts,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def claim_job(job_id):
+    """
+    Atomically move a specific queued job to the running state.
+
+    Args:
+        job_id (str): ID of the job to claim.
+
+    Returns:
+        bool: True if this caller now owns the job.
+    """
+    claimed = AnalysisJob.query.filter_by(id=job_id, status=JOB_QUEUED).update(
+        {
+            "status": JOB_RUNNING,
+            "started_at": datetime.now(timezone.utc),
+            "attempts": AnalysisJob.attempts + 1,
+        },
+        synchronize_session=False,
+    )
+    db.session.commit()
+    return bool(claimed)
+
+
+def _claim_next_job():
+    """
+    Claim the oldest queued job that is available to the workers.
+
+    Returns:
+        str: The claimed job ID, or None if the queue is empty or another
+            worker won the race.
+    """
+    now = datetime.now(timezone.utc)
+    # Batches already running BATCH_ANALYSIS_CONCURRENCY jobs. Workers racing
+    # for the last slot may briefly exceed the limit by a job each
+    saturated_batches = (
+        db.session.query(AnalysisJob.batch_id)
+        .filter(AnalysisJob.status == JOB_RUNNING, AnalysisJob.batch_id.isnot(None))
+        .group_by(AnalysisJob.batch_id)
+        .having(db.func.count() >= app.config["BATCH_ANALYSIS_CONCURRENCY"])
+    )
+    job = (
+        AnalysisJob.query.filter(
+            AnalysisJob.status == JOB_QUEUED,
+            db.or_(AnalysisJob.available_at.is_(None), AnalysisJob.available_at <= now),
+            db.or_(AnalysisJob.batch_id.is_(None), AnalysisJob.batch_id.notin_(saturated_batches)),
+        )
+        .order_by(AnalysisJob.created_at)
+        .first()
+    )
+    if job is None:
+        db.session.commit()
+        return None
+    return job.id if claim_job(job.id) else None
+
+
+def _load_job_input(job_id):
+    """
+    Read the document text and options of a claimed job.
+
+    The read transaction is released before returning so no database
+    transaction is held across the long OpenAI call.
+
+    Args:
+        job_id (str): ID of a job in the running state.
+
+    Returns:
+        Tuple[str, dict]: The document text and the analysis options.
+    """
+    job = db.session.get(AnalysisJob, job_id)
+    analysis_options = job.analysis_options
+    text_content = ensure_text_content(job.document)
+    db.session.commit()
+    return text_content, analysis_options
+
+
+def _complete_job(job_id, result):
+    """Record the result of a successful job and store it as an AnalysisResult."""
+    job = db.session.get(AnalysisJob, job_id)
+    # A re-queued stale job may finish twice; keep the first stored result
+    if job.status != JOB_SUCCEEDED:
+        store_analysis_result(job, result)
+    job.status = JOB_SUCCEEDED
+    job.result = result
+    job.error = None
+    job.finished_at = datetime.now(timezone.utc)
+    input_tokens = result.get("input_tokens")
+    if input_tokens:
+        job.document.input_tokens_raw = input_tokens["raw"]
+        job.document.input_tokens_compacted = input_tokens["compacted"]
+    db.session.commit()
+    app.logger.info(f"✅ Analysis job {job_id} completed for document {job.document_id}")
+    if job.batch_id:
+        # A queued job of the same batch may have been held back by its limit
+        _wakeup.set()
+
+
+def _fail_job(job_id, error):
+    """
+    Record a job failure, re-queuing it until ANALYSIS_JOB_MAX_ATTEMPTS is reached.
+
+    When OpenAI is unavailable (circuit open or rate limited beyond the retry
+    policy) the re-queued job is held back until it is expected to recover.
+
+    Args:
+        job_id (str): ID of the failed job.
+        error (Exception): The error raised while running the job.
+    """
+    db.session.rollback()
+    job = db.session.get(AnalysisJob, job_id)
+    if job.attempts < app.config["ANALYSIS_JOB_MAX_ATTEMPTS"]:
+        job.status = JOB_QUEUED
+        job.available_at = None
+        if isinstance(error, OpenAIUnavailableError) and error.retry_after:
+            job.available_at = datetime.now(timezone.utc) + timedelta(seconds=error.retry_after)
+        app.logger.warning(f"⚠️ Analysis job {job_id} failed, re-queuing: {str(error)}")
+        _wakeup.set()
+    else:
+        job.status = JOB_FAILED
+        job.finished_at = datetime.now(timezone.utc)
+        app.logger.error(f"❌ Analysis job {job_id} failed: {str(error)}")
+        if job.batch_id:
+            _wakeup.set()
+    job.error = str(error)
+    db.session.commit()
+
+
+def _release_job(job_id):
+    """Return an unfinished running job to the queue without counting a failure."""
+    db.session.rollback()
+    AnalysisJob.query.filter_by(id=job_id, status=JOB_RUNNING).update(
+        {"status": JOB_QUEUED, "available_at": None}, synchronize_session=False
+    )
+    db.session.commit()
+    app.logger.warning(f"⚠️ Analysis job {job_id} released back to the queue")
+    _wakeup.set()
+
+
+def _run_job(job_id):
+    """
+    Execute a claimed job and record its outcome.
+
+    Args:
+        job_id (str): ID of a job in the running state.
+    """
+    start_request_timer("analysis_job")
+    try:
+        with stage("load_input"):
+            text_content, analysis_options = _load_job_input(job_id)
+        with stage("analyze"):
+            result = analyze_document(text_content, analysis_options)
+        # A failed store (e.g. database is locked) is a job failure too,
+        # rather than a job left running until the stale-job recovery
+        with stage("store_result"):
+            _complete_job(job_id, result)
+    except Exception as e:
+        _fail_job(job_id, e)
+
+
+def stream_job(job_id):
+    """
+    Execute a claimed job with the streaming analyzer.
+
+    Args:
+        job_id (str): ID of a job claimed by the caller via claim_job.
+
+    Yields:
+        dict: The events of stream_document_analysis. The final "done" event
+            is only emitted once the result has been stored on the job.
+    """
+    try:
+        text_content, analysis_options = _load_job_input(job_id)
+        for event in stream_document_analysis(text_content, analysis_options):
+            if event["event"] == "done":
+                _complete_job(job_id, event["analysis"])
+            yield event
+    except GeneratorExit:
+        # The client went away mid-stream; hand the job back to the workers
+        _release_job(job_id)
+        raise
+    except Exception as e:
+        _fail_job(job_id, e)
+        raise
+
+
+def requeue_stale_jobs():
+    """
+    Re-queue running jobs whose worker disappeared (crash or restart).
+
+    A job is considered stale once it has been running for longer than
+    ANALYSIS_JOB_STALE_AFTER seconds.
+
+    Returns:
+        int: Number of jobs re-queued.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(
+        seconds=app.config["ANALYSIS_JOB_STALE_AFTER"]
+    )
+    count = AnalysisJob.query.filter(
+        AnalysisJob.status == JOB_RUNNING, AnalysisJob.started_at < cutoff
+    ).update({"status": JOB_QUEUED, "available_at": None}, synchronize_session=False)
+    db.session.commit()
+    if count:
+        app.logger.warning(f"⚠️ Re-queued {count} stale analysis job(s)")
+        _wakeup.set()
+    return count
+
+
+def _worker_loop(worker_index):
+    """
+    Main loop of a worker thread: claim, run, repeat.
+
+    Args:
+        worker_index (int): Index of the worker, used for logging and to elect
+            the worker responsible for stale-job recovery.
+    """
+    poll_interval = app.config["ANALYSIS_JOB_POLL_INTERVAL"]
+    sweep_interval = app.config["PAYMENT_INTENT_SWEEP_INTERVAL"]
+    gc_interval = app.config["STORAGE_GC_INTERVAL"]
+    last_recovery = 0.0
+    last_sweep = last_gc = datetime.now(timezone.utc).timestamp()
+    app.logger.info(f"🚀 Analysis worker {worker_index} started")
+
+    while not _stop.is_set():
+        try:
+            with app.app_context():
+                now = datetime.now(timezone.utc).timestamp()
+                if worker_index == 0 and now - last_recovery >= 60:
+                    requeue_stale_jobs()
+                    last_recovery = now
+                if worker_index == 0 and sweep_interval and now - last_sweep >= sweep_interval:
+                    last_sweep = now
+                    cancel_abandoned_intents()
+                if worker_index == 0 and gc_interval and now - last_gc >= gc_interval:
+                    last_gc = now
+                    collect_storage_garbage()
+
+                job_id = _claim_next_job()
+                if job_id:
+                    _run_job(job_id)
+                    continue
+        except Exception as e:
+            app.logger.error(f"❌ Analysis worker {worker_index} error: {str(e)}")
+
+        _wakeup.wait(poll_interval)
+        _wakeup.clear()
+
+
+def start_workers(worker_count=None):
+    """
+    Start the in-process analysis worker threads (idempotent).
+
+    Args:
+        worker_count (int): Number of threads to start. Defaults to
+            ANALYSIS_WORKER_COUNT; 0 disables in-process workers.
+
+    Returns:
+        list: The running worker threads.
+    """
+    if worker_count is None:
+        worker_count = app.config["ANALYSIS_WORKER_COUNT"]
+
+    with _workers_lock:
+        if _workers:
+            return _workers
+        _stop.clear()
+        for index in range(worker_count):
+            worker = threading.Thread(
+                target=_worker_loop,
+                args=(index,),
+                name=f"analysis-worker-{index}",
+                daemon=True,
+            )
+            worker.start()
+            _workers.append(worker)
+    return _workers
+
+
+def stop_workers(timeout=None):
+    """
+    Signal the worker threads to stop and wait for them to exit.
+
+    Args:
+        timeout (float): Seconds to wait for each worker.
+    """
+    _stop.set()
+    _wakeup.set()
+    with _workers_lock:
+        for worker in _workers:
+            worker.join(timeout)
+        _workers.clear()
+
+
+async def _run_job_async(job_id):
+    """Async counterpart of _run_job: only the OpenAI calls hold the event loop."""
+    start_request_timer("analysis_job")
+    try:
+        with stage("load_input"):
+            text_content, analysis_options = await run_sync(_load_job_input, job_id)
+        with stage("analyze"):
+            result = await analyze_document_async(text_content, analysis_options)
+        with stage("store_result"):
+            await run_sync(_complete_job, job_id, result)
+    except Exception as e:
+        await run_sync(_fail_job, job_id, e)
+
+
+async def run_async_workers(concurrency=None):
+    """
+    Claim and run jobs on the current event loop until stop_workers is called.
+
+    Args:
+        concurrency (int): Maximum number of jobs in flight. Defaults to
+            ANALYSIS_ASYNC_CONCURRENCY.
+    """
+    concurrency = concurrency or app.config["ANALYSIS_ASYNC_CONCURRENCY"]
+    poll_interval = app.config["ANALYSIS_JOB_POLL_INTERVAL"]
+    sweep_interval = app.config["PAYMENT_INTENT_SWEEP_INTERVAL"]
+    gc_interval = app.config["STORAGE_GC_INTERVAL"]
+    slots = asyncio.Semaphore(concurrency)
+    running = set()
+    last_recovery = 0.0
+    last_sweep = last_gc = datetime.now(timezone.utc).timestamp()
+    sweep = gc = None
+    _stop.clear()
+    app.logger.info(f"🚀 Async analysis worker started ({concurrency} concurrent jobs)")
+
+    def release(task):
+        running.discard(task)
+        slots.release()
+
+    while not _stop.is_set():
+        await slots.acquire()
+        job_id = None
+        try:
+            now = datetime.now(timezone.utc).timestamp()
+            if now - last_recovery >= 60:
+                await run_sync(requeue_stale_jobs)
+                last_recovery = now
+            sweep_due = sweep_interval and now - last_sweep >= sweep_interval
+            if sweep_due and (sweep is None or sweep.done()):
+                if sweep is not None and sweep.exception():
+                    app.logger.error(f"❌ Payment intent sweep error: {sweep.exception()}")
+                # The Stripe calls run off the loop without holding up job claims
+                last_sweep = now
+                sweep = asyncio.create_task(run_sync(cancel_abandoned_intents))
+            gc_due = gc_interval and now - last_gc >= gc_interval
+            if gc_due and (gc is None or gc.done()):
+                if gc is not None and gc.exception():
+                    app.logger.error(f"❌ Storage sweep error: {gc.exception()}")
+                last_gc = now
+                gc = asyncio.create_task(run_sync(collect_storage_garbage))
+            job_id = await run_sync(_claim_next_job)
+        except Exception as e:
+            app.logger.error(f"❌ Async analysis worker error: {str(e)}")
+
+        if job_id:
+            task = asyncio.create_task(_run_job_async(job_id))
+            running.add(task)
+            task.add_done_callback(release)
+            continue
+
+        slots.release()
+        await asyncio.to_thread(_wakeup.wait, poll_interval)
+        _wakeup.clear()
+
+    if running:
+        await asyncio.gather(*running, return_exceptions=True)
+
+
+@app.cli.command("run-analysis-workers")
+@click.option(
+    "--workers", type=int, help="Number of worker threads [default: ANALYSIS_WORKER_COUNT]."
+)
+def run_analysis_workers_command(workers):
+    """Run analysis workers in the foreground until interrupted."""
+    if workers is None:
+        workers = app.config["ANALYSIS_WORKER_COUNT"]
+    if workers < 1:
+        raise click.UsageError("No workers to run: pass --workers or set ANALYSIS_WORKER_COUNT")
+    threads = start_workers(workers)
+    app.logger.info(f"🚀 Running {len(threads)} analysis worker(s), press CTRL+C to stop")
+    try:
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(1)
+    except KeyboardInterrupt:
+        stop_workers()
@@ -0,0 +1,289 @@
+"""
+@file-overview Prometheus metrics and per-request stage timing.
+@filepath utils/metrics.py
+
+Hot paths are instrumented with stage(): the upload (save, extraction or
+estimate, database commit, payment intent), the payment confirmation (Stripe
+retrieve, recording the payment) and the analysis jobs (loading the text, the
+analysis, storing the result). Each stage is observed in a histogram labelled
+by route and, inside an HTTP request, added to the request's Server-Timing
+header when METRICS_SERVER_TIMING is on. Extraction time is bucketed by file
+type and size, and OpenAI, Stripe and object storage calls are timed by
+operation and outcome, with OpenAI prompt/completion tokens counted from
+response.usage and storage cache hits and misses counted.
+
+Everything is exposed in the Prometheus text format on /metrics. Under a
+multi-process server, set PROMETHEUS_MULTIPROC_DIR so the endpoint aggregates
+every worker process.
+"""
+
+import contextlib
+import contextvars
+import os
+import time
+
+from flask import request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+from app import app
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "dreamer_http_request_duration_seconds",
+    "HTTP request latency",
+    ["endpoint", "method", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUEST_STAGE_SECONDS = Histogram(
+    "dreamer_request_stage_duration_seconds",
+    "Latency of one stage of a request or analysis job",
+    ["route", "stage"],
+    buckets=LATENCY_BUCKETS,
+)
+EXTRACTION_SECONDS = Histogram(
+    "dreamer_extraction_duration_seconds",
+    "Document text extraction (or character estimate) latency",
+    ["operation", "file_type", "size_class"],
+    buckets=LATENCY_BUCKETS,
+)
+EXTRACTION_FILE_BYTES = Histogram(
+    "dreamer_extraction_file_bytes",
+    "Size of the documents extracted",
+    ["file_type"],
+    buckets=(64 * 1024, 256 * 1024, 1024 ** 2, 4 * 1024 ** 2, 10 * 1024 ** 2, 20 * 1024 ** 2),
+)
+OPENAI_REQUEST_SECONDS = Histogram(
+    "dreamer_openai_request_duration_seconds",
+    "OpenAI request latency (until the stream opens for streaming requests)",
+    ["operation", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+OPENAI_TOKENS = Counter(
+    "dreamer_openai_tokens",
+    "Tokens reported in OpenAI response usage",
+    ["model", "kind"],
+)
+STRIPE_REQUEST_SECONDS = Histogram(
+    "dreamer_stripe_request_duration_seconds",
+    "Stripe API latency",
+    ["operation", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+STORAGE_REQUEST_SECONDS = Histogram(
+    "dreamer_storage_request_duration_seconds",
+    "Latency of object storage requests (S3 backend)",
+    ["operation", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+STORAGE_CACHE_LOOKUPS = Counter(
+    "dreamer_storage_cache_lookups",
+    "Lookups in the local read-through cache of the object storage",
+    ["outcome"],
+)
+
+# Upper bounds of the extraction size classes, in bytes
+_SIZE_CLASSES = [
+    (256 * 1024, "lt_256k"),
+    (1024 ** 2, "256k_1m"),
+    (5 * 1024 ** 2, "1m_5m"),
+]
+
+
+class RequestTimer:
+    """Stage durations of one request or job, for the Server-Timing header."""
+
+    def __init__(self, route):
+        self.route = route
+        self.started = time.perf_counter()
+        self.stages = []
+
+    def server_timing(self):
+        """Return the Server-Timing header value of the recorded stages."""
+        stages = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages]
+        stages.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(stages)
+
+
+# Copied into asyncio.to_thread calls, so run_sync work reports to the caller's timer
+_current_timer = contextvars.ContextVar("request_timer", default=None)
+
+
+def start_request_timer(route):
+    """
+    Start timing the stages of a request or job in the current context.
+
+    Args:
+        route (str): Label of the request or job, e.g. "upload_file".
+
+    Returns:
+        RequestTimer: The timer the following stage() calls report to.
+    """
+    timer = RequestTimer(route)
+    _current_timer.set(timer)
+    return timer
+
+
+@contextlib.contextmanager
+def stage(name):
+    """
+    Time a stage of the current request or job.
+
+    Args:
+        name (str): Stage name, e.g. "db_commit".
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        timer = _current_timer.get()
+        REQUEST_STAGE_SECONDS.labels(timer.route if timer else "other", name).observe(elapsed)
+        if timer is not None:
+            timer.stages.append((name, elapsed))
+
+
+def _file_type(file_path):
+    return os.path.splitext(file_path)[1].lstrip(".").lower() or "unknown"
+
+
+def _size_class(size):
+    return next((label for limit, label in _SIZE_CLASSES if size <= limit), "gt_5m")
+
+
+@contextlib.contextmanager
+def observe_extraction(operation, file_path):
+    """
+    Time a text extraction or character estimate of a document.
+
+    Args:
+        operation (str): "extract" or "estimate".
+        file_path (str): Path to the document.
+    """
+    file_type = _file_type(file_path)
+    size = os.path.getsize(file_path)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        EXTRACTION_SECONDS.labels(operation, file_type, _size_class(size)).observe(
+            time.perf_counter() - started
+        )
+        if operation == "extract":
+            EXTRACTION_FILE_BYTES.labels(file_type).observe(size)
+
+
+@contextlib.contextmanager
+def observe_stripe(operation):
+    """
+    Time a Stripe API call.
+
+    Args:
+        operation (str): The call, e.g. "create_payment_intent".
+    """
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        STRIPE_REQUEST_SECONDS.labels(operation, outcome).observe(time.perf_counter() - started)
+
+
+@contextlib.contextmanager
+def observe_storage(operation):
+    """
+    Time an object storage request.
+
+    Args:
+        operation (str): The request, e.g. "get_object".
+    """
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        STORAGE_REQUEST_SECONDS.labels(operation, outcome).observe(time.perf_counter() - started)
+
+
+def observe_openai_request(operation, outcome, seconds):
+    """Record the latency of one OpenAI request."""
+    OPENAI_REQUEST_SECONDS.labels(operation, outcome).observe(seconds)
+
+
+def record_openai_usage(model, usage):
+    """
+    Count the tokens of an OpenAI response.
+
+    Args:
+        model (str): The model name.
+        usage: The response's usage object (None when the API omitted it).
+    """
+    if usage is None:
+        return
+    OPENAI_TOKENS.labels(model, "prompt").inc(usage.prompt_tokens or 0)
+    OPENAI_TOKENS.labels(model, "completion").inc(usage.completion_tokens or 0)
+
+
+def finish_request(timer, endpoint, method, status):
+    """
+    Record a finished HTTP request.
+
+    Args:
+        timer (RequestTimer): The request's timer.
+        endpoint (str): The endpoint label.
+        method (str): The HTTP method.
+        status (int): The response status code.
+
+    Returns:
+        dict: Response headers to add (Server-Timing, if enabled).
+    """
+    HTTP_REQUEST_SECONDS.labels(endpoint, method, str(status)).observe(
+        time.perf_counter() - timer.started
+    )
+    if app.config["METRICS_SERVER_TIMING"]:
+        return {"Server-Timing": timer.server_timing()}
+    return {}
+
+
+def render_metrics():
+    """
+    Render every metric in the Prometheus text exposition format.
+
+    Returns:
+        Tuple[bytes, str]: The body and its content type.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+@app.before_request
+def _start_request_metrics():
+    start_request_timer(request.endpoint or "unknown")
+
+
+@app.after_request
+def _finish_request_metrics(response):
+    timer = _current_timer.get()
+    if timer is not None:
+        response.headers.update(
+            finish_request(timer, request.endpoint or "unknown", request.method, response.status_code)
+        )
+    return response
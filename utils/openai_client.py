@@ -0,0 +1,471 @@
+"""
+@file-overview Resilient OpenAI chat completions: timeouts, retries, rate limiting, circuit breaking and hedging.
+@filepath utils/openai_client.py
+
+Every analysis request goes through ResilientChatCompletions instead of calling
+the OpenAI SDK directly. A request:
+
+1. fails fast with OpenAIUnavailableError while the circuit breaker is open
+   (too many consecutive timeouts, connection errors or 5xx responses);
+2. waits for the RPM/TPM token buckets when org rate limits are configured;
+3. runs with OPENAI_TIMEOUT, optionally hedged: if no answer arrives within
+   OPENAI_HEDGE_DELAY a duplicate request is sent and the first answer wins;
+4. is retried on 429, timeouts, connection errors and 5xx responses with
+   full-jitter exponential backoff, waiting at least as long as the response's
+   Retry-After header.
+
+The SDK's own retries are disabled so this module is the only retry policy.
+Streaming requests are retried until the stream opens, but never hedged.
+
+The OpenAI SDK is imported when the first client is created, not when this
+module is imported, so web workers that never analyze don't pay its import
+time and memory (gunicorn.conf.py preloads it once in the master instead).
+"""
+
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from email.utils import parsedate_to_datetime
+
+from app import app
+from utils.metrics import observe_openai_request, record_openai_usage
+from utils.prompt_budget import estimate_tokens
+
+
+def _is_retryable(error):
+    """Errors worth retrying; the others (400, 401, 404...) fail immediately."""
+    import openai
+
+    return isinstance(
+        error,
+        (
+            openai.RateLimitError,
+            openai.APIConnectionError,  # Includes APITimeoutError
+            openai.InternalServerError,
+        ),
+    )
+
+
+def _is_breaker_error(error):
+    """Errors that indicate OpenAI itself is unhealthy and count towards the breaker."""
+    import openai
+
+    return isinstance(error, (openai.APIConnectionError, openai.InternalServerError))
+
+
+class OpenAIUnavailableError(Exception):
+    """OpenAI could not serve a request: the circuit is open or retries ran out."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after  # Seconds after which a new attempt may succeed
+
+
+class TokenBucket:
+    """A thread-safe token bucket refilled continuously at capacity per minute."""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount):
+        """
+        Take amount tokens, going into debt if the bucket runs dry.
+
+        Args:
+            amount (int): Tokens to take (capped at the bucket capacity).
+
+        Returns:
+            float: Seconds the caller must wait before using the tokens.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= min(amount, self.capacity)
+            return max(0.0, -self.tokens / self.rate)
+
+
+class RateLimiter:
+    """Client-side view of the org's requests-per-minute and tokens-per-minute limits."""
+
+    def __init__(self, rpm_limit=0, tpm_limit=0):
+        self.requests = TokenBucket(rpm_limit) if rpm_limit else None
+        self.tokens = TokenBucket(tpm_limit) if tpm_limit else None
+
+    def reserve(self, tokens):
+        """
+        Reserve one request and its tokens.
+
+        Args:
+            tokens (int): Estimated prompt plus completion tokens of the request.
+
+        Returns:
+            float: Seconds to wait before sending the request.
+        """
+        delay = 0.0
+        if self.requests is not None:
+            delay = max(delay, self.requests.reserve(1))
+        if self.tokens is not None:
+            delay = max(delay, self.tokens.reserve(tokens))
+        return delay
+
+
+class CircuitBreaker:
+    """
+    Stop calling OpenAI after repeated failures, then probe it with one request.
+
+    Closed: requests flow. After failure_threshold consecutive failures the
+    circuit opens and requests fail immediately for reset_timeout seconds.
+    It then half-opens: a single probe request is let through, which closes the
+    circuit on success and re-opens it on failure.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """
+        Check that a request may be sent.
+
+        Raises:
+            OpenAIUnavailableError: If the circuit is open, or half-open with
+                its probe request already in flight.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if self.state == self.OPEN and remaining <= 0:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            raise OpenAIUnavailableError(
+                "OpenAI circuit breaker is open", retry_after=max(remaining, 1.0)
+            )
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                app.logger.info("✅ OpenAI circuit breaker closed")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    app.logger.error(
+                        f"🔌 OpenAI circuit breaker opened after {self.failures} failures"
+                    )
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def release_probe(self):
+        """Let another probe through after one ended without a verdict (e.g. a 400)."""
+        with self._lock:
+            self._probe_in_flight = False
+
+
+def _get_retry_after(error):
+    """Return the Retry-After delay of an API error in seconds, or None."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _outcome(error):
+    """Metrics label of a request outcome."""
+    if error is None:
+        return "ok"
+    import openai
+
+    if isinstance(error, openai.RateLimitError):
+        return "rate_limited"
+    if isinstance(error, openai.APITimeoutError):
+        return "timeout"
+    return "error"
+
+
+def _estimate_request_tokens(kwargs):
+    """Estimate the prompt plus completion tokens a request counts against TPM."""
+    prompt = sum(estimate_tokens(message["content"]) for message in kwargs["messages"])
+    return prompt + kwargs.get("max_tokens", app.config["OPENAI_MAX_TOKENS"])
+
+
+class ResilientChatCompletions:
+    """Drop-in wrapper for client.chat.completions.create (sync and async)."""
+
+    def __init__(self):
+        self._client = None
+        self._async_client = None
+        self._client_lock = threading.Lock()
+        self._async_client_lock = threading.Lock()
+        self.limiter = RateLimiter(app.config["OPENAI_RPM_LIMIT"], app.config["OPENAI_TPM_LIMIT"])
+        self.breaker = CircuitBreaker(
+            app.config["OPENAI_CIRCUIT_FAILURE_THRESHOLD"],
+            app.config["OPENAI_CIRCUIT_RESET_TIMEOUT"],
+        )
+        self._hedge_executor = None
+        self._hedge_executor_lock = threading.Lock()
+
+    @property
+    def client(self):
+        """The shared OpenAI client, created (and the SDK imported) on first use."""
+        with self._client_lock:
+            if self._client is None:
+                from openai import OpenAI
+
+                self._client = OpenAI(
+                    api_key=app.config["OPENAI_API_KEY"],
+                    base_url=app.config["OPENAI_BASE_URL"],
+                    timeout=app.config["OPENAI_TIMEOUT"],
+                    max_retries=0,
+                )
+        return self._client
+
+    def get_async_client(self):
+        """
+        Return the shared AsyncOpenAI client, creating it on first use.
+
+        The client pools its HTTP connections, so one event loop can hold many
+        concurrent completions without a thread per request.
+
+        Returns:
+            AsyncOpenAI: The client.
+        """
+        with self._async_client_lock:
+            if self._async_client is None:
+                from openai import AsyncOpenAI
+
+                self._async_client = AsyncOpenAI(
+                    api_key=app.config["OPENAI_API_KEY"],
+                    base_url=app.config["OPENAI_BASE_URL"],
+                    timeout=app.config["OPENAI_TIMEOUT"],
+                    max_retries=0,
+                )
+        return self._async_client
+
+    async def close_async_client(self):
+        """Close the AsyncOpenAI client if one was created."""
+        with self._async_client_lock:
+            client, self._async_client = self._async_client, None
+        if client is not None:
+            await client.close()
+
+    def _get_hedge_executor(self):
+        with self._hedge_executor_lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(
+                    max_workers=32, thread_name_prefix="openai-hedge"
+                )
+        return self._hedge_executor
+
+    def _should_hedge(self, kwargs):
+        return app.config["OPENAI_HEDGE_ENABLED"] and not kwargs.get("stream")
+
+    def _record(self, kwargs, error, started, response=None):
+        """Record the outcome of one request in the metrics and the circuit breaker."""
+        operation = "stream" if kwargs.get("stream") else "completion"
+        observe_openai_request(operation, _outcome(error), time.perf_counter() - started)
+        if response is not None and not kwargs.get("stream"):
+            record_openai_usage(kwargs["model"], response.usage)
+
+        if error is None:
+            self.breaker.record_success()
+        elif _is_breaker_error(error):
+            self.breaker.record_failure()
+        else:
+            self.breaker.release_probe()
+
+    def _next_delay(self, error, attempt):
+        """
+        Decide whether a failed attempt is retried, and after how long.
+
+        Args:
+            error (Exception): The error of the attempt.
+            attempt (int): 0-based number of the failed attempt.
+
+        Returns:
+            float: Seconds to sleep before the next attempt.
+
+        Raises:
+            Exception: The error itself if it is not retryable.
+            OpenAIUnavailableError: If retries are exhausted, or Retry-After
+                asks for a longer wait than OPENAI_BACKOFF_MAX.
+        """
+        if not _is_retryable(error):
+            raise error
+        retry_after = _get_retry_after(error)
+        backoff_max = app.config["OPENAI_BACKOFF_MAX"]
+        if attempt >= app.config["OPENAI_MAX_RETRIES"] or (retry_after or 0) > backoff_max:
+            raise OpenAIUnavailableError(
+                f"OpenAI request failed after {attempt + 1} attempt(s): {str(error)}",
+                retry_after=retry_after,
+            ) from error
+        # Full jitter spreads the retries of concurrent requests apart
+        delay = random.uniform(0, min(backoff_max, app.config["OPENAI_BACKOFF_BASE"] * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        app.logger.warning(
+            f"⚠️ OpenAI request failed (attempt {attempt + 1}), retrying in {delay:.1f}s: {str(error)}"
+        )
+        return delay
+
+    # Synchronous requests
+
+    def _send(self, kwargs):
+        """Send one request through the breaker and the rate limiter."""
+        self.breaker.before_call()
+        delay = self.limiter.reserve(_estimate_request_tokens(kwargs))
+        if delay > 0:
+            time.sleep(delay)
+        started = time.perf_counter()
+        try:
+            response = self.client.chat.completions.create(**kwargs)
+        except Exception as e:
+            self._record(kwargs, e, started)
+            raise
+        self._record(kwargs, None, started, response)
+        return response
+
+    def _send_hedged(self, kwargs):
+        """Send a request, duplicating it if the first copy is slow."""
+        executor = self._get_hedge_executor()
+        first = executor.submit(self._send, kwargs)
+        done, _ = wait([first], timeout=app.config["OPENAI_HEDGE_DELAY"])
+        if done:
+            return first.result()
+
+        app.logger.info("🐢 OpenAI request is slow, sending a hedged duplicate")
+        second = executor.submit(self._send, kwargs)
+        done, pending = wait([first, second], return_when=FIRST_COMPLETED)
+        winner = min(done, key=lambda future: future.exception() is not None)
+        if winner.exception() is not None and pending:
+            return pending.pop().result()
+        # The losing request cannot be interrupted; it finishes in the background
+        return winner.result()
+
+    def create(self, **kwargs):
+        """
+        Create a chat completion, with retries, rate limiting and hedging.
+
+        Args:
+            **kwargs: Arguments of client.chat.completions.create.
+
+        Returns:
+            ChatCompletion | Stream: The SDK response.
+
+        Raises:
+            OpenAIUnavailableError: If OpenAI is unavailable or rate limited
+                beyond the retry policy.
+        """
+        send = self._send_hedged if self._should_hedge(kwargs) else self._send
+        attempt = 0
+        while True:
+            try:
+                return send(kwargs)
+            except OpenAIUnavailableError:
+                raise
+            except Exception as e:
+                time.sleep(self._next_delay(e, attempt))
+            attempt += 1
+
+    # Asynchronous requests
+
+    async def _asend(self, kwargs):
+        """Async counterpart of _send."""
+        self.breaker.before_call()
+        delay = self.limiter.reserve(_estimate_request_tokens(kwargs))
+        if delay > 0:
+            await asyncio.sleep(delay)
+        started = time.perf_counter()
+        try:
+            response = await self.get_async_client().chat.completions.create(**kwargs)
+        except asyncio.CancelledError:
+            self.breaker.release_probe()
+            raise
+        except Exception as e:
+            self._record(kwargs, e, started)
+            raise
+        self._record(kwargs, None, started, response)
+        return response
+
+    async def _asend_hedged(self, kwargs):
+        """Async counterpart of _send_hedged; the losing request is cancelled."""
+        first = asyncio.ensure_future(self._asend(kwargs))
+        done, _ = await asyncio.wait({first}, timeout=app.config["OPENAI_HEDGE_DELAY"])
+        if done:
+            return first.result()
+
+        app.logger.info("🐢 OpenAI request is slow, sending a hedged duplicate")
+        second = asyncio.ensure_future(self._asend(kwargs))
+        done, pending = await asyncio.wait({first, second}, return_when=asyncio.FIRST_COMPLETED)
+        winner = min(done, key=lambda task: task.exception() is not None)
+        if winner.exception() is not None and pending:
+            return await pending.pop()
+        for task in pending:
+            task.cancel()
+        return winner.result()
+
+    async def acreate(self, **kwargs):
+        """Async counterpart of create."""
+        send = self._asend_hedged if self._should_hedge(kwargs) else self._asend
+        attempt = 0
+        while True:
+            try:
+                return await send(kwargs)
+            except OpenAIUnavailableError:
+                raise
+            except Exception as e:
+                await asyncio.sleep(self._next_delay(e, attempt))
+            attempt += 1
+
+
+# the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
+# do not change this unless explicitly requested by the user
+
+chat_completions = ResilientChatCompletions()
+
+
+def get_async_client():
+    """Return the shared AsyncOpenAI client (see ResilientChatCompletions.get_async_client)."""
+    return chat_completions.get_async_client()
+
+
+async def close_async_client():
+    """Close the shared AsyncOpenAI client, if any (see ResilientChatCompletions.close_async_client)."""
+    await chat_completions.close_async_client()
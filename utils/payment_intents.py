@@ -0,0 +1,185 @@
+"""
+@file-overview Lifecycle of the Stripe payment intents created at upload.
+@filepath utils/payment_intents.py
+
+Every intent created for an upload is tracked as a CheckoutIntent row. When the
+same browser (identified by a random client token) uploads the same file again
+while its intent is still unpaid, the upload reuses that intent and its
+document instead of creating new ones; only a changed price costs a Stripe call,
+which updates the amount in place. Intents left unpaid for
+PAYMENT_INTENT_ABANDON_AFTER seconds are canceled in batches by
+cancel_abandoned_intents, which the analysis workers run every
+PAYMENT_INTENT_SWEEP_INTERVAL seconds.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import click
+from app import app, db
+from models import CheckoutIntent
+from utils.stripe_utils import cancel_payment_intent, confirm_payment_intent
+
+# Stripe states in which the customer has not paid yet and the intent can
+# still be reused, repriced or canceled
+OPEN_INTENT_STATUSES = ("requires_payment_method", "requires_confirmation", "requires_action")
+
+
+def _abandon_cutoff():
+    """Return the time before which an idle open intent counts as abandoned."""
+    return datetime.now(timezone.utc) - timedelta(
+        seconds=app.config["PAYMENT_INTENT_ABANDON_AFTER"]
+    )
+
+
+def find_reusable_intent(client_token, content_hash):
+    """
+    Find the open intent of a previous upload of the same file by the same browser.
+
+    Args:
+        client_token (str): Random id of the uploading browser, or None.
+        content_hash (str): SHA-256 hex digest of the uploaded file.
+
+    Returns:
+        CheckoutIntent | None: The most recent reusable intent, or None.
+    """
+    if not client_token or not content_hash:
+        return None
+    return (
+        CheckoutIntent.query.filter(
+            CheckoutIntent.client_token == client_token,
+            CheckoutIntent.content_hash == content_hash,
+            CheckoutIntent.status.in_(OPEN_INTENT_STATUSES),
+            CheckoutIntent.updated_at >= _abandon_cutoff(),
+        )
+        .order_by(CheckoutIntent.created_at.desc())
+        .first()
+    )
+
+
+def record_intent(payment_intent, document_id, client_token=None, content_hash=None, batch_id=None):
+    """
+    Track a newly created payment intent.
+
+    Args:
+        payment_intent (stripe.PaymentIntent): The created intent.
+        document_id (int): ID of the document it pays for, None for a batch.
+        client_token (str): Random id of the uploading browser, or None.
+        content_hash (str): SHA-256 hex digest of the uploaded file.
+        batch_id (str): ID of the upload batch it pays for, or None.
+
+    Returns:
+        CheckoutIntent: The new row.
+    """
+    checkout_intent = CheckoutIntent(
+        stripe_payment_id=payment_intent.id,
+        client_secret=payment_intent.client_secret,
+        amount=payment_intent.amount,
+        currency=payment_intent.currency,
+        status=payment_intent.status,
+        client_token=client_token,
+        content_hash=content_hash,
+        document_id=document_id,
+        batch_id=batch_id,
+    )
+    db.session.add(checkout_intent)
+    db.session.commit()
+    return checkout_intent
+
+
+def record_intent_amount(payment_intent_id, amount):
+    """
+    Store the new amount of a repriced intent (also restarts its idle time).
+
+    Args:
+        payment_intent_id (str): ID of the Stripe payment intent.
+        amount (int): The amount now charged, in cents.
+    """
+    CheckoutIntent.query.filter_by(stripe_payment_id=payment_intent_id).update(
+        {"amount": amount, "updated_at": datetime.now(timezone.utc)},
+        synchronize_session=False,
+    )
+    db.session.commit()
+
+
+def record_intent_status(payment_intent_id, status):
+    """
+    Store the latest known Stripe status of a tracked intent.
+
+    Args:
+        payment_intent_id (str): ID of the Stripe payment intent.
+        status (str): Its status, from a webhook or an API response.
+
+    Returns:
+        int: Number of rows updated (0 for intents created elsewhere).
+    """
+    count = CheckoutIntent.query.filter_by(stripe_payment_id=payment_intent_id).update(
+        {"status": status, "updated_at": datetime.now(timezone.utc)},
+        synchronize_session=False,
+    )
+    db.session.commit()
+    return count
+
+
+def cancel_abandoned_intents(batch_size=None):
+    """
+    Cancel a batch of intents that stayed unpaid past PAYMENT_INTENT_ABANDON_AFTER.
+
+    An intent paid in the meantime cannot be canceled; its actual status is
+    recorded instead, so it leaves the sweep either way.
+
+    Args:
+        batch_size (int): Maximum intents handled. Defaults to
+            PAYMENT_INTENT_SWEEP_BATCH.
+
+    Returns:
+        int: Number of intents canceled.
+    """
+    batch_size = batch_size or app.config["PAYMENT_INTENT_SWEEP_BATCH"]
+    payment_intent_ids = [
+        checkout_intent.stripe_payment_id
+        for checkout_intent in CheckoutIntent.query.filter(
+            CheckoutIntent.status.in_(OPEN_INTENT_STATUSES),
+            CheckoutIntent.updated_at < _abandon_cutoff(),
+        )
+        .order_by(CheckoutIntent.updated_at)
+        .limit(batch_size)
+    ]
+    # End the read transaction before the Stripe round trips
+    db.session.commit()
+    if not payment_intent_ids:
+        return 0
+
+    import stripe
+
+    statuses = {}
+    for payment_intent_id in payment_intent_ids:
+        try:
+            statuses[payment_intent_id] = cancel_payment_intent(payment_intent_id).status
+        except stripe.error.InvalidRequestError:
+            # No longer cancelable (paid, processing or already canceled)
+            try:
+                statuses[payment_intent_id] = confirm_payment_intent(payment_intent_id).status
+            except stripe.error.StripeError:
+                continue
+        except stripe.error.StripeError:
+            continue
+
+    for payment_intent_id, status in statuses.items():
+        CheckoutIntent.query.filter_by(stripe_payment_id=payment_intent_id).update(
+            {"status": status, "updated_at": datetime.now(timezone.utc)},
+            synchronize_session=False,
+        )
+    db.session.commit()
+
+    canceled = sum(1 for status in statuses.values() if status == "canceled")
+    app.logger.info(
+        f"🧹 Swept {len(payment_intent_ids)} abandoned payment intent(s), {canceled} canceled"
+    )
+    return canceled
+
+
+@app.cli.command("cancel-abandoned-intents")
+@click.option("--batch", default=None, type=int, help="Maximum intents to cancel.")
+def cancel_abandoned_intents_command(batch):
+    """Cancel payment intents left unpaid past PAYMENT_INTENT_ABANDON_AFTER."""
+    cancel_abandoned_intents(batch)
@@ -0,0 +1,264 @@
+"""
+@file-overview This module compacts document text and budgets the input tokens of analysis prompts.
+@filepath utils/prompt_budget.py
+
+Extracted text carries noise that costs tokens and latency without helping the
+analysis: MarkItDown markup (embedded images, link targets, table rules,
+emphasis markers), running headers and footers repeated on every page, page
+numbers and runs of whitespace. compact_text strips them. count_tokens uses the
+model's tiktoken encoding when it is installed and available offline, and the
+CJK-aware estimate otherwise. fit_to_budget applies the per-model input-token
+budget, either by truncating (keeping the opening and the ending) or by
+telling the caller to take the long-document map-reduce path.
+"""
+
+import re
+import threading
+from collections import Counter
+
+from app import app
+
+try:
+    import tiktoken
+except ImportError:  # Optional dependency: fall back to the estimate
+    tiktoken = None
+
+# CJK ideographs, kana, hangul and full-width forms count as ~1 token each
+_CJK_RE = re.compile(r"[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+# Standalone page-number lines: "12", "- 12 -", "Page 3 of 10", "第 3 页 / 共 10 页", "3/10"
+_PAGE_NUMBER_RE = re.compile(
+    r"^[-–—\s]*(?:page\s+)?\d{1,4}(?:\s*(?:/|of)\s*\d{1,4})?[-–—\s]*$"
+    r"|^第\s*\d{1,4}\s*页(?:\s*[/,，]?\s*共\s*\d{1,4}\s*页)?$",
+    re.IGNORECASE,
+)
+_EXPLICIT_PAGE_NUMBER_RE = re.compile(
+    r"^(?:[-–—]\s*\d{1,4}\s*[-–—]|page\s+\d{1,4}(?:\s+of\s+\d{1,4})?"
+    r"|第\s*\d{1,4}\s*页(?:\s*[/,，]?\s*共\s*\d{1,4}\s*页)?)$",
+    re.IGNORECASE,
+)
+
+# MarkItDown markup that carries no text
+_IMAGE_RE = re.compile(r"!\[[^\]]*\]\([^)]*\)")
+_LINK_RE = re.compile(r"\[([^\]]+)\]\([^)]*\)")
+_EMPHASIS_RE = re.compile(r"(\*\*|__)(?=\S)(.+?)(?<=\S)\1")
+_TABLE_RULE_RE = re.compile(r"^\|?(?:\s*:?-{3,}:?\s*\|)+\s*:?-*:?\s*$")
+_HTML_COMMENT_RE = re.compile(r"<!--.*?-->", re.DOTALL)
+
+# Truncation keeps whole lines and sentences
+_TRUNCATION_UNIT_RE = re.compile(r"(?<=\n)|(?<=[。！？；!?;])")
+
+# Lines checked at the top and bottom of every page for running headers/footers
+_EDGE_LINES = 2
+_MAX_BOILERPLATE_LENGTH = 80
+
+_encodings = {}
+_encodings_lock = threading.Lock()
+
+
+def estimate_tokens(text):
+    """Estimate the token count of text without a tokenizer."""
+    other_chars = len(_CJK_RE.sub("", text))
+    return (len(text) - other_chars) + (other_chars + 3) // 4
+
+
+def _get_encoding(model):
+    """Return the tiktoken encoding of model, or None if it is unavailable."""
+    if tiktoken is None:
+        return None
+    with _encodings_lock:
+        if model not in _encodings:
+            try:
+                _encodings[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                _encodings[model] = tiktoken.get_encoding("o200k_base")
+            except Exception as e:
+                # The encoding files are downloaded on first use; stay offline-safe
+                app.logger.warning(f"⚠️ tiktoken unavailable, estimating tokens: {str(e)}")
+                _encodings[model] = None
+        return _encodings[model]
+
+
+def count_tokens(text, model=None):
+    """
+    Count the tokens of text for a model.
+
+    Args:
+        text (str): The text to count.
+        model (str): The OpenAI model name, defaults to OPENAI_MODEL_NAME.
+
+    Returns:
+        int: The token count (estimated when no tokenizer is available).
+    """
+    encoding = _get_encoding(model or app.config["OPENAI_MODEL_NAME"])
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _boilerplate_key(line):
+    """Normalize a line so running headers that only differ by page number match."""
+    return re.sub(r"\d+", "#", line.strip().lower())
+
+
+def _strip_page_furniture(text):
+    """
+    Remove running headers/footers and page numbers.
+
+    With form-feed page breaks (pdfminer/MarkItDown output), the first and last
+    lines of each page are candidates: a short line repeated at the edges of at
+    least half of the pages is boilerplate, and so is a bare page number. Without
+    page breaks only unambiguous page-number lines ("- 3 -", "Page 3", "第3页")
+    are removed, since repeated lines may be genuine content.
+    """
+    pages = text.split("\f")
+    if len(pages) < 3:
+        lines = [line for line in text.split("\n") if not _EXPLICIT_PAGE_NUMBER_RE.match(line.strip())]
+        return "\n".join(lines)
+
+    page_lines = [page.split("\n") for page in pages]
+    edge_counts = Counter()
+    for lines in page_lines:
+        content = [index for index, line in enumerate(lines) if line.strip()]
+        edges = set(content[:_EDGE_LINES] + content[-_EDGE_LINES:])
+        keys = {
+            _boilerplate_key(lines[index])
+            for index in edges
+            if len(lines[index].strip()) <= _MAX_BOILERPLATE_LENGTH
+        }
+        edge_counts.update(keys)
+    threshold = max(3, len(pages) // 2)
+    boilerplate = {key for key, count in edge_counts.items() if count >= threshold}
+
+    kept_pages = []
+    for lines in page_lines:
+        content = [index for index, line in enumerate(lines) if line.strip()]
+        edges = set(content[:_EDGE_LINES] + content[-_EDGE_LINES:])
+        kept_pages.append(
+            "\n".join(
+                line
+                for index, line in enumerate(lines)
+                if index not in edges
+                or not (
+                    _boilerplate_key(line) in boilerplate
+                    or _PAGE_NUMBER_RE.match(line.strip())
+                )
+            )
+        )
+    return "\n".join(kept_pages)
+
+
+def compact_text(text):
+    """
+    Strip markup noise, page furniture and redundant whitespace from extracted text.
+
+    Args:
+        text (str): The extracted document text.
+
+    Returns:
+        str: The compacted text.
+    """
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = _HTML_COMMENT_RE.sub("", text)
+    text = _strip_page_furniture(text)
+    text = _IMAGE_RE.sub("", text)
+    text = _LINK_RE.sub(r"\1", text)
+    text = _EMPHASIS_RE.sub(r"\2", text)
+
+    lines = []
+    for line in text.split("\n"):
+        if _TABLE_RULE_RE.match(line.strip()):
+            continue
+        lines.append(re.sub(r"[ \t\u00a0]+", " ", line).strip())
+    text = "\n".join(lines)
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+
+def get_input_token_budget(model=None):
+    """
+    Return the input-token budget of a model.
+
+    Args:
+        model (str): The OpenAI model name, defaults to OPENAI_MODEL_NAME.
+
+    Returns:
+        int: Maximum tokens of document text sent in one request.
+    """
+    model = model or app.config["OPENAI_MODEL_NAME"]
+    budgets = app.config["OPENAI_INPUT_TOKEN_BUDGETS"]
+    return budgets.get(model, budgets["default"])
+
+
+def truncate_to_budget(text, budget, model=None):
+    """
+    Truncate text to a token budget, keeping its opening and its ending.
+
+    The opening gets three quarters of the budget and the ending the rest; cuts
+    fall on line or sentence boundaries and the omission is marked in the text.
+
+    Args:
+        text (str): The compacted document text.
+        budget (int): Maximum number of tokens.
+        model (str): The OpenAI model name.
+
+    Returns:
+        str: The truncated text.
+    """
+    marker = "\n\n[……中间部分因篇幅限制已省略……]\n\n"
+    units = [unit for unit in _TRUNCATION_UNIT_RE.split(text) if unit]
+    remaining = budget - count_tokens(marker, model)
+
+    head_end, used = 0, 0
+    for unit in units:
+        tokens = count_tokens(unit, model)
+        if used + tokens > remaining * 3 // 4:
+            break
+        used += tokens
+        head_end += 1
+
+    tail_start = len(units)
+    for unit in reversed(units[head_end:]):
+        tokens = count_tokens(unit, model)
+        if used + tokens > remaining:
+            break
+        used += tokens
+        tail_start -= 1
+
+    return "".join(units[:head_end]).rstrip() + marker + "".join(units[tail_start:]).lstrip()
+
+
+def fit_to_budget(text_content, model=None):
+    """
+    Compact text and check it against the model's input-token budget.
+
+    Args:
+        text_content (str): The extracted document text.
+        model (str): The OpenAI model name.
+
+    Returns:
+        Tuple[str, dict, bool]: The text to send, token statistics
+            ({"raw", "compacted", "sent", "budget", "policy"}), and whether the
+            text still exceeds the budget and must take the map-reduce path.
+    """
+    raw_tokens = count_tokens(text_content, model)
+    compacted = compact_text(text_content) if app.config["INPUT_COMPACTION_ENABLED"] else text_content
+    compacted_tokens = count_tokens(compacted, model) if compacted != text_content else raw_tokens
+    budget = get_input_token_budget(model)
+    stats = {
+        "raw": raw_tokens,
+        "compacted": compacted_tokens,
+        "sent": compacted_tokens,
+        "budget": budget,
+        "policy": None,
+    }
+    if compacted_tokens <= budget:
+        return compacted, stats, False
+
+    stats["policy"] = app.config["INPUT_BUDGET_POLICY"]
+    if stats["policy"] == "truncate":
+        truncated = truncate_to_budget(compacted, budget, model)
+        stats["sent"] = count_tokens(truncated, model)
+        app.logger.info(f"✂️ Input truncated from {compacted_tokens} to {stats['sent']} tokens")
+        return truncated, stats, False
+    app.logger.info(f"🧩 Input of {compacted_tokens} tokens exceeds the {budget}-token budget")
+    return compacted, stats, True
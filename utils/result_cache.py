@@ -0,0 +1,215 @@
+"""
+@file-overview This module provides a persistent cache for AI analysis results.
+@filepath utils/result_cache.py
+
+analyze_document is a pure function of the document text, the enabled
+sections, the model parameters and the settings of the pipeline around the
+model (input compaction and budget, execution mode), so its result is cached
+under a canonical SHA-256 of those inputs; changing any of them starts a new
+set of entries instead of serving results computed under the old settings.
+Entries live in the AnalysisCacheEntry table (shared by every process) with a
+small in-process LRU in front of it. Entries expire after ANALYSIS_CACHE_TTL
+seconds and the table is kept under ANALYSIS_CACHE_MAX_BYTES by evicting the
+least recently used rows.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from app import app, db
+from models import AnalysisCacheEntry
+
+
+def make_cache_key(text_content, sections, model, temperature, max_tokens, settings=None):
+    """
+    Build the canonical cache key for an analysis request.
+
+    Args:
+        text_content (str): The document text sent to the model.
+        sections (list): Enabled analysis sections, in canonical order.
+        model (str): The OpenAI model name.
+        temperature (float): Sampling temperature.
+        max_tokens (int): Completion token limit.
+        settings (dict): Other settings that change the output for the same
+            input (JSON-serializable), or None.
+
+    Returns:
+        str: SHA-256 hex digest identifying the request.
+    """
+    payload = {
+        "text_sha256": hashlib.sha256(text_content.encode("utf-8")).hexdigest(),
+        "sections": list(sections),
+        "model": model,
+        "temperature": float(temperature),
+        "max_tokens": int(max_tokens),
+        "settings": settings or {},
+    }
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class AnalysisResultCache:
+    """Two-level (memory, database) cache of analysis results."""
+
+    def __init__(self, ttl, max_bytes, memory_entries):
+        """
+        Initialize the cache.
+
+        Args:
+            ttl (int): Seconds an entry stays valid.
+            max_bytes (int): Maximum total size of the database entries.
+            memory_entries (int): Number of entries kept in process memory.
+        """
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()  # cache_key -> (expires_at_epoch, result)
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.database_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _remember(self, cache_key, result, expires_at):
+        with self._lock:
+            self._memory[cache_key] = (expires_at, result)
+            self._memory.move_to_end(cache_key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, cache_key):
+        """
+        Look up a cached result.
+
+        Args:
+            cache_key (str): Key built by make_cache_key.
+
+        Returns:
+            dict: The cached analysis result, or None on a miss.
+        """
+        with self._lock:
+            cached = self._memory.get(cache_key)
+            if cached is not None:
+                expires_at, result = cached
+                if expires_at > time.time():
+                    self._memory.move_to_end(cache_key)
+                    self.memory_hits += 1
+                    return result
+                del self._memory[cache_key]
+
+        now = datetime.now(timezone.utc)
+        entry = AnalysisCacheEntry.query.filter(
+            AnalysisCacheEntry.cache_key == cache_key,
+            AnalysisCacheEntry.expires_at > now,
+        ).first()
+        if entry is None:
+            db.session.commit()
+            with self._lock:
+                self.misses += 1
+            return None
+
+        result = entry.result
+        entry.hit_count += 1
+        entry.last_accessed_at = now
+        remaining = (entry.expires_at.replace(tzinfo=None) - now.replace(tzinfo=None)).total_seconds()
+        db.session.commit()
+
+        self._remember(cache_key, result, time.time() + remaining)
+        with self._lock:
+            self.database_hits += 1
+        return result
+
+    def put(self, cache_key, result):
+        """
+        Store a result and enforce the TTL and size limits.
+
+        Args:
+            cache_key (str): Key built by make_cache_key.
+            result (dict): The analysis result to cache.
+        """
+        now = datetime.now(timezone.utc)
+        entry = AnalysisCacheEntry(
+            cache_key=cache_key,
+            result=result,
+            size_bytes=len(json.dumps(result, ensure_ascii=False).encode("utf-8")),
+            hit_count=0,
+            created_at=now,
+            last_accessed_at=now,
+            expires_at=now + timedelta(seconds=self.ttl),
+        )
+        try:
+            db.session.merge(entry)
+            db.session.commit()
+            self._evict(now)
+        except Exception as e:
+            db.session.rollback()
+            app.logger.warning(f"⚠️ Failed to store analysis cache entry: {str(e)}")
+        self._remember(cache_key, result, time.time() + self.ttl)
+
+    def _evict(self, now):
+        """Delete expired entries, then least recently used ones above max_bytes."""
+        expired = AnalysisCacheEntry.query.filter(
+            AnalysisCacheEntry.expires_at <= now
+        ).delete(synchronize_session=False)
+
+        total = (
+            db.session.query(db.func.coalesce(db.func.sum(AnalysisCacheEntry.size_bytes), 0))
+            .scalar()
+        )
+        evicted_keys = []
+        if total > self.max_bytes:
+            rows = (
+                db.session.query(AnalysisCacheEntry.cache_key, AnalysisCacheEntry.size_bytes)
+                .order_by(AnalysisCacheEntry.last_accessed_at)
+                .all()
+            )
+            for cache_key, size_bytes in rows:
+                if total <= self.max_bytes:
+                    break
+                evicted_keys.append(cache_key)
+                total -= size_bytes
+            AnalysisCacheEntry.query.filter(
+                AnalysisCacheEntry.cache_key.in_(evicted_keys)
+            ).delete(synchronize_session=False)
+        db.session.commit()
+
+        with self._lock:
+            for cache_key in evicted_keys:
+                self._memory.pop(cache_key, None)
+            self.evictions += expired + len(evicted_keys)
+
+    def stats(self):
+        """
+        Return the cache counters and current size.
+
+        Returns:
+            dict: Hit/miss/eviction counters and entry counts.
+        """
+        entries, total_bytes = db.session.query(
+            db.func.count(AnalysisCacheEntry.cache_key),
+            db.func.coalesce(db.func.sum(AnalysisCacheEntry.size_bytes), 0),
+        ).one()
+        db.session.commit()
+        with self._lock:
+            return {
+                "memory_hits": self.memory_hits,
+                "database_hits": self.database_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "memory_entries": len(self._memory),
+                "entries": entries,
+                "bytes": int(total_bytes),
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+            }
+
+
+result_cache = AnalysisResultCache(
+    ttl=app.config["ANALYSIS_CACHE_TTL"],
+    max_bytes=app.config["ANALYSIS_CACHE_MAX_BYTES"],
+    memory_entries=app.config["ANALYSIS_CACHE_MEMORY_ENTRIES"],
+)
@@ -0,0 +1,522 @@
+"""
+@file-overview Pluggable storage of uploads and extracted text blobs.
+@filepath utils/storage.py
+
+Files that every app node must see are stored through a backend chosen by
+STORAGE_BACKEND, one storage per area ("uploads", "text_blobs"):
+
+- "local" (default): plain directories, UPLOAD_FOLDER and TEXT_BLOB_DIR. Only
+  suitable for a single node, or for directories on a shared filesystem.
+- "s3": an S3-compatible bucket (AWS S3, MinIO, ...; STORAGE_S3_ENDPOINT_URL),
+  under STORAGE_S3_PREFIX + "<area>/". Objects are read through a local cache
+  (STORAGE_CACHE_DIR, at most STORAGE_CACHE_MAX_BYTES, least recently used
+  files evicted first), so extraction and mmap reads still get a local file
+  and repeated reads do not go back to the bucket.
+
+Writes stream into a temporary file that is published atomically (renamed on
+disk, or uploaded with a managed, multipart-capable transfer), so readers never
+see a partial object. Keys are relative paths with "/" separators.
+
+boto3 is only imported when the S3 backend is used.
+"""
+
+import contextlib
+import os
+import shutil
+import tempfile
+import threading
+
+from app import app
+from utils.metrics import STORAGE_CACHE_LOOKUPS, observe_storage
+
+# Buffer size of streaming copies
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Directory of each area in the local backend
+_LOCAL_ROOTS = {"uploads": "UPLOAD_FOLDER", "text_blobs": "TEXT_BLOB_DIR"}
+
+_storages = {}
+_storages_lock = threading.Lock()
+
+
+class StorageObjectNotFound(Exception):
+    """Raised when a stored object does not exist."""
+
+
+def _relative_path(root, key):
+    return os.path.join(root, *key.split("/"))
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+class LocalStorage:
+    """Storage backend of files in a local (or shared) directory."""
+
+    def __init__(self, root):
+        """
+        Initialize the backend.
+
+        Args:
+            root (str): Directory holding the objects.
+        """
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key):
+        return _relative_path(self.root, key)
+
+    @contextlib.contextmanager
+    def open_write(self, key):
+        """
+        Stream a new object; it is published when the block exits cleanly.
+
+        Args:
+            key (str): The object key.
+
+        Yields:
+            file: A binary file object to write the content to.
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as destination:
+                yield destination
+            os.replace(tmp_path, path)
+        except BaseException:
+            _remove(tmp_path)
+            raise
+
+    def open_read(self, key):
+        """
+        Open an object for streaming reads.
+
+        Args:
+            key (str): The object key.
+
+        Returns:
+            file: A binary file object.
+
+        Raises:
+            StorageObjectNotFound: If the object does not exist.
+        """
+        try:
+            return open(self._path(key), "rb")
+        except FileNotFoundError:
+            raise StorageObjectNotFound(key)
+
+    def put_file(self, key, path):
+        """
+        Store a local file as an object, taking ownership of the file.
+
+        Args:
+            key (str): The object key.
+            path (str): The file; it is moved, not copied.
+        """
+        target = self._path(key)
+        if os.path.abspath(path) == os.path.abspath(target):
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.move(path, target)
+
+    def local_path(self, key):
+        """
+        Return a local file holding an object.
+
+        Args:
+            key (str): The object key.
+
+        Returns:
+            str: Path of the file.
+
+        Raises:
+            StorageObjectNotFound: If the object does not exist.
+        """
+        path = self._path(key)
+        if not os.path.exists(path):
+            raise StorageObjectNotFound(key)
+        return path
+
+    def stat(self, key):
+        """Return the (size, mtime) of an object, or None if it does not exist."""
+        try:
+            stat = os.stat(self._path(key))
+        except FileNotFoundError:
+            return None
+        return stat.st_size, stat.st_mtime
+
+    def touch(self, key):
+        """
+        Set an object's modification time to now.
+
+        Returns:
+            bool: False if the object does not exist.
+        """
+        try:
+            os.utime(self._path(key))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def delete(self, key):
+        """Delete an object, if it exists."""
+        _remove(self._path(key))
+
+    def iter_objects(self):
+        """
+        List the stored objects (files and directories starting with "." are skipped).
+
+        Yields:
+            Tuple[str, int, float]: The key, size and mtime of each object.
+        """
+        for directory, subdirectories, files in os.walk(self.root):
+            subdirectories[:] = [name for name in subdirectories if not name.startswith(".")]
+            prefix = os.path.relpath(directory, self.root).replace(os.sep, "/")
+            for name in files:
+                if name.startswith("."):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(directory, name))
+                except FileNotFoundError:
+                    continue
+                yield (name if prefix == "." else f"{prefix}/{name}"), stat.st_size, stat.st_mtime
+
+    def remove_stale_temp_files(self, cutoff):
+        """
+        Delete temporary files of interrupted writes.
+
+        Args:
+            cutoff (float): Only files modified before this timestamp are deleted.
+
+        Returns:
+            int: Number of files deleted.
+        """
+        removed = 0
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(directory, name)
+                if name.startswith(".tmp-") and os.path.getmtime(path) < cutoff:
+                    removed += _remove(path)
+        return removed
+
+
+class ReadThroughCache:
+    """
+    Size-bounded local copies of remote objects, evicted least recently used first.
+
+    Recency is the file's mtime, refreshed on every hit, so the cache survives
+    restarts and is shared by the processes of a node.
+    """
+
+    def __init__(self, directory, max_bytes):
+        """
+        Initialize the cache.
+
+        Args:
+            directory (str): Directory of the cached files.
+            max_bytes (int): Size above which the least recently used files are evicted.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None  # Bytes cached, counted on the first insert
+
+    def _path(self, key):
+        return _relative_path(self.directory, key)
+
+    def get(self, key, fetch):
+        """
+        Return the local copy of an object, fetching it on a miss.
+
+        Args:
+            key (str): Cache key of the object.
+            fetch (callable): fetch(destination) writes the object's content
+                to a binary file object.
+
+        Returns:
+            str: Path of the cached file.
+        """
+        path = self._path(key)
+        try:
+            os.utime(path)
+            STORAGE_CACHE_LOOKUPS.labels("hit").inc()
+            return path
+        except FileNotFoundError:
+            STORAGE_CACHE_LOOKUPS.labels("miss").inc()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as destination:
+                fetch(destination)
+            os.replace(tmp_path, path)
+        except BaseException:
+            _remove(tmp_path)
+            raise
+        self._added(path)
+        return path
+
+    def adopt(self, key, source_path):
+        """Move a local file into the cache, e.g. an upload just stored remotely."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.move(source_path, path)
+        self._added(path)
+
+    def discard(self, key):
+        """Drop the cached copy of an object."""
+        _remove(self._path(key))
+
+    def _entries(self):
+        for directory, _, files in os.walk(self.directory):
+            for name in files:
+                if name.startswith("."):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def _added(self, path):
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            else:
+                self._size += os.path.getsize(path)
+            if self._size <= self.max_bytes:
+                return
+            # Other processes of the node also fill the directory: recount
+            entries = sorted(self._entries(), key=lambda entry: entry[2])
+            self._size = sum(size for _, size, _ in entries)
+            evicted = 0
+            for entry_path, size, _ in entries:
+                if self._size <= self.max_bytes:
+                    break
+                if entry_path == path:
+                    continue
+                if _remove(entry_path):
+                    self._size -= size
+                    evicted += 1
+        if evicted:
+            app.logger.info(f"🧹 Evicted {evicted} file(s) from the storage cache")
+
+
+class S3Storage:
+    """Storage backend of objects in an S3-compatible bucket, read through a local cache."""
+
+    def __init__(self, client, bucket, prefix, cache):
+        """
+        Initialize the backend.
+
+        Args:
+            client: A boto3 S3 client.
+            bucket (str): The bucket.
+            prefix (str): Prefix of the object names, ending with "/".
+            cache (ReadThroughCache): The node's cache, shared by every area.
+        """
+        from botocore.exceptions import ClientError
+
+        self._client_error = ClientError
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.cache = cache
+
+    def _name(self, key):
+        return self.prefix + key
+
+    def _is_missing(self, error):
+        return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+    @contextlib.contextmanager
+    def open_write(self, key):
+        """
+        Stream a new object; it is uploaded when the block exits cleanly.
+
+        The content is spooled to a temporary file, so memory use does not
+        depend on its size, and uploaded in parts when it is large.
+
+        Args:
+            key (str): The object key.
+
+        Yields:
+            file: A binary file object to write the content to.
+        """
+        with tempfile.TemporaryFile() as spool:
+            yield spool
+            spool.seek(0)
+            with observe_storage("put_object"):
+                self.client.upload_fileobj(spool, self.bucket, self._name(key))
+
+    def open_read(self, key):
+        """
+        Open an object for streaming reads.
+
+        Args:
+            key (str): The object key.
+
+        Returns:
+            botocore.response.StreamingBody: The object's content.
+
+        Raises:
+            StorageObjectNotFound: If the object does not exist.
+        """
+        try:
+            with observe_storage("get_object"):
+                return self.client.get_object(Bucket=self.bucket, Key=self._name(key))["Body"]
+        except self._client_error as e:
+            if self._is_missing(e):
+                raise StorageObjectNotFound(key)
+            raise
+
+    def put_file(self, key, path):
+        """
+        Upload a local file as an object and keep it in the cache.
+
+        Args:
+            key (str): The object key.
+            path (str): The file; it is moved into the cache.
+        """
+        with observe_storage("put_object"):
+            self.client.upload_file(path, self.bucket, self._name(key))
+        self.cache.adopt(self._name(key), path)
+
+    def local_path(self, key):
+        """
+        Return a local file holding an object, downloading it on a cache miss.
+
+        Args:
+            key (str): The object key.
+
+        Returns:
+            str: Path of the cached file.
+
+        Raises:
+            StorageObjectNotFound: If the object does not exist.
+        """
+
+        def fetch(destination):
+            with contextlib.closing(self.open_read(key)) as body:
+                shutil.copyfileobj(body, destination, COPY_CHUNK_SIZE)
+
+        return self.cache.get(self._name(key), fetch)
+
+    def stat(self, key):
+        """Return the (size, mtime) of an object, or None if it does not exist."""
+        try:
+            with observe_storage("head_object"):
+                head = self.client.head_object(Bucket=self.bucket, Key=self._name(key))
+        except self._client_error as e:
+            if self._is_missing(e):
+                return None
+            raise
+        return head["ContentLength"], head["LastModified"].timestamp()
+
+    def touch(self, key):
+        """
+        Set an object's modification time to now, by copying it onto itself.
+
+        Returns:
+            bool: False if the object does not exist.
+        """
+        name = self._name(key)
+        try:
+            with observe_storage("copy_object"):
+                self.client.copy_object(
+                    Bucket=self.bucket,
+                    Key=name,
+                    CopySource={"Bucket": self.bucket, "Key": name},
+                    MetadataDirective="REPLACE",
+                )
+        except self._client_error as e:
+            if self._is_missing(e):
+                return False
+            raise
+        return True
+
+    def delete(self, key):
+        """Delete an object and its cached copy."""
+        with observe_storage("delete_object"):
+            self.client.delete_object(Bucket=self.bucket, Key=self._name(key))
+        self.cache.discard(self._name(key))
+
+    def iter_objects(self):
+        """
+        List the stored objects.
+
+        Yields:
+            Tuple[str, int, float]: The key, size and mtime of each object.
+        """
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get("Contents", []):
+                key = item["Key"][len(self.prefix):]
+                yield key, item["Size"], item["LastModified"].timestamp()
+
+    def remove_stale_temp_files(self, cutoff):
+        """Interrupted uploads leave no objects behind (abort them with a bucket lifecycle rule)."""
+        return 0
+
+
+def _create_s3_client():
+    import boto3
+    from botocore.config import Config
+
+    config = Config(
+        retries={"mode": "standard"},
+        max_pool_connections=app.config["STORAGE_S3_MAX_CONNECTIONS"],
+        # MinIO and most self-hosted servers only serve path-style URLs
+        s3={"addressing_style": "path" if app.config["STORAGE_S3_ENDPOINT_URL"] else "auto"},
+    )
+    return boto3.session.Session().client(
+        "s3",
+        endpoint_url=app.config["STORAGE_S3_ENDPOINT_URL"],
+        region_name=app.config["STORAGE_S3_REGION"],
+        config=config,
+    )
+
+
+def get_storage(area):
+    """
+    Return the storage of an area, created on first use.
+
+    Args:
+        area (str): "uploads" or "text_blobs".
+
+    Returns:
+        LocalStorage | S3Storage: The configured backend.
+    """
+    storage = _storages.get(area)
+    if storage is not None:
+        return storage
+    with _storages_lock:
+        if area in _storages:
+            return _storages[area]
+        backend = app.config["STORAGE_BACKEND"]
+        if backend == "local":
+            storage = LocalStorage(app.config[_LOCAL_ROOTS[area]])
+        elif backend == "s3":
+            s3 = next((s for s in _storages.values() if isinstance(s, S3Storage)), None)
+            if s3 is not None:
+                client, cache = s3.client, s3.cache
+            else:
+                client = _create_s3_client()
+                cache = ReadThroughCache(
+                    app.config["STORAGE_CACHE_DIR"], app.config["STORAGE_CACHE_MAX_BYTES"]
+                )
+            storage = S3Storage(
+                client, app.config["STORAGE_S3_BUCKET"], f"{app.config['STORAGE_S3_PREFIX']}{area}/", cache
+            )
+            app.logger.info(f"🪣 Storing {area} in s3://{storage.bucket}/{storage.prefix}")
+        else:
+            raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+        _storages[area] = storage
+    return storage
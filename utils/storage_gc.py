@@ -0,0 +1,218 @@
+"""
+@file-overview Garbage collection of extracted-text blobs and abandoned uploads.
+@filepath utils/storage_gc.py
+
+collect_storage_garbage runs four passes, each sparing files modified less than
+STORAGE_GC_GRACE seconds ago (uploads and extractions still in progress). Uploads
+and blobs are listed and deleted through utils/storage.py, so the sweep works
+the same on a local directory and on a bucket shared by several nodes:
+
+1. legacy text files (text_content_file_path) are moved into the compressed
+   blob store and deleted once no Document points at them; unreferenced
+   debug/text_content_*.txt files left by earlier versions are deleted;
+2. uploads without a Document row are deleted;
+3. uploads of abandoned documents, never paid and with every payment intent
+   canceled (see utils/payment_intents.py; for the documents of an upload
+   batch, those of the batch), are deleted and the documents release their
+   text blob;
+4. text blobs referenced by no Document row, and temporary files of
+   interrupted blob writes, are deleted.
+
+The analysis workers run it every STORAGE_GC_INTERVAL seconds; `flask
+collect-storage-garbage` runs it on demand.
+"""
+
+import glob
+import os
+import time
+
+from app import app, db
+from models import CheckoutIntent, Document, Payment
+from utils.storage import get_storage
+from utils.text_blobs import delete_blob, iter_blobs, put_text, remove_stale_temp_files
+
+# Files of the local upload folder that are not uploads
+_UPLOAD_FOLDER_KEEP = {"README.md"}
+
+
+def _grace_cutoff():
+    """Return the modification time after which files are left alone."""
+    return time.time() - app.config["STORAGE_GC_GRACE"]
+
+
+def _batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _purchase(document_id, batch_id):
+    """Return what a payment or intent pays for: a batch, or a single document."""
+    return ("batch", batch_id) if batch_id else ("document", document_id)
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def migrate_legacy_text_files():
+    """
+    Move legacy uncompressed text files into the blob store.
+
+    Returns:
+        int: Number of legacy files deleted.
+    """
+    batch_size = app.config["STORAGE_GC_BATCH"]
+    documents = (
+        Document.query.filter(
+            Document.text_content_file_path.isnot(None),
+            Document.text_blob_key.is_(None),
+        )
+        .limit(batch_size)
+        .all()
+    )
+    paths = set()
+    for document in documents:
+        path = document.text_content_file_path
+        paths.add(path)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as text_file:
+                document.text_blob_key = put_text(text_file.read())
+        # A missing file is re-extracted from the upload when needed
+        document.text_content_file_path = None
+    db.session.commit()
+
+    removed = 0
+    for path in paths:
+        if not Document.query.filter_by(text_content_file_path=path).count():
+            removed += _remove_file(path)
+
+    # Files of earlier versions that no document points at
+    referenced = {
+        path for (path,) in db.session.query(Document.text_content_file_path).filter(
+            Document.text_content_file_path.isnot(None)
+        )
+    }
+    db.session.commit()
+    cutoff = _grace_cutoff()
+    for path in glob.glob(os.path.join(app.config["DEBUG_DIR"], "text_content_*.txt")):
+        if path not in referenced and os.path.getmtime(path) < cutoff:
+            removed += _remove_file(path)
+    return removed
+
+
+def collect_abandoned_uploads():
+    """
+    Delete uploads without a document, and uploads of abandoned documents.
+
+    Returns:
+        int: Number of uploads deleted.
+    """
+    uploads = get_storage("uploads")
+    cutoff = _grace_cutoff()
+    candidates = [
+        name
+        for name, _, mtime in uploads.iter_objects()
+        if name not in _UPLOAD_FOLDER_KEEP and mtime < cutoff
+    ]
+
+    removed = 0
+    for names in _batches(candidates, app.config["STORAGE_GC_BATCH"]):
+        documents = Document.query.filter(Document.filename.in_(names)).all()
+        document_ids = [document.id for document in documents]
+        batch_ids = {document.batch_id for document in documents if document.batch_id}
+        # Documents of an upload batch are paid (and abandoned) with their batch
+        paid = {
+            _purchase(document_id, batch_id)
+            for document_id, batch_id in db.session.query(
+                Payment.document_id, Payment.batch_id
+            ).filter(db.or_(Payment.document_id.in_(document_ids), Payment.batch_id.in_(batch_ids)))
+        }
+        with_intents, with_live_intents = set(), set()
+        for document_id, batch_id, status in db.session.query(
+            CheckoutIntent.document_id, CheckoutIntent.batch_id, CheckoutIntent.status
+        ).filter(
+            db.or_(
+                CheckoutIntent.document_id.in_(document_ids),
+                CheckoutIntent.batch_id.in_(batch_ids),
+            )
+        ):
+            with_intents.add(_purchase(document_id, batch_id))
+            if status != "canceled":
+                with_live_intents.add(_purchase(document_id, batch_id))
+
+        keep = set()
+        for document in documents:
+            purchase = _purchase(document.id, document.batch_id)
+            abandoned = (
+                purchase in with_intents
+                and purchase not in with_live_intents
+                and purchase not in paid
+            )
+            if abandoned:
+                document.text_blob_key = None
+                document.text_content_file_path = None
+            else:
+                keep.add(document.filename)
+        db.session.commit()
+
+        for name in names:
+            if name not in keep:
+                uploads.delete(name)
+                removed += 1
+    return removed
+
+
+def collect_text_blobs():
+    """
+    Delete the text blobs no Document references.
+
+    Returns:
+        Tuple[int, int]: Number of blobs deleted and bytes freed.
+    """
+    referenced = {
+        key for (key,) in db.session.query(Document.text_blob_key).filter(
+            Document.text_blob_key.isnot(None)
+        ).distinct()
+    }
+    db.session.commit()
+
+    cutoff = _grace_cutoff()
+    removed, freed = 0, 0
+    for key, size, mtime in list(iter_blobs()):
+        if key not in referenced and mtime < cutoff:
+            delete_blob(key)
+            removed += 1
+            freed += size
+
+    # Left behind by writers killed before publishing the blob
+    remove_stale_temp_files(cutoff)
+    return removed, freed
+
+
+def collect_storage_garbage():
+    """
+    Run every garbage collection pass.
+
+    Returns:
+        dict: Files deleted by each pass and bytes freed in the blob store.
+    """
+    legacy_files = migrate_legacy_text_files()
+    uploads = collect_abandoned_uploads()
+    blobs, freed = collect_text_blobs()
+    if legacy_files or uploads or blobs:
+        app.logger.info(
+            f"🧹 Storage sweep: {legacy_files} legacy text file(s), {uploads} upload(s) and "
+            f"{blobs} text blob(s) deleted, {freed / 1024:.0f} KB of blobs freed"
+        )
+    return {"legacy_files": legacy_files, "uploads": uploads, "blobs": blobs, "blob_bytes_freed": freed}
+
+
+@app.cli.command("collect-storage-garbage")
+def collect_storage_garbage_command():
+    """Delete unreferenced text blobs and abandoned uploads."""
+    stats = collect_storage_garbage()
+    print(", ".join(f"{name}: {value}" for name, value in stats.items()))
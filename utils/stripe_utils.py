@@ -1,22 +1,124 @@
 """
 @file-overview This module provides utility functions for handling Stripe payment intents in the Dreamer Document AI project.
 @filepath utils/stripe_utils.py
+
+The *_async variants are used by the ASGI entry point; they share one
+StripeClient whose HTTPX transport pools connections across requests.
+
+Payment intents carry the document id and analysis options in their
+metadata, so the payment_intent.succeeded webhook (verified with
+construct_webhook_event) has everything needed to queue the analysis.
+
+Final intent states seen in webhooks and API responses (succeeded, canceled)
+are kept in a short-lived in-process cache for PAYMENT_INTENT_STATE_TTL
+seconds, so confirming a payment the webhook already reported needs no
+Stripe round trip.
+
+The Stripe SDK is imported and configured on first use (_get_stripe), not at
+import time, so starting a web worker does not pay for it.
 """
 
 import os
-import stripe
+import threading
+import time
+from collections import OrderedDict
 from app import app
+from utils.metrics import observe_stripe
 
-stripe.api_key = app.config["STRIPE_SECRET_KEY"]
+_stripe = None
+_stripe_lock = threading.Lock()
+_async_client = None
+_async_client_lock = threading.Lock()
 
+# Intent states that can no longer change
+FINAL_INTENT_STATUSES = ("succeeded", "canceled")
+_INTENT_STATE_ENTRIES = 1024
 
-def create_payment_intent(amount, currency="cny"):
+_intent_states = OrderedDict()  # payment_intent_id -> (expires_at, payment_intent)
+_intent_states_lock = threading.Lock()
+
+
+def _get_stripe():
+    """
+    Import and configure the Stripe SDK on first use.
+
+    Returns:
+        module: The stripe module, with the API key and base set.
+    """
+    global _stripe
+    with _stripe_lock:
+        if _stripe is None:
+            import stripe
+
+            stripe.api_key = app.config["STRIPE_SECRET_KEY"]
+            if app.config["STRIPE_API_BASE"]:
+                stripe.api_base = app.config["STRIPE_API_BASE"]
+            _stripe = stripe
+    return _stripe
+
+
+def remember_payment_intent(payment_intent):
+    """
+    Cache a payment intent in a final state for PAYMENT_INTENT_STATE_TTL seconds.
+
+    Intents in any other state are ignored, since the customer can still
+    change them.
+
+    Args:
+        payment_intent (stripe.PaymentIntent): Intent from a webhook or API response.
+    """
+    ttl = app.config["PAYMENT_INTENT_STATE_TTL"]
+    if ttl <= 0 or payment_intent.status not in FINAL_INTENT_STATUSES:
+        return
+    with _intent_states_lock:
+        _intent_states[payment_intent.id] = (time.monotonic() + ttl, payment_intent)
+        _intent_states.move_to_end(payment_intent.id)
+        while len(_intent_states) > _INTENT_STATE_ENTRIES:
+            _intent_states.popitem(last=False)
+
+
+def _cached_payment_intent(payment_intent_id):
+    """Return the cached final state of an intent, or None."""
+    with _intent_states_lock:
+        entry = _intent_states.get(payment_intent_id)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del _intent_states[payment_intent_id]
+            return None
+        return entry[1]
+
+
+def get_async_stripe_client():
+    """
+    Return the shared StripeClient for async calls, creating it on first use.
+
+    Returns:
+        stripe.StripeClient: A client backed by a pooled HTTPX async transport.
+    """
+    global _async_client
+    stripe = _get_stripe()
+    with _async_client_lock:
+        if _async_client is None:
+            base_addresses = {}
+            if app.config["STRIPE_API_BASE"]:
+                base_addresses["api"] = app.config["STRIPE_API_BASE"]
+            _async_client = stripe.StripeClient(
+                app.config["STRIPE_SECRET_KEY"],
+                http_client=stripe.HTTPXClient(),
+                base_addresses=base_addresses,
+            )
+    return _async_client
+
+
+def create_payment_intent(amount, currency="cny", metadata=None):
     """
     Create a payment intent for document analysis.
 
     Args:
         amount (int): The amount to charge in the smallest currency unit (e.g., cents).
         currency (str): The currency code (default is 'cny').
+        metadata (dict): Extra metadata, e.g. the document id.
 
     Returns:
         stripe.PaymentIntent: The created payment intent object.
@@ -24,14 +126,16 @@ def create_payment_intent(amount, currency="cny"):
     Raises:
         stripe.error.StripeError: If there is an error creating the payment intent.
     """
+    stripe = _get_stripe()
     try:
-        intent = stripe.PaymentIntent.create(
-            amount=amount,
-            currency=currency,
-            automatic_payment_methods={"enabled": True},
-            payment_method_configuration=app.config["STRIPE_PAYMENT_METHOD_CONFIG"],
-            metadata={"service": "document_analysis"},
-        )
+        with observe_stripe("create_payment_intent"):
+            intent = stripe.PaymentIntent.create(
+                amount=amount,
+                currency=currency,
+                automatic_payment_methods={"enabled": True},
+                payment_method_configuration=app.config["STRIPE_PAYMENT_METHOD_CONFIG"],
+                metadata={"service": "document_analysis", **(metadata or {})},
+            )
         return intent
     except stripe.error.StripeError as e:
         app.logger.error(f"Stripe error: {str(e)}")
@@ -51,9 +155,179 @@ def confirm_payment_intent(payment_intent_id):
     Raises:
         stripe.error.StripeError: If there is an error retrieving the payment intent.
     """
+    stripe = _get_stripe()
+    cached = _cached_payment_intent(payment_intent_id)
+    if cached is not None:
+        app.logger.info(f"⚡ Payment {payment_intent_id} is {cached.status} (cached)")
+        return cached
+    try:
+        with observe_stripe("retrieve_payment_intent"):
+            intent = stripe.PaymentIntent.retrieve(payment_intent_id)
+        remember_payment_intent(intent)
+        return intent
+    except stripe.error.StripeError as e:
+        app.logger.error(f"Stripe error: {str(e)}")
+        raise e
+
+
+def update_payment_intent_amount(payment_intent_id, amount):
+    """
+    Change the amount of an intent the customer has not paid yet.
+
+    Args:
+        payment_intent_id (str): The ID of the payment intent.
+        amount (int): The new amount in the smallest currency unit.
+
+    Returns:
+        stripe.PaymentIntent: The updated payment intent object.
+
+    Raises:
+        stripe.error.StripeError: If the intent cannot be updated (for
+            example because it has succeeded or been canceled).
+    """
+    stripe = _get_stripe()
+    try:
+        with observe_stripe("update_payment_intent"):
+            return stripe.PaymentIntent.modify(payment_intent_id, amount=amount)
+    except stripe.error.StripeError as e:
+        app.logger.error(f"Stripe error: {str(e)}")
+        raise e
+
+
+def cancel_payment_intent(payment_intent_id):
+    """
+    Cancel an abandoned payment intent.
+
+    Args:
+        payment_intent_id (str): The ID of the payment intent.
+
+    Returns:
+        stripe.PaymentIntent: The canceled payment intent object.
+
+    Raises:
+        stripe.error.StripeError: If the intent cannot be canceled (for
+            example because it has succeeded in the meantime).
+    """
+    stripe = _get_stripe()
+    try:
+        with observe_stripe("cancel_payment_intent"):
+            intent = stripe.PaymentIntent.cancel(
+                payment_intent_id, cancellation_reason="abandoned"
+            )
+        remember_payment_intent(intent)
+        return intent
+    except stripe.error.StripeError as e:
+        app.logger.error(f"Stripe error: {str(e)}")
+        raise e
+
+
+async def create_payment_intent_async(amount, currency="cny", metadata=None):
+    """
+    Create a payment intent without blocking the event loop.
+
+    Args:
+        amount (int): The amount to charge in the smallest currency unit (e.g., cents).
+        currency (str): The currency code (default is 'cny').
+        metadata (dict): Extra metadata, e.g. the document id.
+
+    Returns:
+        stripe.PaymentIntent: The created payment intent object.
+
+    Raises:
+        stripe.error.StripeError: If there is an error creating the payment intent.
+    """
+    stripe = _get_stripe()
+    params = {
+        "amount": amount,
+        "currency": currency,
+        "automatic_payment_methods": {"enabled": True},
+        "metadata": {"service": "document_analysis", **(metadata or {})},
+    }
+    if app.config["STRIPE_PAYMENT_METHOD_CONFIG"]:
+        params["payment_method_configuration"] = app.config["STRIPE_PAYMENT_METHOD_CONFIG"]
+    try:
+        with observe_stripe("create_payment_intent"):
+            return await get_async_stripe_client().payment_intents.create_async(params=params)
+    except stripe.error.StripeError as e:
+        app.logger.error(f"Stripe error: {str(e)}")
+        raise e
+
+
+async def confirm_payment_intent_async(payment_intent_id):
+    """
+    Retrieve a payment intent without blocking the event loop.
+
+    Args:
+        payment_intent_id (str): The ID of the payment intent to confirm.
+
+    Returns:
+        stripe.PaymentIntent: The payment intent object.
+
+    Raises:
+        stripe.error.StripeError: If there is an error retrieving the payment intent.
+    """
+    stripe = _get_stripe()
+    cached = _cached_payment_intent(payment_intent_id)
+    if cached is not None:
+        app.logger.info(f"⚡ Payment {payment_intent_id} is {cached.status} (cached)")
+        return cached
     try:
-        intent = stripe.PaymentIntent.retrieve(payment_intent_id)
+        with observe_stripe("retrieve_payment_intent"):
+            intent = await get_async_stripe_client().payment_intents.retrieve_async(
+                payment_intent_id
+            )
+        remember_payment_intent(intent)
         return intent
     except stripe.error.StripeError as e:
         app.logger.error(f"Stripe error: {str(e)}")
         raise e
+
+
+async def update_payment_intent_amount_async(payment_intent_id, amount):
+    """
+    Change the amount of an unpaid intent without blocking the event loop.
+
+    Args:
+        payment_intent_id (str): The ID of the payment intent.
+        amount (int): The new amount in the smallest currency unit.
+
+    Returns:
+        stripe.PaymentIntent: The updated payment intent object.
+
+    Raises:
+        stripe.error.StripeError: If the intent cannot be updated.
+    """
+    stripe = _get_stripe()
+    try:
+        with observe_stripe("update_payment_intent"):
+            return await get_async_stripe_client().payment_intents.update_async(
+                payment_intent_id, params={"amount": amount}
+            )
+    except stripe.error.StripeError as e:
+        app.logger.error(f"Stripe error: {str(e)}")
+        raise e
+
+
+def construct_webhook_event(payload, sig_header):
+    """
+    Verify the signature of a Stripe webhook request and parse its event.
+
+    Args:
+        payload (bytes): The raw request body.
+        sig_header (str): The Stripe-Signature header.
+
+    Returns:
+        stripe.Event: The verified event.
+
+    Raises:
+        ValueError: If the payload is not valid JSON.
+        stripe.error.SignatureVerificationError: If the signature does not
+            match STRIPE_WEBHOOK_SECRET or is older than STRIPE_WEBHOOK_TOLERANCE.
+    """
+    stripe = _get_stripe()
+    return stripe.Webhook.construct_event(
+        payload,
+        sig_header,
+        app.config["STRIPE_WEBHOOK_SECRET"],
+        tolerance=app.config["STRIPE_WEBHOOK_TOLERANCE"],
+    )
@@ -0,0 +1,186 @@
+"""
+@file-overview Compressed, content-addressed store of extracted document text.
+@filepath utils/text_blobs.py
+
+Each distinct extracted text is stored once in the "text_blobs" storage area
+(utils/storage.py: TEXT_BLOB_DIR, or a bucket shared by every node), named by
+the SHA-256 of the text: <key[:2]>/<key>.zst, compressed with zstd (or zlib,
+<key>.zz, when the zstandard package is not installed). The compressed stream
+is written straight to the storage, which publishes it atomically, so readers
+never see a partial blob, and storing a text that already exists only
+refreshes the blob's mtime.
+
+Blobs larger than TEXT_BLOB_MMAP_THRESHOLD are memory-mapped (from the local
+file, or the node's cached copy of a remote object) and decompressed straight
+from the mapping instead of being read into a buffer first.
+
+Documents reference their blob by key (Document.text_blob_key); the number of
+Document rows holding a key is its reference count. This module knows nothing
+about the database: utils/storage_gc.py deletes the blobs nobody references.
+"""
+
+import hashlib
+import mmap
+import os
+import zlib
+
+from app import app
+from utils.storage import StorageObjectNotFound, get_storage
+
+try:
+    import zstandard
+except ImportError:  # Optional dependency: fall back to zlib
+    zstandard = None
+
+# File extension of each codec; reads accept either, writes use the best available
+_CODEC_EXTENSIONS = {"zstd": ".zst", "zlib": ".zz"}
+_WRITE_CODEC = "zstd" if zstandard is not None else "zlib"
+# Codecs in lookup order, the one written first
+_LOOKUP_CODECS = [_WRITE_CODEC] + [codec for codec in _CODEC_EXTENSIONS if codec != _WRITE_CODEC]
+
+# Bytes handed to the compressor at a time
+_WRITE_CHUNK_SIZE = 1024 * 1024
+
+
+class TextBlobNotFound(Exception):
+    """Raised when a referenced text blob does not exist."""
+
+
+def _storage():
+    return get_storage("text_blobs")
+
+
+def _blob_name(key, codec):
+    return f"{key[:2]}/{key}{_CODEC_EXTENSIONS[codec]}"
+
+
+def _write_compressed(destination, data):
+    """Compress data into a binary file object, one chunk at a time."""
+    level = app.config["TEXT_BLOB_COMPRESSION_LEVEL"]
+    view = memoryview(data)
+    if _WRITE_CODEC == "zstd":
+        # The content size goes into the frame header, so reads allocate the
+        # output once at its final size
+        compressor = zstandard.ZstdCompressor(level=level)
+        with compressor.stream_writer(destination, size=len(data), closefd=False) as writer:
+            for start in range(0, len(data), _WRITE_CHUNK_SIZE):
+                writer.write(view[start:start + _WRITE_CHUNK_SIZE])
+        return
+    compressor = zlib.compressobj(min(level, 9))
+    for start in range(0, len(data), _WRITE_CHUNK_SIZE):
+        destination.write(compressor.compress(view[start:start + _WRITE_CHUNK_SIZE]))
+    destination.write(compressor.flush())
+
+
+def _decompress(buffer, codec):
+    """Decompress a blob from any bytes-like object (bytes or an mmap)."""
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read .zst text blobs")
+        return zstandard.ZstdDecompressor().decompress(buffer)
+    return zlib.decompress(buffer)
+
+
+def put_text(text):
+    """
+    Store an extracted text (deduplicated by content) and return its key.
+
+    Args:
+        text (str): The extracted text.
+
+    Returns:
+        str: The blob key, the SHA-256 hex digest of the UTF-8 text.
+    """
+    data = text.encode("utf-8")
+    key = hashlib.sha256(data).hexdigest()
+    if touch_blob(key):
+        # The existing blob is now out of the garbage collector's grace window
+        return key
+
+    storage = _storage()
+    name = _blob_name(key, _WRITE_CODEC)
+    with storage.open_write(name) as destination:
+        _write_compressed(destination, data)
+        compressed_size = destination.tell()
+    app.logger.info(
+        f"🗜️ Stored text blob {key[:12]}: {len(data)} -> {compressed_size} bytes ({_WRITE_CODEC})"
+    )
+    return key
+
+
+def read_text(key):
+    """
+    Read a stored text.
+
+    Args:
+        key (str): The blob key returned by put_text.
+
+    Returns:
+        str: The text.
+
+    Raises:
+        TextBlobNotFound: If no blob exists for the key.
+    """
+    storage = _storage()
+    for codec in _LOOKUP_CODECS:
+        try:
+            path = storage.local_path(_blob_name(key, codec))
+            break
+        except StorageObjectNotFound:
+            continue
+    else:
+        raise TextBlobNotFound(f"Text blob {key} not found")
+    with open(path, "rb") as blob_file:
+        size = os.fstat(blob_file.fileno()).st_size
+        if size == 0 or size < app.config["TEXT_BLOB_MMAP_THRESHOLD"]:
+            data = _decompress(blob_file.read(), codec)
+        else:
+            with mmap.mmap(blob_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                data = _decompress(mapped, codec)
+    return data.decode("utf-8")
+
+
+def blob_exists(key):
+    """Return True if a blob is stored for the key."""
+    storage = _storage()
+    return any(storage.stat(_blob_name(key, codec)) is not None for codec in _LOOKUP_CODECS)
+
+
+def touch_blob(key):
+    """
+    Refresh a blob's mtime before a new reference to it is committed.
+
+    Args:
+        key (str): The blob key.
+
+    Returns:
+        bool: False if no blob exists for the key.
+    """
+    storage = _storage()
+    return any(storage.touch(_blob_name(key, codec)) for codec in _LOOKUP_CODECS)
+
+
+def delete_blob(key):
+    """Delete the blob of a key, if any."""
+    storage = _storage()
+    for codec in _CODEC_EXTENSIONS:
+        storage.delete(_blob_name(key, codec))
+
+
+def iter_blobs():
+    """
+    List the stored blobs.
+
+    Yields:
+        Tuple[str, int, float]: The key, compressed size and mtime of each blob.
+    """
+    extensions = set(_CODEC_EXTENSIONS.values())
+    for name, size, mtime in _storage().iter_objects():
+        key, extension = os.path.splitext(name.rsplit("/", 1)[-1])
+        if extension in extensions:
+            yield key, size, mtime
+
+
+def remove_stale_temp_files(cutoff):
+    """Delete temporary files of blob writes interrupted before cutoff (a timestamp)."""
+    return _storage().remove_stale_temp_files(cutoff)
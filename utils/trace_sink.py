@@ -0,0 +1,187 @@
+"""
+@file-overview Sampled, asynchronous trace capture of OpenAI requests and responses.
+@filepath utils/trace_sink.py
+
+Replaces the fixed debug/ai_analyzer_request.txt and ai_analyzer_response.txt
+files, which every analysis rewrote synchronously and concurrent analyses
+clobbered. Each sampled analysis gets a trace id and its own JSON-lines file
+under ANALYSIS_TRACE_DIR. Records are put on a bounded in-memory queue and
+written by a single background thread, so the analysis never waits on disk;
+when the queue is full records are dropped and counted rather than blocking.
+Fields are capped at ANALYSIS_TRACE_MAX_FIELD_CHARS and the oldest trace files
+are rotated out beyond ANALYSIS_TRACE_MAX_FILES / ANALYSIS_TRACE_MAX_BYTES.
+
+Tracing is off unless ANALYSIS_TRACE_ENABLED is set; start_trace then returns
+a no-op trace and nothing is queued.
+"""
+
+import atexit
+import json
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from app import app
+
+# Check the directory caps after this many written records
+_ROTATE_EVERY = 50
+
+_queue = None
+_writer = None
+_writer_lock = threading.Lock()
+# Request threads count drops while the writer counts writes and rotations
+_stats_lock = threading.Lock()
+_stats = {"written": 0, "dropped": 0, "rotated": 0}
+
+
+def _count(name):
+    """Increment a trace counter and return its new value."""
+    with _stats_lock:
+        _stats[name] += 1
+        return _stats[name]
+
+
+class _NullTrace:
+    """Trace of an unsampled request: records nothing."""
+
+    trace_id = None
+
+    def record(self, kind, **fields):
+        pass
+
+
+NULL_TRACE = _NullTrace()
+
+
+class Trace:
+    """Trace of one sampled request, appended to <ANALYSIS_TRACE_DIR>/<trace_id>.jsonl."""
+
+    def __init__(self, trace_id, name):
+        self.trace_id = trace_id
+        self.name = name
+
+    def record(self, kind, **fields):
+        """
+        Queue one trace record without blocking.
+
+        Args:
+            kind (str): Record type, e.g. "request" or "response".
+            **fields: JSON-serializable payload; strings are truncated to
+                ANALYSIS_TRACE_MAX_FIELD_CHARS.
+        """
+        max_chars = app.config["ANALYSIS_TRACE_MAX_FIELD_CHARS"]
+        for key, value in fields.items():
+            if isinstance(value, str) and len(value) > max_chars:
+                fields[key] = f"{value[:max_chars]}…[truncated {len(value) - max_chars} chars]"
+        record = {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "kind": kind,
+            "at": datetime.now(timezone.utc).isoformat(),
+            **fields,
+        }
+        try:
+            _get_queue().put_nowait(record)
+        except queue.Full:
+            _count("dropped")
+
+
+def start_trace(name):
+    """
+    Start tracing a request, subject to ANALYSIS_TRACE_ENABLED and sampling.
+
+    Args:
+        name (str): What is being traced, e.g. "analyze_document".
+
+    Returns:
+        Trace | _NullTrace: The trace to record to (a no-op when unsampled).
+    """
+    if not app.config["ANALYSIS_TRACE_ENABLED"]:
+        return NULL_TRACE
+    if random.random() >= app.config["ANALYSIS_TRACE_SAMPLE_RATE"]:
+        return NULL_TRACE
+    # Time-ordered ids keep the trace files sorted oldest first
+    trace_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:12]}"
+    return Trace(trace_id, name)
+
+
+def _get_queue():
+    """Return the record queue, starting the writer thread on first use."""
+    global _queue, _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _queue = queue.Queue(maxsize=app.config["ANALYSIS_TRACE_QUEUE_SIZE"])
+                os.makedirs(app.config["ANALYSIS_TRACE_DIR"], exist_ok=True)
+                _writer = threading.Thread(
+                    target=_write_loop, name="trace-writer", daemon=True
+                )
+                _writer.start()
+                atexit.register(flush, 5)
+    return _queue
+
+
+def _write_loop():
+    """Append queued records to their trace files."""
+    trace_dir = app.config["ANALYSIS_TRACE_DIR"]
+    while True:
+        record = _queue.get()
+        try:
+            path = os.path.join(trace_dir, f"{record['trace_id']}.jsonl")
+            with open(path, "a", encoding="utf-8") as trace_file:
+                trace_file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            if _count("written") % _ROTATE_EVERY == 0:
+                _rotate(trace_dir)
+        except Exception as e:
+            app.logger.warning(f"⚠️ Failed to write trace record: {str(e)}")
+        finally:
+            _queue.task_done()
+
+
+def _rotate(trace_dir):
+    """Delete the oldest trace files beyond the file-count and size caps."""
+    entries = sorted(
+        (entry for entry in os.scandir(trace_dir) if entry.name.endswith(".jsonl")),
+        key=lambda entry: entry.name,
+    )
+    total_bytes = sum(entry.stat().st_size for entry in entries)
+    max_files = app.config["ANALYSIS_TRACE_MAX_FILES"]
+    max_bytes = app.config["ANALYSIS_TRACE_MAX_BYTES"]
+    remaining = len(entries)
+    for entry in entries:
+        if remaining <= max_files and total_bytes <= max_bytes:
+            break
+        total_bytes -= entry.stat().st_size
+        os.remove(entry.path)
+        remaining -= 1
+        _count("rotated")
+
+
+def flush(timeout=None):
+    """
+    Wait until every queued record has been written.
+
+    Args:
+        timeout (float): Maximum seconds to wait, None waits indefinitely.
+
+    Returns:
+        bool: True if the queue was drained.
+    """
+    if _queue is None:
+        return True
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while _queue.unfinished_tasks:
+        if deadline is not None and time.monotonic() >= deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def get_trace_stats():
+    """Return counters of written, dropped and rotated trace records/files."""
+    with _stats_lock:
+        return dict(_stats)
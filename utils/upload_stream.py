@@ -0,0 +1,202 @@
+"""
+@file-overview This module streams uploaded files to disk while validating them.
+@filepath utils/upload_stream.py
+
+Werkzeug normally spools every uploaded file into a temporary file (or memory)
+before the view runs, and the view then copies it again. StreamingUploadRequest
+replaces that spool with an UploadIngestStream that receives the multipart
+parser's fixed-size chunks directly. It hashes and counts bytes on the fly,
+verifies the PDF/DOCX magic bytes before anything is written to disk, and aborts
+the request as soon as a file is oversized or does not match its extension.
+Memory use per upload is constant.
+"""
+
+import hashlib
+import os
+import uuid
+import zipfile
+
+from flask import Request, current_app
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+
+# Leading bytes expected for each allowed extension
+FILE_SIGNATURES = {
+    "pdf": b"%PDF-",
+    "docx": b"PK\x03\x04",
+}
+
+# PDF readers accept a header anywhere in the first 1024 bytes
+SNIFF_BYTES = 1024
+
+
+def _get_extension(filename):
+    """Return the lower-cased extension of filename, or an empty string."""
+    return filename.rsplit(".", 1)[1].lower() if filename and "." in filename else ""
+
+
+class UploadIngestStream:
+    """
+    Write-through container for one uploaded file.
+
+    Data is written to a temporary ``.part`` file in the upload folder; call
+    commit() to move it to its final name. Uncommitted files are removed when
+    the stream is closed.
+    """
+
+    def __init__(self, upload_folder, filename, max_bytes):
+        """
+        Initialize the stream.
+
+        Args:
+            upload_folder (str): Directory that receives the upload.
+            filename (str): Client-supplied filename, used for the expected type.
+            max_bytes (int): Maximum accepted size of the file, None for no limit.
+        """
+        self.filename = filename
+        self.extension = _get_extension(filename)
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.path = os.path.join(upload_folder, f".{uuid.uuid4().hex}.part")
+        self._digest = hashlib.sha256()
+        self._header = b""
+        self._file = None
+        self._committed = False
+
+        if self.extension not in FILE_SIGNATURES:
+            raise UnsupportedMediaType(
+                "Invalid file type. Only PDF and DOCX files are allowed"
+            )
+
+    @property
+    def content_hash(self):
+        """SHA-256 hex digest of the bytes received so far."""
+        return self._digest.hexdigest()
+
+    def _verify_header(self):
+        """Check the sniffed header against the signature of the file's extension."""
+        signature = FILE_SIGNATURES[self.extension]
+        if self.extension == "pdf":
+            valid = signature in self._header
+        else:
+            valid = self._header.startswith(signature)
+        if not valid:
+            self._discard()
+            raise UnsupportedMediaType(
+                f"File content does not match the .{self.extension} file type"
+            )
+
+    def write(self, data):
+        """
+        Receive a chunk from the multipart parser.
+
+        Args:
+            data (bytes): The next chunk of file content.
+
+        Raises:
+            RequestEntityTooLarge: If the file exceeds max_bytes.
+            UnsupportedMediaType: If the header does not match the extension.
+        """
+        self.size += len(data)
+        if self.max_bytes is not None and self.size > self.max_bytes:
+            self._discard()
+            raise RequestEntityTooLarge(
+                f"File size must be less than {self.max_bytes // (1024 * 1024)}MB"
+            )
+        self._digest.update(data)
+
+        if self._file is None:
+            # Hold back the first bytes until the header can be verified
+            self._header += data
+            if len(self._header) < SNIFF_BYTES:
+                return len(data)
+            self._verify_header()
+            self._file = open(self.path, "wb")
+            self._file.write(self._header)
+            self._header = b""
+            return len(data)
+
+        self._file.write(data)
+        return len(data)
+
+    def seek(self, offset, whence=0):
+        """Called by the parser once the part is complete: flush small files too."""
+        if self._file is None and not self._committed:
+            self._verify_header()
+            self._file = open(self.path, "wb")
+            self._file.write(self._header)
+        if self._file is not None:
+            self._file.flush()
+        return offset
+
+    def read(self, size=-1):
+        """Read back the received content (for compatibility with FileStorage)."""
+        with open(self.path, "rb") as file:
+            return file.read(size)
+
+    def commit(self, save_path):
+        """
+        Move the received file to its final location.
+
+        DOCX uploads are additionally checked to be Word packages.
+
+        Args:
+            save_path (str): Final path of the file.
+
+        Raises:
+            UnsupportedMediaType: If a .docx upload is not a Word document.
+        """
+        self.seek(0)
+        self._file.close()
+        self._file = None
+
+        if self.extension == "docx":
+            try:
+                with zipfile.ZipFile(self.path) as package:
+                    is_word = "word/document.xml" in package.namelist()
+            except zipfile.BadZipFile:
+                is_word = False
+            if not is_word:
+                self._discard()
+                raise UnsupportedMediaType("File content does not match the .docx file type")
+
+        os.replace(self.path, save_path)
+        self.path = save_path
+        self._committed = True
+
+    def _discard(self):
+        """Close and delete the temporary file."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if not self._committed and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def close(self):
+        """Release the stream, deleting the temporary file unless committed."""
+        self._discard()
+
+
+class StreamingUploadRequest(Request):
+    """Request class that streams uploaded files through UploadIngestStream."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if not filename:
+            # Empty file input: let the view report that no file was selected
+            return super()._get_file_stream(
+                total_content_length, content_type, filename, content_length
+            )
+        stream = UploadIngestStream(
+            current_app.config["UPLOAD_FOLDER"],
+            filename,
+            current_app.config["MAX_CONTENT_LENGTH"],
+        )
+        if not hasattr(self, "_ingest_streams"):
+            self._ingest_streams = []
+        self._ingest_streams.append(stream)
+        return stream
+
+    def close(self):
+        # Also clean up streams of a form that failed to parse completely
+        for stream in getattr(self, "_ingest_streams", []):
+            stream.close()
+        super().close()
@@ -16,7 +16,13 @@ env_path = os.path.join(project_dir, '.env')
 load_dotenv(env_path)
 
 # Import Flask application
-from app import app as application
+from app import app, create_app, start_background_services
+
+application = create_app()
+
+# Preforking servers start these in each worker instead (gunicorn.conf.py)
+if app.config["START_BACKGROUND_SERVICES"]:
+    start_background_services()
 
 if __name__ == "__main__":
     application.run()